@@ -10,8 +10,9 @@ import logging
 from dotenv import load_dotenv
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from models import Base
+from utils.storage import engine_options, configure_engine, DEFAULT_DATABASE_URL
 
 # Load environment variables
 load_dotenv()
@@ -23,12 +24,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class Base(DeclarativeBase):
-    pass
-
 # Create extension
 db = SQLAlchemy(model_class=Base)
 
+# The models subclass the plain Base (so the worker can use them without
+# Flask); give them the Flask-SQLAlchemy query interface (Rule.query, get_or_404)
+for _attr in ('query', 'query_class', '__fsa__'):
+    setattr(Base, _attr, db.Model.__dict__[_attr])
+
 # Create Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev_key_for_testing")
@@ -40,12 +43,10 @@ app.wsgi_app = ProxyFix(
 
 # Configure database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
-    "DATABASE_URL", "sqlite:///instance/email_autoresponder.db"
+    "DATABASE_URL", DEFAULT_DATABASE_URL
 )
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_pre_ping": True,
-    "pool_recycle": 300,
-}
+# Per-backend engine settings (SQLite WAL/busy_timeout, Postgres pool sizing)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 
 # Configure bootstrap template
 app.config["BOOTSTRAP_SERVE_LOCAL"] = True
@@ -55,13 +56,17 @@ db.init_app(app)
 
 # Register routes
 with app.app_context():
-    # Import models here to avoid circular imports
-    import models  # noqa: F401
     from routes import register_routes
 
-    # Create tables
+    # Apply the per-connection settings before the first connection is made
+    configure_engine(db.engine)
+
+    # Create tables, then apply schema changes to existing ones
     db.create_all()
 
+    from utils.migrations import run_migrations
+    run_migrations(db.engine)
+
     # Register routes
     register_routes(app)
 
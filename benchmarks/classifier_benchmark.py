@@ -0,0 +1,364 @@
+"""
+Benchmark do Classificador de E-mails
+
+Este módulo avalia o pipeline de classificação sobre um corpus rotulado
+local: validação cruzada k-fold paralela, varredura de hiperparâmetros
+(max_features e ngram_range), tempo de treinamento, vazão de predição em
+diferentes tamanhos de lote e tamanho do modelo em disco e em memória.
+O resultado é gravado em um relatório JSON comparável entre versões.
+
+Uso:
+    python -m benchmarks.classifier_benchmark --corpus data/corpus.csv
+    python -m benchmarks.classifier_benchmark --corpus models/training_examples.pkl \\
+        --label v1.2 --baseline reports/classifier-v1.1.json
+"""
+
+import os
+import csv
+import json
+import time
+import pickle
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import joblib
+import sklearn
+from sklearn.model_selection import StratifiedKFold, cross_validate, GridSearchCV
+
+from utils.ml_classifier import build_pipeline
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Grade padrão da varredura de hiperparâmetros
+DEFAULT_PARAM_GRID = {
+    'vectorizer__max_features': [1000, 5000, 20000],
+    'vectorizer__ngram_range': [(1, 1), (1, 2)],
+}
+
+# Tamanhos de lote usados na medição de vazão de predição
+DEFAULT_BATCH_SIZES = [1, 10, 100, 1000]
+
+# Métricas comparadas com o relatório de referência (caminho, maior é melhor)
+COMPARED_METRICS = [
+    (('cross_validation', 'accuracy_mean'), True),
+    (('cross_validation', 'f1_macro_mean'), True),
+    (('fit', 'seconds_median'), False),
+    (('model_size', 'disk_bytes'), False),
+    (('model_size', 'memory_bytes'), False),
+]
+
+
+def load_corpus(path):
+    """
+    Carrega um corpus rotulado.
+
+    Formatos aceitos:
+        - CSV com colunas ``text`` e ``label``
+        - JSON Lines com objetos ``{"text": ..., "label": ...}``
+        - O arquivo ``training_examples.pkl`` gerado pelo classificador
+
+    Args:
+        path (str): Caminho do corpus
+
+    Returns:
+        tuple: (lista de textos, lista de rótulos)
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.pkl':
+        with open(path, 'rb') as f:
+            examples = pickle.load(f)
+        return list(examples['texts']), list(examples['labels'])
+
+    texts, labels = [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        if extension == '.csv':
+            for row in csv.DictReader(f):
+                texts.append(row['text'])
+                labels.append(row['label'])
+        else:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    texts.append(record['text'])
+                    labels.append(record['label'])
+
+    return texts, labels
+
+
+def _effective_folds(labels, folds):
+    """Limita o número de folds à menor quantidade de exemplos por classe."""
+    _, counts = np.unique(labels, return_counts=True)
+    return max(2, min(folds, int(counts.min())))
+
+
+def run_cross_validation(texts, labels, folds, n_jobs):
+    """
+    Executa validação cruzada k-fold estratificada em paralelo.
+
+    Returns:
+        dict: Médias e desvios de acurácia, F1 e tempos por fold
+    """
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    scores = cross_validate(
+        build_pipeline(), texts, labels, cv=cv, n_jobs=n_jobs,
+        scoring=['accuracy', 'f1_macro']
+    )
+
+    return {
+        'folds': folds,
+        'accuracy_mean': float(np.mean(scores['test_accuracy'])),
+        'accuracy_std': float(np.std(scores['test_accuracy'])),
+        'f1_macro_mean': float(np.mean(scores['test_f1_macro'])),
+        'f1_macro_std': float(np.std(scores['test_f1_macro'])),
+        'fit_seconds_mean': float(np.mean(scores['fit_time'])),
+        'score_seconds_mean': float(np.mean(scores['score_time'])),
+    }
+
+
+def run_sweep(texts, labels, folds, n_jobs, param_grid=None):
+    """
+    Executa a varredura de hiperparâmetros com validação cruzada.
+
+    Returns:
+        dict: Melhor combinação e resultado de cada combinação testada
+    """
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    search = GridSearchCV(
+        build_pipeline(), param_grid or DEFAULT_PARAM_GRID, cv=cv,
+        n_jobs=n_jobs, scoring='accuracy'
+    )
+    search.fit(texts, labels)
+
+    results = search.cv_results_
+    combinations = [
+        {
+            'params': {name: list(value) if isinstance(value, tuple) else value
+                       for name, value in params.items()},
+            'accuracy_mean': float(results['mean_test_score'][i]),
+            'accuracy_std': float(results['std_test_score'][i]),
+            'fit_seconds_mean': float(results['mean_fit_time'][i]),
+        }
+        for i, params in enumerate(results['params'])
+    ]
+
+    return {
+        'best_params': combinations[int(search.best_index_)]['params'],
+        'best_accuracy': float(search.best_score_),
+        'results': combinations,
+    }
+
+
+def measure_fit(texts, labels, repeats):
+    """
+    Mede o tempo de treinamento do pipeline padrão sobre o corpus inteiro.
+
+    Returns:
+        tuple: (pipeline treinado, dict com os tempos medidos)
+    """
+    durations = []
+    model = None
+    for _ in range(repeats):
+        model = build_pipeline()
+        started = time.perf_counter()
+        model.fit(texts, labels)
+        durations.append(time.perf_counter() - started)
+
+    return model, {
+        'repeats': repeats,
+        'seconds_median': float(np.median(durations)),
+        'seconds_min': float(np.min(durations)),
+    }
+
+
+def measure_predict_throughput(model, texts, batch_sizes, min_seconds=0.5):
+    """
+    Mede latência e vazão de ``predict_proba`` para cada tamanho de lote.
+
+    Returns:
+        list: Um dict por tamanho de lote
+    """
+    results = []
+    for batch_size in batch_sizes:
+        # Repetir o corpus se ele for menor que o lote
+        batch = [texts[i % len(texts)] for i in range(batch_size)]
+        latencies = []
+        started = time.perf_counter()
+
+        while time.perf_counter() - started < min_seconds or len(latencies) < 3:
+            call_started = time.perf_counter()
+            model.predict_proba(batch)
+            latencies.append(time.perf_counter() - call_started)
+
+        total = sum(latencies)
+        results.append({
+            'batch_size': batch_size,
+            'calls': len(latencies),
+            'latency_ms_p50': float(np.percentile(latencies, 50) * 1000),
+            'latency_ms_p95': float(np.percentile(latencies, 95) * 1000),
+            'emails_per_second': float(batch_size * len(latencies) / total),
+        })
+
+    return results
+
+
+def measure_model_size(model):
+    """
+    Mede o tamanho do modelo serializado e o custo em memória de carregá-lo.
+
+    Returns:
+        dict: Bytes em disco e bytes alocados pelo carregamento
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.pkl')
+        joblib.dump({'model': model}, path)
+        disk_bytes = os.path.getsize(path)
+
+        tracemalloc.start()
+        loaded = joblib.load(path)
+        memory_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del loaded
+
+    return {'disk_bytes': disk_bytes, 'memory_bytes': memory_bytes}
+
+
+def compare_reports(report, baseline):
+    """
+    Compara as métricas principais com um relatório de referência.
+
+    Returns:
+        list: Um dict por métrica com valores atual, de referência e variação
+    """
+    comparison = []
+    for path, higher_is_better in COMPARED_METRICS:
+        current, previous = report, baseline
+        for key in path:
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+
+        if current is None or previous is None:
+            continue
+
+        change = (current - previous) / previous if previous else None
+        comparison.append({
+            'metric': '.'.join(path),
+            'current': current,
+            'baseline': previous,
+            'relative_change': change,
+            'higher_is_better': higher_is_better,
+        })
+
+    return comparison
+
+
+def run_benchmark(texts, labels, folds=5, n_jobs=-1, batch_sizes=None, fit_repeats=3,
+                  param_grid=None, skip_sweep=False):
+    """
+    Executa todas as medições e monta o relatório.
+
+    Args:
+        texts (list): Textos do corpus
+        labels (list): Rótulos do corpus
+        folds (int): Número de folds da validação cruzada
+        n_jobs (int): Processos usados na validação cruzada e na varredura
+        batch_sizes (list): Tamanhos de lote da medição de vazão
+        fit_repeats (int): Repetições da medição de tempo de treinamento
+        param_grid (dict): Grade da varredura (padrão: DEFAULT_PARAM_GRID)
+        skip_sweep (bool): Se True, não executa a varredura de hiperparâmetros
+
+    Returns:
+        dict: Relatório serializável em JSON
+    """
+    folds = _effective_folds(labels, folds)
+
+    logger.info(f"Validação cruzada com {folds} folds sobre {len(texts)} exemplos")
+    cross_validation = run_cross_validation(texts, labels, folds, n_jobs)
+
+    sweep = None
+    if not skip_sweep:
+        logger.info("Executando varredura de hiperparâmetros")
+        sweep = run_sweep(texts, labels, folds, n_jobs, param_grid)
+
+    logger.info("Medindo tempo de treinamento, vazão e tamanho do modelo")
+    model, fit = measure_fit(texts, labels, fit_repeats)
+
+    return {
+        'cross_validation': cross_validation,
+        'sweep': sweep,
+        'fit': fit,
+        'predict': measure_predict_throughput(model, texts, batch_sizes or DEFAULT_BATCH_SIZES),
+        'model_size': measure_model_size(model),
+    }
+
+
+def main():
+    """Ponto de entrada da linha de comando."""
+    parser = argparse.ArgumentParser(description="Benchmark do classificador de e-mails")
+    parser.add_argument('--corpus', required=True,
+                        help="Corpus rotulado (.csv, .jsonl ou training_examples.pkl)")
+    parser.add_argument('--output', help="Arquivo JSON do relatório (padrão: reports/classifier-<data>.json)")
+    parser.add_argument('--label', default=None, help="Identificador da versão avaliada (ex.: v1.2)")
+    parser.add_argument('--baseline', help="Relatório anterior para comparação")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=-1, help="Processos paralelos (-1 = todos os núcleos)")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--fit-repeats', type=int, default=3)
+    parser.add_argument('--skip-sweep', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    texts, labels = load_corpus(args.corpus)
+    if len(set(labels)) < 2:
+        logger.error("O corpus precisa de pelo menos duas classes")
+        return 1
+
+    started = datetime.now()
+    report = {
+        'metadata': {
+            'label': args.label,
+            'timestamp': started.isoformat(),
+            'corpus': os.path.abspath(args.corpus),
+            'samples': len(texts),
+            'classes': len(set(labels)),
+            'python': platform.python_version(),
+            'sklearn': sklearn.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+    }
+    report.update(run_benchmark(
+        texts, labels, folds=args.folds, n_jobs=args.jobs, batch_sizes=args.batch_sizes,
+        fit_repeats=args.fit_repeats, skip_sweep=args.skip_sweep
+    ))
+    report['metadata']['duration_seconds'] = (datetime.now() - started).total_seconds()
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report['comparison'] = compare_reports(report, json.load(f))
+
+    output = args.output or os.path.join('reports', f"classifier-{started.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    cv = report['cross_validation']
+    logger.info(f"Acurácia {cv['accuracy_mean']:.3f} ± {cv['accuracy_std']:.3f}; relatório salvo em {output}")
+    for item in report.get('comparison', []):
+        change = item['relative_change']
+        change_text = f"{change:+.1%}" if change is not None else "n/a"
+        logger.info(f"{item['metric']}: {item['baseline']} -> {item['current']} ({change_text})")
+
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,265 @@
+"""
+Benchmark de Escrita Concorrente no Banco de Dados
+
+Este módulo simula a carga real sobre o banco: o gravador de logs do
+processamento (lotes de EmailLog + agregados), a interface web alterando
+regras (transações pequenas) e leitores paginando ``/logs``, todos ao mesmo
+tempo. Para cada papel são medidos vazão, latências e erros de bloqueio
+("database is locked"). O resultado é gravado em um relatório JSON.
+
+Sem ``--database-url``, o benchmark compara, em arquivos SQLite temporários,
+as configurações padrão do driver com o perfil de ``utils.storage``.
+
+Uso:
+    python -m benchmarks.storage_benchmark --duration 20
+    python -m benchmarks.storage_benchmark --database-url postgresql://... --profile tuned
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, update, select
+from sqlalchemy.exc import OperationalError
+
+from models import Base, EmailLog, Rule
+from utils.rollups import apply_rollups
+from utils.storage import create_storage_engine
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Perfis comparados
+PROFILES = ('default', 'tuned')
+
+
+def _percentile(values, fraction):
+    """Percentil de uma lista de valores (None se vazia)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[int(fraction * (len(ordered) - 1))]
+
+
+def _is_lock_error(error):
+    """Indica se o erro é de banco bloqueado/ocupado."""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class RoleStats:
+    """
+    Resultados de um papel da simulação (gravador, web, leitor).
+    """
+
+    def __init__(self):
+        """Inicializa os contadores zerados."""
+        self.lock = threading.Lock()
+        self.operations = 0
+        self.rows = 0
+        self.lock_errors = 0
+        self.other_errors = 0
+        self.latencies = []
+
+    def record(self, started, rows=0, error=None):
+        """Registra o resultado de uma operação."""
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            if error is None:
+                self.operations += 1
+                self.rows += rows
+                self.latencies.append(elapsed)
+            elif _is_lock_error(error):
+                self.lock_errors += 1
+            else:
+                self.other_errors += 1
+
+    def report(self, duration):
+        """Resumo dos resultados."""
+        return {
+            'operations': self.operations,
+            'operations_per_second': self.operations / duration,
+            'rows_per_second': self.rows / duration,
+            'lock_errors': self.lock_errors,
+            'other_errors': self.other_errors,
+            'latency_p50_ms': (_percentile(self.latencies, 0.50) or 0) * 1000,
+            'latency_p95_ms': (_percentile(self.latencies, 0.95) or 0) * 1000,
+            'latency_max_ms': (max(self.latencies) if self.latencies else 0) * 1000,
+        }
+
+
+def _log_writer(engine, stats, stop, batch_size):
+    """Simula o gravador de logs: lotes de EmailLog e agregados por transação."""
+    while not stop.is_set():
+        batch = [{
+            'sender': f"cliente{random.randint(1, 500)}@exemplo.com",
+            'subject': 'Solicitação de orçamento',
+            'matched_rule': random.choice(['orçamento', 'suporte', None]),
+            'response_sent': random.random() > 0.05,
+            'processed_at': datetime.utcnow(),
+        } for _ in range(batch_size)]
+
+        started = time.perf_counter()
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(EmailLog.__table__), batch)
+                apply_rollups(connection, batch)
+            stats.record(started, rows=len(batch))
+        except OperationalError as e:
+            stats.record(started, error=e)
+
+
+def _web_writer(engine, stats, stop, rule_ids, pause):
+    """Simula a interface web: edições de regras em transações pequenas."""
+    rule = Rule.__table__
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            with engine.begin() as connection:
+                connection.execute(
+                    update(rule).where(rule.c.id == random.choice(rule_ids))
+                    .values(response=f"Resposta atualizada {random.random()}", updated_at=datetime.utcnow())
+                )
+            stats.record(started, rows=1)
+        except OperationalError as e:
+            stats.record(started, error=e)
+        stop.wait(pause)
+
+
+def _reader(engine, stats, stop, pause):
+    """Simula a página /logs: primeira página da paginação por chave."""
+    log = EmailLog.__table__
+    query = select(log).order_by(log.c.processed_at.desc(), log.c.id.desc()).limit(50)
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                rows = connection.execute(query).all()
+            stats.record(started, rows=len(rows))
+        except OperationalError as e:
+            stats.record(started, error=e)
+        stop.wait(pause)
+
+
+def run_profile(url, profile, duration=10.0, log_writers=1, web_writers=4, readers=4,
+                batch_size=50, web_pause=0.01, read_pause=0.01):
+    """
+    Executa a simulação com um perfil de armazenamento.
+
+    Args:
+        url (str): URL do banco de dados
+        profile (str): 'default' (opções padrão do driver) ou 'tuned' (utils.storage)
+        duration (float): Duração da simulação, em segundos
+        log_writers (int): Threads simulando o gravador de logs
+        web_writers (int): Threads simulando edições pela interface web
+        readers (int): Threads simulando leituras de /logs
+        batch_size (int): Logs por transação do gravador
+        web_pause (float): Pausa entre edições de cada thread web, em segundos
+        read_pause (float): Pausa entre leituras de cada leitor, em segundos
+
+    Returns:
+        dict: Resultados por papel
+    """
+    if profile == 'tuned':
+        engine = create_storage_engine(url, pool_size=log_writers + web_writers + readers)
+    else:
+        engine = create_engine(url, pool_size=log_writers + web_writers + readers)
+
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Rule.__table__), [
+            {'keyword': f"regra-{profile}-{idx}", 'response': 'Resposta', 'is_active': True,
+             'created_at': datetime.utcnow(), 'updated_at': datetime.utcnow()}
+            for idx in range(20)
+        ])
+        rule_ids = connection.execute(select(Rule.__table__.c.id)).scalars().all()
+
+    roles = {'log_writer': RoleStats(), 'web_writer': RoleStats(), 'reader': RoleStats()}
+    stop = threading.Event()
+    threads = (
+        [threading.Thread(target=_log_writer, args=(engine, roles['log_writer'], stop, batch_size))
+         for _ in range(log_writers)]
+        + [threading.Thread(target=_web_writer, args=(engine, roles['web_writer'], stop, rule_ids, web_pause))
+           for _ in range(web_writers)]
+        + [threading.Thread(target=_reader, args=(engine, roles['reader'], stop, read_pause))
+           for _ in range(readers)]
+    )
+
+    logger.info(f"Perfil {profile}: {len(threads)} threads por {duration:.0f}s")
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with engine.connect() as connection:
+        journal_mode = (connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+                        if engine.dialect.name == 'sqlite' else None)
+    engine.dispose()
+
+    return {
+        'profile': profile,
+        'journal_mode': journal_mode,
+        'duration_seconds': elapsed,
+        'roles': {name: stats.report(elapsed) for name, stats in roles.items()},
+    }
+
+
+def main():
+    """Ponto de entrada da linha de comando."""
+    parser = argparse.ArgumentParser(description="Benchmark de escrita concorrente no banco de dados")
+    parser.add_argument('--database-url', help="Banco a usar (padrão: arquivos SQLite temporários)")
+    parser.add_argument('--profile', choices=PROFILES, action='append',
+                        help="Perfil a executar (pode repetir; padrão: ambos)")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--log-writers', type=int, default=1)
+    parser.add_argument('--web-writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--output', help="Arquivo do relatório JSON (padrão: saída padrão)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for profile in args.profile or PROFILES:
+            url = args.database_url or f"sqlite:///{os.path.join(tmp_dir, f'benchmark-{profile}.db')}"
+            results.append(run_profile(
+                url, profile, duration=args.duration, log_writers=args.log_writers,
+                web_writers=args.web_writers, readers=args.readers, batch_size=args.batch_size
+            ))
+
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'database': args.database_url or 'sqlite (temporário)',
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    for result in results:
+        summary = ', '.join(
+            f"{name}: {role['operations_per_second']:.1f} op/s, {role['lock_errors']} bloqueios"
+            for name, role in result['roles'].items()
+        )
+        print(f"[{result['profile']}] {summary}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
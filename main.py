@@ -5,17 +5,43 @@ Automated Email Response System - Main Module
 This script connects to an email inbox, reads unread emails, 
 and automatically responds based on predefined rules.
 It can be run standalone or as part of the Flask web application.
+
+Importing this module does not build the Flask app: the web app's database
+engine is only looked up when no engine was set with ``use_engine`` (the
+standalone worker sets its own), and ``main.app`` is loaded on first access
+for ``gunicorn main:app``.
 """
 
 import os
+import time
 import logging
+import threading
 import re
 from dotenv import load_dotenv
-from utils.email_handler import EmailHandler
-from regras_email import gerar_resposta_assistente, REGRAS
-
-# Import Flask app for use with Gunicorn
-from app import app
+from collections import Counter
+from datetime import datetime, timedelta
+from utils.email_handler import EmailHandler, CABECALHOS_TRIAGEM
+from utils.cascade import ResponseCascade, load_classifier
+from utils.log_writer import EmailLogWriter
+from utils.reply_index import ReplyIndex, message_key
+from utils.metrics import metrics
+from utils.pipeline import Pipeline, Stage
+from utils.scheduler import EmailScheduler, adaptive_interval_from_env
+from utils.stats import (
+    StatsPublisher, record_email, CYCLE_DURATION, EMAILS_DUPLICATES, EMAILS_SUPPRESSED, DEFAULT_STATS_FILE,
+    EMAILS_HEADER_SKIPPED, EMAILS_HEADER_DECIDED, FETCH_BYTES_SAVED
+)
+from utils.rate_limiter import SendRateLimiter
+from utils.outbox import OutboxSender, enqueue
+from utils.prefilter import Prefilter, load_rules
+from utils.throttle import ReplyThrottle
+from utils.catchup import CatchupCheckpoint, plan_chunks, BACKLOG_METRIC, DEFAULT_CHECKPOINT_FILE
+from utils.rollups import sent_since
+from utils.lease import Lease
+from regras_email import REGRAS, regras_pelo_assunto
+from models import Rule, get_rules_version
+from sqlalchemy import select
+from sqlalchemy.orm import Session
 
 # Configure logging
 logging.basicConfig(
@@ -27,30 +53,482 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-def process_emails():
-    """Process unread emails and send automated responses"""
+def __getattr__(name):
+    """Load the Flask app on first access (``gunicorn main:app``)."""
+    if name == 'app':
+        from app import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Database engine used by the processing (the Flask app's unless set with use_engine)
+_engine = None
+
+def use_engine(engine):
+    """Make the processing use this engine instead of the Flask app's.
     
-    # Get email configuration from environment variables
+    Args:
+        engine: SQLAlchemy engine
+    """
+    global _engine
+    _engine = engine
+
+def get_engine():
+    """Return the processing database engine, defaulting to the Flask app's."""
+    global _engine
+    
+    if _engine is None:
+        from app import app, db
+        with app.app_context():
+            _engine = db.engine
+    
+    return _engine
+
+# Response cascade (keyword rules first, ML classifier for the leftovers),
+# built on first use so the optional ML dependencies are only loaded when enabled
+_cascade = None
+
+def get_cascade():
+    """Return the process-wide response cascade, creating it if needed."""
+    global _cascade
+    
+    if _cascade is None:
+        classifier = None
+        if os.getenv("USE_ML_MODEL", "False").lower() in ("true", "1", "t"):
+            classifier = load_classifier(
+                model_file=os.getenv("MODEL_FILE", "models/email_classifier.pkl"),
+                threshold=float(os.getenv("ML_THRESHOLD", 0.6)),
+                feature_cache_dir=os.getenv("FEATURE_CACHE_DIR", "models/feature_cache") or None,
+                feature_cache_max_bytes=int(float(os.getenv("FEATURE_CACHE_MAX_MB", 64)) * 1024 * 1024),
+                feature_cache_max_age_days=float(os.getenv("FEATURE_CACHE_MAX_AGE_DAYS", 30))
+            )
+        
+        _cascade = ResponseCascade(
+            classifier=classifier,
+            latency_budget=float(os.getenv("ML_LATENCY_BUDGET", 2.0)),
+            batch_size=int(os.getenv("ML_BATCH_SIZE", 32))
+        )
+    
+    return _cascade
+
+# Background writer that batches EmailLog inserts, created on first use
+_log_writer = None
+
+def get_log_writer():
+    """Return the process-wide EmailLog writer, creating it if needed."""
+    global _log_writer
+    
+    if _log_writer is None:
+        _log_writer = EmailLogWriter(
+            get_engine(),
+            batch_size=int(os.getenv("LOG_BATCH_SIZE", 100)),
+            flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", 1.0)),
+            max_queue=int(os.getenv("LOG_QUEUE_SIZE", 10000))
+        )
+    
+    return _log_writer
+
+# Index of already-answered messages (duplicate-reply guard), created on first use
+_reply_index = None
+
+def get_reply_index():
+    """Return the process-wide responded-message index, creating it if needed."""
+    global _reply_index
+    
+    if _reply_index is None:
+        _reply_index = ReplyIndex(
+            get_engine(),
+            ttl_days=float(os.getenv("REPLY_INDEX_TTL_DAYS", 30)),
+            lru_size=int(os.getenv("REPLY_INDEX_LRU_SIZE", 10000)),
+            bloom_capacity=int(os.getenv("REPLY_INDEX_BLOOM_CAPACITY", 100000))
+        )
+    
+    return _reply_index
+
+# Per-sender suppression window for repeated auto-replies, created on first use
+_reply_throttle = None
+
+def get_reply_throttle():
+    """Return the process-wide per-sender reply throttle, creating it if needed."""
+    global _reply_throttle
+    
+    if _reply_throttle is None:
+        _reply_throttle = ReplyThrottle(
+            get_engine(),
+            window_seconds=float(os.getenv("THROTTLE_WINDOW_SECONDS", 3600)),
+            scope=os.getenv("THROTTLE_SCOPE", "sender").lower(),
+            cache_size=int(os.getenv("THROTTLE_CACHE_SIZE", 10000))
+        )
+    
+    return _reply_throttle
+
+# Outbound send limits per email account, created on first use
+_rate_limiters = {}
+
+def get_rate_limiter(account):
+    """Return the send rate limiter of an email account, creating it if needed.
+    
+    A new limiter starts with the daily budget already reduced by the replies
+    sent in the last 24 hours (from the hourly rollups), so restarts and
+    one-shot cron runs share the same daily quota.
+    
+    Args:
+        account (str): Email account that sends the replies
+    """
+    if account not in _rate_limiters:
+        limiter = SendRateLimiter(
+            account,
+            per_minute=int(os.getenv("SMTP_MAX_PER_MINUTE", 20)),
+            per_day=int(os.getenv("SMTP_MAX_PER_DAY", 500)),
+            max_wait=float(os.getenv("SMTP_RATE_MAX_WAIT", 120))
+        )
+        
+        try:
+            with get_engine().connect() as connection:
+                limiter.record_sent(sent_since(connection, datetime.utcnow() - timedelta(days=1)))
+        except Exception as e:
+            logger.warning(f"Could not load recent send counts for {account}: {str(e)}")
+        
+        _rate_limiters[account] = limiter
+    
+    return _rate_limiters[account]
+
+def email_settings():
+    """Read the email account settings from the environment.
+    
+    Returns:
+        dict: EmailHandler keyword arguments, or None if the credentials are missing
+    """
     email_usuario = os.getenv("EMAIL_USUARIO")
     email_senha = os.getenv("EMAIL_SENHA")
-    servidor_imap = os.getenv("SERVIDOR_IMAP", "imap.gmail.com")
-    servidor_smtp = os.getenv("SERVIDOR_SMTP", "smtp.gmail.com")
-    porta_smtp = int(os.getenv("PORTA_SMTP", 587))
+    if not all([email_usuario, email_senha]):
+        return None
+    
+    return {
+        'email_usuario': email_usuario,
+        'email_senha': email_senha,
+        'servidor_imap': os.getenv("SERVIDOR_IMAP", "imap.gmail.com"),
+        'servidor_smtp': os.getenv("SERVIDOR_SMTP", "smtp.gmail.com"),
+        'porta_smtp': int(os.getenv("PORTA_SMTP", 587)),
+    }
+
+# Sender that drains the persistent outbox, created on first use
+_outbox_sender = None
+
+def get_outbox_sender():
+    """Return the process-wide outbox sender, creating it if needed.
+    
+    Returns:
+        OutboxSender: The sender, or None if the email credentials are missing
+    """
+    global _outbox_sender
+    
+    if _outbox_sender is None:
+        settings = email_settings()
+        if settings is None:
+            return None
+        
+        # Sending only uses SMTP (one connection per reply), so no IMAP login is needed
+        email_handler = EmailHandler(**settings)
+        _outbox_sender = OutboxSender(
+            get_engine(),
+            send=email_handler.enviar_resposta_email,
+            rate_limiter=get_rate_limiter(settings['email_usuario']),
+            log_writer=get_log_writer(),
+            on_final=record_email,
+            batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", 20)),
+            workers=int(os.getenv("OUTBOX_SEND_WORKERS", os.getenv("PIPELINE_SEND_WORKERS", 4))),
+            max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5)),
+            backoff_seconds=float(os.getenv("OUTBOX_BACKOFF_SECONDS", 60)),
+            max_backoff_seconds=float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", 3600)),
+            sending_timeout=float(os.getenv("OUTBOX_SENDING_TIMEOUT", 300)),
+            poll_interval=float(os.getenv("OUTBOX_POLL_INTERVAL", 30))
+        )
+    
+    return _outbox_sender
+
+# Header-based filter that drops bounces, auto-replies and bulk mail, created on first use
+_prefilter = None
+
+def get_prefilter():
+    """Return the process-wide header prefilter, creating it if needed."""
+    global _prefilter
+    
+    if _prefilter is None:
+        _prefilter = Prefilter(
+            rules=load_rules(os.getenv("PREFILTER_RULES_FILE", "data/prefilter_rules.json")),
+            own_addresses=[os.getenv("EMAIL_USUARIO")]
+        )
+    
+    return _prefilter
+
+# Persisted progress through the unread backlog, loaded on first use
+_catchup_checkpoint = None
+
+def get_catchup_checkpoint():
+    """Return the process-wide catch-up checkpoint, loading it if needed."""
+    global _catchup_checkpoint
+    
+    if _catchup_checkpoint is None:
+        _catchup_checkpoint = CatchupCheckpoint(os.getenv("CATCHUP_CHECKPOINT_FILE", DEFAULT_CHECKPOINT_FILE))
+    
+    return _catchup_checkpoint
+
+# Publishes the in-memory processing statistics for /api/stats, created on first use
+_stats_publisher = None
+
+def get_stats_publisher():
+    """Return the process-wide statistics publisher, creating it if needed."""
+    global _stats_publisher
+    
+    if _stats_publisher is None:
+        _stats_publisher = StatsPublisher(
+            path=os.getenv("STATS_FILE", DEFAULT_STATS_FILE),
+            interval=float(os.getenv("STATS_PERSIST_INTERVAL", 30))
+        )
+    
+    return _stats_publisher
+
+def triage_headers(email_handler, uids, prefilter, completed):
+    """Phase one of the two-phase fetch: decide what needs a body download.
+    
+    The size and a few header fields of the whole chunk are fetched in one
+    IMAP command (without marking the emails read). Emails caught by the
+    prefilter are skipped and flagged read right away, the state the full
+    download leaves them in with single-phase fetching. An email is answered
+    from its headers only when its body cannot change the reply: the subject
+    matches exactly one rule and every rule it does not match is subject-only
+    (see regras_pelo_assunto). It also needs a Message-ID, since the
+    duplicate guard of body-less emails cannot hash the content.
+    
+    Args:
+        email_handler (EmailHandler): Connected email handler
+        uids (list): UIDs of the chunk
+        prefilter (Prefilter): Header prefilter (None = skip nothing)
+        completed (list): Receives the UIDs of the skipped emails
+    
+    Returns:
+        list: Pipeline items (uid, header data or None to fetch the full email)
+    """
+    fields = CABECALHOS_TRIAGEM + (prefilter.header_names if prefilter is not None else ())
+    headers = email_handler.buscar_cabecalhos(uids, fields)
+    items = []
+    skipped = []
+    
+    for uid in uids:
+        if uid not in headers:
+            items.append((uid, None))
+            continue
+        
+        raw_headers, size = headers[uid]
+        email_data = email_handler.analisar_cabecalhos(raw_headers)
+        if email_data is None:
+            items.append((uid, None))
+            continue
+        saved = max(0, (size or 0) - len(raw_headers))
+        
+        rule = prefilter.check(email_data) if prefilter is not None else None
+        if rule:
+            logger.info(f"Skipping email from {email_data['remetente']} (prefilter: {rule})")
+            metrics.incr(EMAILS_HEADER_SKIPPED)
+            metrics.incr(FETCH_BYTES_SAVED, saved)
+            skipped.append(uid)
+        elif email_data['message_id'] and len(regras_pelo_assunto(email_data['assunto']) or ()) == 1:
+            metrics.incr(EMAILS_HEADER_DECIDED)
+            metrics.incr(FETCH_BYTES_SAVED, saved)
+            items.append((uid, email_data))
+        else:
+            items.append((uid, None))
+    
+    # Filtered emails are never downloaded, so flag them read here
+    email_handler.marcar_lidos(skipped)
+    completed.extend(skipped)
+    return items
+
+def build_pipeline(email_handler, reply_index, num_mensagens=0, completed=None, deadline=None,
+                   prefilter=None, throttle=None, stop_event=None):
+    """Build the fetch → prefilter → parse → match → enqueue pipeline for one cycle.
+    
+    Replies are not sent here: they are written to the persistent outbox,
+    which the outbox sender drains with retries, so a cycle never waits on
+    (or loses replies to) an unavailable SMTP server. A sender already
+    answered inside the throttle window gets no new reply; the email is
+    logged as suppressed instead.
+    
+    Fetching shares the handler's single IMAP connection, so that stage always
+    runs one worker; the other pools are sized by the PIPELINE_* settings.
+    Each input item is (uid, header data); emails already decided from their
+    headers skip the body download.
+    
+    Args:
+        email_handler (EmailHandler): Connected email handler
+        reply_index (ReplyIndex): Index of already-answered messages
+        num_mensagens (int): Number of unread emails (for progress logging)
+        completed (list): Receives the UIDs that need no further processing
+            (reply queued, duplicate or unparseable)
+        deadline (float): time.monotonic() value after which emails still
+            waiting to be fetched are left for the next cycle
+        prefilter (Prefilter): Header prefilter applied before parsing the
+            body (None when the headers were already filtered in phase one)
+        throttle (ReplyThrottle): Per-sender reply throttle (None = answer every email)
+        stop_event (threading.Event): Once set, emails still waiting to be
+            fetched are left for the next cycle
+    
+    Returns:
+        Pipeline: Pipeline whose input is a list of (uid, header data or None)
+    """
+    queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", 100))
+    seen_keys = set()
+    seen_lock = threading.Lock()
+    completed = completed if completed is not None else []
+    fetched = 0
+    
+    def fetch(item):
+        nonlocal fetched
+        num, header_data = item
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+        if stop_event is not None and stop_event.is_set():
+            return None
+        fetched += 1
+        logger.info(f"Processing email {fetched} of {num_mensagens}")
+        if header_data is not None:
+            return num, header_data
+        raw = email_handler.buscar_email_bruto(num)
+        return (num, raw) if raw is not None else None
+    
+    def drop_filtered(item):
+        num, payload = item
+        if isinstance(payload, dict):
+            return item
+        
+        # Headers only: the body is not parsed for emails that will be dropped
+        header_data = email_handler.analisar_cabecalhos(payload)
+        rule = prefilter.check(header_data) if header_data is not None else None
+        if rule:
+            logger.info(f"Skipping email from {header_data['remetente']} (prefilter: {rule})")
+            metrics.incr(EMAILS_HEADER_SKIPPED)
+            completed.append(num)
+            return None
+        return item
+    
+    def parse(item):
+        num, payload = item
+        email_data = payload if isinstance(payload, dict) else email_handler.analisar_email(payload)
+        if not email_data:
+            completed.append(num)
+            return None
+        email_data['num'] = num
+        
+        # Never answer the same message twice (re-marked unread, crash before \Seen, ...)
+        key = message_key(email_data)
+        with seen_lock:
+            duplicate = key in seen_keys
+            seen_keys.add(key)
+        if duplicate or reply_index.contains(key):
+            logger.info(f"Skipping already answered message from {email_data['remetente']} ({key})")
+            metrics.incr(EMAILS_DUPLICATES)
+            completed.append(num)
+            return None
+        email_data['key'] = key
+        
+        # Log email information
+        logger.info(f"\n📩 New email from: {email_data['remetente']}")
+        logger.info(f"Subject: {email_data['assunto']}")
+        logger.info(f"Body: {email_data['corpo'][:100]}...")
+        return email_data
+    
+    def match(emails):
+        # Keyword rules decide first; the classifier only sees the leftovers
+        decisions = get_cascade().route(emails)
+        logger.info(f"Cascade decisions: {dict(Counter(decision.stage for decision in decisions))}")
+        return list(zip(emails, decisions))
+    
+    def enqueue_replies(items):
+        replies = []
+        suppressed = []
+        for email_data, decision in items:
+            if throttle is not None and not throttle.allow(email_data['remetente'], decision.matched_rule):
+                suppressed.append((email_data, decision))
+                continue
+            logger.info(f"🤖 Generated response ({decision.stage}): {decision.resposta[:100]}...")
+            replies.append({
+                'idempotency_key': email_data['key'],
+                'recipient': email_data['remetente'],
+                'subject': email_data['assunto'],
+                'body': decision.resposta,
+                'matched_rule': decision.matched_rule,
+            })
+        
+        # Once queued the reply is as good as sent for duplicate detection;
+        # the outbox key is unique, so a re-queued message is ignored
+        try:
+            enqueue(get_engine(), replies)
+        except Exception:
+            # Not queued: the next email from these senders must still get a reply
+            if throttle is not None:
+                for reply in replies:
+                    throttle.release(reply['recipient'], reply['matched_rule'])
+            raise
+        for reply in replies:
+            reply_index.add(reply['idempotency_key'], reply['recipient'])
+        
+        # Suppressed emails count as handled, so they are never answered later
+        for email_data, decision in suppressed:
+            logger.info(f"🔇 Suppressing reply to {email_data['remetente']} (already answered recently)")
+            reply_index.add(email_data['key'], email_data['remetente'])
+            get_log_writer().write(
+                sender=email_data['remetente'],
+                subject=email_data['assunto'],
+                matched_rule=decision.matched_rule,
+                response_sent=False,
+                suppressed=True
+            )
+            metrics.incr(EMAILS_SUPPRESSED)
+        
+        completed.extend(email_data['num'] for email_data, _ in items)
+        logger.info(f"📥 Queued {len(replies)} responses in the outbox ({len(suppressed)} suppressed)")
+    
+    stages = [Stage('fetch', fetch, workers=1, queue_size=queue_size)]
+    if prefilter is not None:
+        stages.append(Stage('prefilter', drop_filtered, workers=1, queue_size=queue_size))
+    
+    return Pipeline(stages + [
+        Stage('parse', parse, workers=int(os.getenv("PIPELINE_PARSE_WORKERS", 2)), queue_size=queue_size),
+        Stage('match', match, workers=int(os.getenv("PIPELINE_MATCH_WORKERS", 1)), queue_size=queue_size,
+              batch_size=int(os.getenv("PIPELINE_MATCH_BATCH", os.getenv("ML_BATCH_SIZE", 32)))),
+        Stage('enqueue', enqueue_replies, workers=1, queue_size=queue_size,
+              batch_size=int(os.getenv("PIPELINE_ENQUEUE_BATCH", 50))),
+    ])
+
+def process_emails(stop_event=None):
+    """Process unread emails and send automated responses.
+    
+    Args:
+        stop_event (threading.Event): Set to stop early, leaving the
+            remaining emails for the next cycle (e.g. the monitor lease was lost)
+    
+    Returns:
+        int: Number of unread emails found, or None if the cycle failed
+            (missing configuration, connection or processing error)
+    """
+    
+    # Get email configuration from environment variables
+    settings = email_settings()
     
     # Validate required environment variables
-    if not all([email_usuario, email_senha]):
+    if settings is None:
         logger.error("Missing required environment variables. Please check your .env file.")
         return
     
+    # Pick up rule changes made since the last cycle (no-op if the version is unchanged)
+    sync_rules_with_database()
+    
+    get_stats_publisher()
+    cycle_started = time.monotonic()
+    
     try:
         # Initialize email handler
-        email_handler = EmailHandler(
-            email_usuario=email_usuario,
-            email_senha=email_senha,
-            servidor_imap=servidor_imap,
-            servidor_smtp=servidor_smtp,
-            porta_smtp=porta_smtp
-        )
+        email_handler = EmailHandler(**settings)
         
         # Connect to email server
         if not email_handler.conectar_email():
@@ -64,65 +542,79 @@ def process_emails():
         num_mensagens = len(mensagens)
         logger.info(f"🔍 Found {num_mensagens} unread emails")
         
-        # Process each unread email
-        for idx, num in enumerate(mensagens, 1):
-            logger.info(f"Processing email {idx} of {num_mensagens}")
+        # Pick up messages answered by other processes and drop expired entries
+        reply_index = get_reply_index()
+        reply_index.refresh()
+        
+        # Skip what an interrupted cycle already handled and split the rest into chunks
+        checkpoint = get_catchup_checkpoint()
+        pendentes = checkpoint.begin(settings['email_usuario'], email_handler.uidvalidity, mensagens)
+        chunks = plan_chunks(
+            pendentes,
+            chunk_size=int(os.getenv("CATCHUP_CHUNK_SIZE", 100)),
+            order=os.getenv("CATCHUP_ORDER", "newest").lower(),
+            high_water=checkpoint.high_water
+        )
+        checkpoint.set_high_water(max(mensagens, default=None))
+        if len(pendentes) < num_mensagens:
+            logger.info(f"Skipping {num_mensagens - len(pendentes)} emails already processed (checkpoint)")
+        
+        two_phase = os.getenv("TWO_PHASE_FETCH", "True").lower() in ("true", "1", "t")
+        prefilter = get_prefilter() if os.getenv("PREFILTER", "True").lower() in ("true", "1", "t") else None
+        throttle = get_reply_throttle() if os.getenv("THROTTLE", "True").lower() in ("true", "1", "t") else None
+        if throttle is not None:
+            throttle.prune()
+        cycle_deadline = float(os.getenv("CATCHUP_CYCLE_DEADLINE", 240))
+        deadline = cycle_started + cycle_deadline if cycle_deadline > 0 else None
+        completed = []
+        
+        # One pipeline run per chunk; progress is persisted after each one
+        for chunk in chunks:
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.warning(f"Cycle deadline of {cycle_deadline:g}s reached; stopping early")
+                break
+            if stop_event is not None and stop_event.is_set():
+                logger.warning("Cycle interrupted; stopping early")
+                break
+            if two_phase:
+                items = triage_headers(email_handler, chunk, prefilter, completed)
+            else:
+                items = [(uid, None) for uid in chunk]
             
             try:
-                # Extract email data
-                email_data = email_handler.extrair_dados_email(num)
-                
-                if email_data:
-                    remetente = email_data['remetente']
-                    assunto = email_data['assunto']
-                    corpo = email_data['corpo']
-                    
-                    # Log email information
-                    logger.info(f"\n📩 New email from: {remetente}")
-                    logger.info(f"Subject: {assunto}")
-                    logger.info(f"Body: {corpo[:100]}...")
-                    
-                    # Generate response based on rules
-                    resposta, matched_rule = gerar_resposta_assistente(assunto, corpo, return_matched=True)
-                    logger.info(f"🤖 Generated response: {resposta[:100]}...")
-                    
-                    # Send response
-                    success = email_handler.enviar_resposta_email(
-                        destinatario=remetente,
-                        assunto_original=assunto,
-                        mensagem=resposta
-                    )
-                    
-                    if success:
-                        logger.info(f"📤 Response sent to {remetente}")
-                    else:
-                        logger.error(f"Failed to send response to {remetente}")
-                    
-                    # Log to database if we're running as part of the web app
-                    try:
-                        with app.app_context():
-                            from models import EmailLog
-                            from app import db
-                            
-                            log_entry = EmailLog(
-                                sender=remetente,
-                                subject=assunto,
-                                matched_rule=matched_rule,
-                                response_sent=success
-                            )
-                            db.session.add(log_entry)
-                            db.session.commit()
-                            logger.info(f"Email processing logged to database")
-                    except Exception as e:
-                        logger.error(f"Error logging to database: {str(e)}")
-                
-            except Exception as e:
-                logger.error(f"Error processing email {idx}: {str(e)}")
+                build_pipeline(
+                    email_handler, reply_index, len(pendentes), completed=completed, deadline=deadline,
+                    prefilter=None if two_phase else prefilter, throttle=throttle, stop_event=stop_event
+                ).run(items)
+            finally:
+                checkpoint.mark_done(completed)
+                checkpoint.save()
+            
+            # Emails answered from their headers were never downloaded, so flag them read here
+            done = set(completed)
+            email_handler.marcar_lidos([uid for uid, header_data in items if header_data is not None and uid in done])
+        
+        backlog = len(pendentes) - len(set(completed))
+        metrics.set_gauge(BACKLOG_METRIC, backlog)
+        if backlog:
+            logger.info(f"{backlog} unread emails left for the next cycles")
+        
+        # Send the queued replies: in the background when polling, right away for one-off runs
+        sender = get_outbox_sender()
+        if sender.running:
+            sender.wake()
+        else:
+            sender.drain(stop_event=stop_event)
+        
+        return num_mensagens
         
     except Exception as e:
         logger.error(f"Error in email processing: {str(e)}")
+        return None
     
     finally:
+        metrics.observe(CYCLE_DURATION, time.monotonic() - cycle_started)
+        
         # Cleanup and close connections
         if 'email_handler' in locals():
             try:
@@ -131,14 +623,30 @@ def process_emails():
                 logger.error(f"Error disconnecting: {str(e)}")
             logger.info("Email connections closed")
 
-def sync_rules_with_database():
-    """Synchronize in-memory rules with database rules"""
+# Rules version currently loaded into REGRAS (None = never synchronized)
+_synced_rules_version = None
+
+def sync_rules_with_database(force=False):
+    """
+    Synchronize in-memory rules with database rules.
+    
+    The rules version row is read first (a single primary-key lookup); the
+    rules themselves are only reloaded when it differs from the version
+    already loaded, which also catches deletions.
+    
+    Args:
+        force (bool): Reload even if the version did not change
+    """
+    global _synced_rules_version
+    
     try:
-        with app.app_context():
-            from models import Rule
+        with Session(get_engine()) as session:
+            version = get_rules_version(session)
+            if not force and version == _synced_rules_version:
+                return
             
             # Get all active rules from database
-            db_rules = Rule.query.filter_by(is_active=True).all()
+            db_rules = session.execute(select(Rule).filter_by(is_active=True)).scalars().all()
             
             # Update in-memory rules
             global REGRAS
@@ -147,15 +655,122 @@ def sync_rules_with_database():
             for rule in db_rules:
                 REGRAS.append({
                     "palavra_chave": rule.keyword,
-                    "resposta": rule.response
+                    "resposta": rule.response,
+                    "somente_assunto": rule.subject_only
                 })
-                
-            logger.info(f"Synchronized {len(REGRAS)} rules from database")
+            
+            _synced_rules_version = version
+            logger.info(f"Synchronized {len(REGRAS)} rules from database (version {version})")
     except Exception as e:
         # We're running standalone, not as part of the web app
         logger.warning(f"Could not sync rules with database: {str(e)}")
         logger.info("Using default rules")
 
+# Serializes processing cycles in this process (scheduled and manual checks never overlap)
+_cycle_lock = threading.Lock()
+
+# Scheduler of the polling loop running in this process, if any
+_active_scheduler = None
+
+def run_cycle(stop_event=None):
+    """Run one processing cycle, waiting for any cycle already in progress.
+    
+    Args:
+        stop_event (threading.Event): Set to stop the cycle early
+    
+    Returns:
+        int: Number of unread emails found, or None if the cycle failed
+    """
+    with _cycle_lock:
+        return process_emails(stop_event)
+
+def run_leased_cycle(lease):
+    """Run one processing cycle while holding the monitor lease.
+    
+    The lease must already be held; it is renewed while the cycle runs (the
+    cycle stops early if a renewal fails) and released at the end.
+    
+    Args:
+        lease (Lease): Acquired monitor lease
+    
+    Returns:
+        int: Number of unread emails found, or None if the cycle failed
+    """
+    try:
+        with lease.keep_alive() as lost:
+            return run_cycle(lost)
+    finally:
+        lease.release()
+
+def check_now(lease=None):
+    """Request an immediate check without overlapping a running cycle.
+    
+    While this process is polling, the request is queued on its scheduler.
+    Otherwise the monitor lease decides where the check runs: here, in a
+    background thread, if the lease is free (taken under its own holder id
+    so no monitor starts meanwhile), or on the process holding it, which
+    picks the request up from the lease on its next heartbeat.
+    
+    Args:
+        lease (Lease): Monitor lease (None = run here, ignoring other processes)
+    
+    Returns:
+        str: 'queued' on this process's scheduler, 'started' here or
+            'requested' from the lease holder
+    """
+    scheduler = _active_scheduler
+    if scheduler is not None and scheduler.run_now():
+        return 'queued'
+    
+    if lease is None:
+        threading.Thread(target=run_cycle, name='manual-check', daemon=True).start()
+        return 'started'
+    
+    manual_lease = Lease(lease.engine, name=lease.name, ttl=lease.ttl.total_seconds())
+    if manual_lease.acquire():
+        threading.Thread(target=run_leased_cycle, args=(manual_lease,), name='manual-check', daemon=True).start()
+        return 'started'
+    
+    if not lease.request_run():
+        raise RuntimeError("Could not request a check from the monitoring process")
+    return 'requested'
+
+def poll_emails(stop_event=None):
+    """Check for new emails, adapting the interval to the recent mail volume.
+    
+    The interval shrinks after cycles that found mail and grows after idle
+    ones (within CHECK_INTERVAL_MIN/MAX, with jitter); failed cycles back off
+    exponentially. The first check runs right away.
+    
+    Args:
+        stop_event (threading.Event): Set to stop after the current cycle
+    """
+    global _active_scheduler
+    
+    stop_event = stop_event or threading.Event()
+    
+    # Replies that failed are retried between cycles by the background sender
+    sender = get_outbox_sender()
+    if sender is not None:
+        sender.start()
+    
+    scheduler = EmailScheduler(
+        interval=adaptive_interval_from_env(),
+        callback=run_cycle,
+        start_immediately=False,
+        run_immediately=True
+    )
+    scheduler.start()
+    _active_scheduler = scheduler
+    
+    try:
+        stop_event.wait()
+    finally:
+        _active_scheduler = None
+        scheduler.stop(timeout=None)
+        if sender is not None:
+            sender.stop()
+
 def main():
     """Main execution function"""
     # Try to sync rules with database
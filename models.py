@@ -2,35 +2,297 @@
 Automated Email Response System - Database Models
 
 This module defines the database models for the email auto-responder system.
+
+The models are declared on a plain SQLAlchemy base so the standalone worker
+can use them without Flask; the web app registers the same base with
+Flask-SQLAlchemy, which adds ``Model.query``.
 """
 
+import logging
 from datetime import datetime
-from app import db
+from sqlalchemy import (
+    event, select, update, insert,
+    Column, Integer, String, Text, Boolean, DateTime, Index, UniqueConstraint, false
+)
+from sqlalchemy.orm import DeclarativeBase, Session, object_session
+
+logger = logging.getLogger(__name__)
+
+class Base(DeclarativeBase):
+    pass
 
-class Rule(db.Model):
+class Rule(Base):
     """
     Rule model for storing email response rules.
     """
-    id = db.Column(db.Integer, primary_key=True)
-    keyword = db.Column(db.String(100), unique=True, nullable=False)
-    response = db.Column(db.Text, nullable=False)
-    is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __tablename__ = 'rule'
+    
+    id = Column(Integer, primary_key=True)
+    keyword = Column(String(100), unique=True, nullable=False)
+    response = Column(Text, nullable=False)
+    is_active = Column(Boolean, default=True)
+    # True when the keyword only matches the subject (such rules can be
+    # applied from the headers, without downloading the body)
+    subject_only = Column(Boolean, nullable=False, default=False, server_default=false())
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Keyset pagination of /rules walks (created_at, id) newest first
+    __table_args__ = (
+        Index('ix_rule_created_at_id', 'created_at', 'id'),
+    )
 
     def __repr__(self):
         return f"<Rule {self.keyword}>"
 
-class EmailLog(db.Model):
+class RulesVersion(Base):
+    """
+    Single-row counter bumped on every insert, update and delete of a Rule.
+    
+    Workers compare it with the version they loaded (one primary-key read)
+    to decide whether the in-memory rules must be reloaded.
+    """
+    __tablename__ = 'rules_version'
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<RulesVersion {self.version}>"
+
+# Callbacks notified in-process after a commit that changed the rules
+_rules_listeners = []
+
+def get_rules_version(session):
+    """
+    Return the current rules version (0 if no rule was ever changed).
+    
+    Args:
+        session: SQLAlchemy session
+        
+    Returns:
+        int: Current rules version
+    """
+    version = session.execute(
+        select(RulesVersion.version).where(RulesVersion.id == 1)
+    ).scalar()
+    return version or 0
+
+def bump_rules_version(connection):
+    """
+    Increment the rules version inside the caller's transaction.
+    
+    Bulk statements (``session.execute(insert(Rule), ...)``) skip the mapper
+    events below and must call this explicitly. On SQLite and PostgreSQL the
+    row is created or incremented with a single upsert, so two concurrent
+    first writers cannot collide on the primary key; other databases rely on
+    the row seeded by the migrations.
+    
+    Args:
+        connection: SQLAlchemy connection (or session) in the current transaction
+    """
+    table = RulesVersion.__table__
+    now = datetime.utcnow()
+    bind = connection.get_bind() if isinstance(connection, Session) else connection
+    dialect = bind.dialect.name
+    
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(table).values(id=1, version=1, updated_at=now)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=['id'],
+            set_={'version': table.c.version + 1, 'updated_at': now}
+        ))
+    else:
+        result = connection.execute(
+            update(table).where(table.c.id == 1).values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(id=1, version=1, updated_at=now))
+    
+    session = connection if isinstance(connection, Session) else None
+    if session is not None:
+        session.info['rules_changed'] = True
+
+def on_rules_changed(callback):
+    """
+    Register a callback invoked (without arguments) after a commit changes the rules.
+    
+    Args:
+        callback: Function to call
+    """
+    _rules_listeners.append(callback)
+
+@event.listens_for(Rule, 'after_insert')
+@event.listens_for(Rule, 'after_update')
+@event.listens_for(Rule, 'after_delete')
+def _rule_changed(mapper, connection, target):
+    """Bump the rules version in the same transaction as the change."""
+    bump_rules_version(connection)
+    
+    session = object_session(target)
+    if session is not None:
+        session.info['rules_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _notify_rules_listeners(session):
+    """Notify in-process listeners once the rule change is committed."""
+    if session.info.pop('rules_changed', False):
+        for callback in list(_rules_listeners):
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error notifying rules listener: {str(e)}")
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rules_change(session):
+    """Forget uncommitted rule changes."""
+    session.info.pop('rules_changed', None)
+
+class EmailLog(Base):
     """
     Email log model for tracking processed emails.
     """
-    id = db.Column(db.Integer, primary_key=True)
-    sender = db.Column(db.String(120), nullable=False)
-    subject = db.Column(db.String(255))
-    matched_rule = db.Column(db.String(100), nullable=True)
-    processed_at = db.Column(db.DateTime, default=datetime.utcnow)
-    response_sent = db.Column(db.Boolean, default=False)
+    __tablename__ = 'email_log'
+    
+    id = Column(Integer, primary_key=True)
+    sender = Column(String(120), nullable=False)
+    subject = Column(String(255))
+    matched_rule = Column(String(100), nullable=True)
+    processed_at = Column(DateTime, default=datetime.utcnow)
+    response_sent = Column(Boolean, default=False)
+    # True when the reply was withheld by the per-sender throttle (never sent)
+    suppressed = Column(Boolean, nullable=False, default=False, server_default=false())
+    
+    # Keyset pagination of /logs walks (processed_at, id) newest first,
+    # optionally narrowed by one equality filter
+    __table_args__ = (
+        Index('ix_email_log_processed_at_id', 'processed_at', 'id'),
+        Index('ix_email_log_sender_processed_at_id', 'sender', 'processed_at', 'id'),
+        Index('ix_email_log_matched_rule_processed_at_id', 'matched_rule', 'processed_at', 'id'),
+        Index('ix_email_log_response_sent_processed_at_id', 'response_sent', 'processed_at', 'id'),
+    )
+    
+    def __repr__(self):
+        return f"<EmailLog {self.id} - {self.sender}>"
+
+class EmailLogRollup(Base):
+    """
+    Pre-aggregated EmailLog counts per time bucket and rule.
+    
+    Maintained incrementally by the log writer in the same transaction as
+    the raw rows, so dashboards never scan ``email_log``. ``rule`` is an
+    empty string for emails answered with the generic response.
+    """
+    __tablename__ = 'email_log_rollup'
+    
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String(8), nullable=False)  # 'hour' or 'day'
+    bucket_start = Column(DateTime, nullable=False)
+    rule = Column(String(100), nullable=False, default='')
+    sent_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+    suppressed_count = Column(Integer, nullable=False, default=0, server_default='0')
+    
+    __table_args__ = (
+        UniqueConstraint('granularity', 'bucket_start', 'rule', name='uq_email_log_rollup_bucket'),
+    )
+    
+    def __repr__(self):
+        return f"<EmailLogRollup {self.granularity} {self.bucket_start} {self.rule!r}>"
+
+class RespondedMessage(Base):
+    """
+    Messages already answered, keyed by Message-ID (or a content hash).
+    
+    Checked before matching and sending so a message marked unread again,
+    or re-fetched after a crash, never gets a second auto-reply. Rows older
+    than the index TTL are pruned.
+    """
+    __tablename__ = 'responded_message'
+    
+    key = Column(String(255), primary_key=True)
+    sender = Column(String(120))
+    responded_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<RespondedMessage {self.key}>"
+
+class SenderThrottle(Base):
+    """
+    Last auto-reply per throttle key (a sender, or a sender and rule).
+    
+    A sender who writes again inside the suppression window gets no second
+    reply. The in-memory cache of the throttle fronts this table, which
+    keeps the window across restarts and between processes.
+    """
+    __tablename__ = 'sender_throttle'
+    
+    key = Column(String(255), primary_key=True)
+    sender = Column(String(120), nullable=False)
+    matched_rule = Column(String(100), nullable=True)
+    last_reply_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<SenderThrottle {self.key}>"
+
+class MonitorLease(Base):
+    """
+    Cluster-wide lease that elects the single process running the email monitor.
+    
+    ``enabled`` is the desired monitor state shared by every web worker;
+    ``holder`` is the process currently running the monitor, which must
+    renew ``expires_at`` with heartbeats or lose the lease to another worker.
+    ``run_requested`` asks the holder for an immediate check (a manual check
+    made on a worker that does not hold the lease).
+    """
+    __tablename__ = 'monitor_lease'
+    
+    name = Column(String(64), primary_key=True)
+    enabled = Column(Boolean, nullable=False, default=False)
+    holder = Column(String(255), nullable=True)
+    acquired_at = Column(DateTime, nullable=True)
+    renewed_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+    run_requested = Column(Boolean, nullable=False, default=False, server_default=false())
+    
+    def __repr__(self):
+        return f"<MonitorLease {self.name} holder={self.holder!r}>"
+
+class OutboxMessage(Base):
+    """
+    Durable queue of auto-replies, one row per answered email.
+    
+    Replies are enqueued by the processing cycle and sent by the outbox
+    sender, which retries failures with exponential backoff and gives up
+    (``dead``) after a maximum number of attempts. ``idempotency_key`` is the
+    responded-message key, so an email is never queued twice.
+    """
+    __tablename__ = 'outbox_message'
+    
+    id = Column(Integer, primary_key=True)
+    idempotency_key = Column(String(255), unique=True, nullable=False)
+    recipient = Column(String(120), nullable=False)
+    subject = Column(String(255))
+    body = Column(Text, nullable=False)
+    matched_rule = Column(String(100), nullable=True)
+    status = Column(String(16), nullable=False, default='pending')  # pending, sending, sent or dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = Column(String(64), nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    
+    # The sender scans due messages by (status, next_attempt_at)
+    __table_args__ = (
+        Index('ix_outbox_message_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
     
     def __repr__(self):
-        return f"<EmailLog {self.id} - {self.sender}>"
\ No newline at end of file
+        return f"<OutboxMessage {self.id} {self.status} -> {self.recipient}>"
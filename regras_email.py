@@ -12,7 +12,8 @@ import logging
 logger = logging.getLogger(__name__)
 
 # Define default response rules
-# Each rule consists of a keyword to match and the corresponding response
+# Each rule consists of a keyword to match and the corresponding response;
+# rules with "somente_assunto" set only match the subject, never the body
 REGRAS = [
     {
         "palavra_chave": "orçamento",
@@ -39,66 +40,181 @@ REGRAS = [
 RESPOSTA_GENERICA = ("Olá! Recebemos sua mensagem. Em breve retornaremos com mais informações. "
                      "Caso queira agilizar o atendimento, envie seu CPF e o assunto da dúvida.")
 
-def gerar_resposta_assistente(assunto, corpo, return_matched=False):
+# Compiled matcher cache, rebuilt only when the set of keywords changes
+_matcher_cache = {"chaves": None, "padrao": None, "aninhadas": None}
+
+def _compilar_regras(chaves):
     """
-    Generate an automated response based on email content and predefined rules.
+    Build the compiled matcher for the given keywords.
+    
+    A single zero-width lookahead alternation finds every keyword in one scan,
+    including overlapping ones. Keywords contained in another keyword may be
+    shadowed by the longer one at the same position, so they also get an
+    individual pattern that is only tried when the combined scan misses them.
+    
+    Args:
+        chaves (tuple): Lowercased keywords, in rule order
+        
+    Returns:
+        tuple: (combined pattern or None, {keyword: individual pattern})
+    """
+    unicas = sorted(set(chaves), key=len, reverse=True)
+    if not unicas:
+        return None, {}
+    
+    alternativas = "|".join(re.escape(chave) for chave in unicas)
+    padrao = re.compile(r'\b(?=(' + alternativas + r')\b)')
+    
+    aninhadas = {
+        chave: re.compile(r'\b' + re.escape(chave) + r'\b')
+        for chave in unicas
+        if any(chave != outra and chave in outra for outra in unicas)
+    }
+    
+    return padrao, aninhadas
+
+def _buscar_chaves(conteudo):
+    """
+    Find the keywords of the compiled matcher that appear in the text.
+    
+    Args:
+        conteudo (str): Lowercased text
+        
+    Returns:
+        set: Keywords found
+    """
+    encontradas = {m.group(1) for m in _matcher_cache["padrao"].finditer(conteudo)}
+    for chave, padrao_individual in _matcher_cache["aninhadas"].items():
+        if chave not in encontradas and padrao_individual.search(conteudo):
+            encontradas.add(chave)
+    return encontradas
+
+def encontrar_regras(assunto, corpo):
+    """
+    Find every rule whose keyword appears in the email.
+    
+    Rules flagged ``somente_assunto`` only match the subject.
     
     Args:
         assunto (str): The email subject
         corpo (str): The email body content
-        return_matched (bool): Whether to return the matched rule keyword
         
     Returns:
-        If return_matched is False:
-            str: The appropriate response message
-        If return_matched is True:
-            tuple: (response message, matched rule keyword or None)
+        list: Matching rules, in the same order as REGRAS
     """
+    chaves = tuple(regra["palavra_chave"].lower() for regra in REGRAS)
+    
+    if _matcher_cache["chaves"] != chaves:
+        padrao, aninhadas = _compilar_regras(chaves)
+        _matcher_cache.update(chaves=chaves, padrao=padrao, aninhadas=aninhadas)
+    
+    padrao = _matcher_cache["padrao"]
+    if padrao is None:
+        return []
+    
     # Combine subject and body for analysis
     conteudo_completo = f"{assunto} {corpo}".lower()
     
-    # Track if we've found a matching rule
-    resposta_encontrada = False
-    resposta_final = ""
-    matched_keyword = None
+    encontradas = _buscar_chaves(conteudo_completo)
+    no_assunto = None
     
-    # Check each rule against the content
-    for regra in REGRAS:
-        palavra_chave = regra["palavra_chave"].lower()
+    regras_encontradas = []
+    for regra, chave in zip(REGRAS, chaves):
+        if chave not in encontradas:
+            continue
+        if regra.get("somente_assunto"):
+            # The subject is only scanned on its own when such a rule matched
+            if no_assunto is None:
+                no_assunto = _buscar_chaves(assunto.lower())
+            if chave not in no_assunto:
+                continue
+        regras_encontradas.append(regra)
+    
+    return regras_encontradas
+
+def regras_pelo_assunto(assunto):
+    """
+    Find the matching rules from the subject alone, if the body cannot change them.
+    
+    Only rules flagged ``somente_assunto`` ignore the body: as long as another
+    rule is not already found in the subject, its keyword could still appear
+    in the body.
+    
+    Args:
+        assunto (str): The email subject
         
-        # Use regex to find word boundaries to avoid partial matches
-        if re.search(r'\b' + re.escape(palavra_chave) + r'\b', conteudo_completo):
-            logger.info(f"Rule matched: '{palavra_chave}'")
-            
-            # If this is the first match, use the response directly
-            if not resposta_encontrada:
-                resposta_final = regra["resposta"]
-                resposta_encontrada = True
-                matched_keyword = regra["palavra_chave"]
-            # For additional matches, append to the response
-            else:
-                resposta_final += f"\n\nTambém notei que você mencionou '{palavra_chave}': {regra['resposta']}"
-    
-    # If no rule matched, use the generic response
-    if not resposta_encontrada:
+    Returns:
+        list: The rules encontrar_regras returns for any body, or None if
+            the body is needed to know them
+    """
+    regras_encontradas = encontrar_regras(assunto, '')
+    ids_encontradas = {id(regra) for regra in regras_encontradas}
+    
+    if all(regra.get("somente_assunto") or id(regra) in ids_encontradas for regra in REGRAS):
+        return regras_encontradas
+    return None
+
+def montar_resposta(regras_encontradas):
+    """
+    Build the response text for a list of matched rules.
+    
+    Args:
+        regras_encontradas (list): Matched rules; the first one is the primary match
+        
+    Returns:
+        tuple: (response message, matched rule keyword or None)
+    """
+    if not regras_encontradas:
         logger.info("No specific rule matched. Using generic response.")
         resposta_final = RESPOSTA_GENERICA
+        matched_keyword = None
+    else:
+        principal = regras_encontradas[0]
+        resposta_final = principal["resposta"]
+        matched_keyword = principal["palavra_chave"]
+        logger.info(f"Rule matched: '{matched_keyword.lower()}'")
+        
+        # For additional matches, append to the response
+        for regra in regras_encontradas[1:]:
+            palavra_chave = regra["palavra_chave"].lower()
+            logger.info(f"Rule matched: '{palavra_chave}'")
+            resposta_final += f"\n\nTambém notei que você mencionou '{palavra_chave}': {regra['resposta']}"
     
     # Add a signature to the response
     resposta_final += "\n\nAtenciosamente,\nAssistente Automático"
     
+    return resposta_final, matched_keyword
+
+def gerar_resposta_assistente(assunto, corpo, return_matched=False):
+    """
+    Generate an automated response based on email content and predefined rules.
+    
+    Args:
+        assunto (str): The email subject
+        corpo (str): The email body content
+        return_matched (bool): Whether to return the matched rule keyword
+        
+    Returns:
+        If return_matched is False:
+            str: The appropriate response message
+        If return_matched is True:
+            tuple: (response message, matched rule keyword or None)
+    """
+    resposta_final, matched_keyword = montar_resposta(encontrar_regras(assunto, corpo))
+    
     if return_matched:
         return resposta_final, matched_keyword
     else:
         return resposta_final
 
-def adicionar_regra(palavra_chave, resposta):
+def adicionar_regra(palavra_chave, resposta, somente_assunto=False):
     """
     Add a new response rule to the existing ruleset.
     
     Args:
         palavra_chave (str): The keyword to match in email content
         resposta (str): The response to send when the keyword is found
+        somente_assunto (bool): Whether the keyword only matches the subject
     """
     global REGRAS
     
@@ -107,8 +223,9 @@ def adicionar_regra(palavra_chave, resposta):
         if regra["palavra_chave"].lower() == palavra_chave.lower():
             logger.warning(f"Rule for '{palavra_chave}' already exists. Updating response.")
             regra["resposta"] = resposta
+            regra["somente_assunto"] = somente_assunto
             return
     
     # Add new rule
-    REGRAS.append({"palavra_chave": palavra_chave, "resposta": resposta})
+    REGRAS.append({"palavra_chave": palavra_chave, "resposta": resposta, "somente_assunto": somente_assunto})
     logger.info(f"New rule added for keyword: '{palavra_chave}'")
\ No newline at end of file
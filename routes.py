@@ -4,15 +4,21 @@ Automated Email Response System - Route Definitions
 This module defines the routes for the email auto-responder web interface.
 """
 
+import io
 import os
-import time
 import threading
 import logging
 import pickle
-from flask import render_template, request, redirect, url_for, flash, jsonify, session
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, Response, stream_with_context
 from dotenv import load_dotenv
 from models import Rule, EmailLog
 from app import db
+from utils import rule_io
+from utils.pagination import paginate_keyset
+from utils.rollups import daily_totals, rule_totals
+from utils.stats import get_stats, empty_stats, DEFAULT_STATS_FILE
+from utils.scheduler import INTERVAL_METRIC
+from utils.lease import Lease, LeaseSupervisor
 from utils.oauth_helper import get_authorization_url, save_credentials, create_oauth_flow
 
 # Load environment variables
@@ -21,13 +27,87 @@ load_dotenv()
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Global variables to track email monitoring thread
-email_thread = None
-stop_thread = False
+# Coordinates the single cluster-wide email monitor (created on first request)
+_monitor_supervisor = None
+_monitor_supervisor_lock = threading.Lock()
+
+# Monitor lease validity in seconds; a dead monitor is replaced within about 4/3 of this
+MONITOR_LEASE_TTL = float(os.getenv("MONITOR_LEASE_TTL", 60))
 
 # Token storage
 TOKEN_PICKLE_PATH = 'token.pickle'
 
+# Pagination of the /logs and /rules views
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Period covered by the dashboard statistics, in days
+DASHBOARD_DAYS = 14
+
+# How long /api/stats responses are reused, in seconds
+STATS_CACHE_SECONDS = float(os.getenv("STATS_CACHE_SECONDS", 5))
+
+# /logs rule filter value selecting logs answered with the generic response
+GENERIC_RULE_FILTER = '__generic__'
+
+# Shared classifier used for keyword suggestions (None until first use,
+# False when the optional ML dependencies are not installed)
+_classifier = None
+
+def get_classifier():
+    """Return the shared EmailClassifier, or None if ML support is unavailable."""
+    global _classifier
+    
+    if _classifier is None:
+        try:
+            from utils.ml_classifier import EmailClassifier
+            _classifier = EmailClassifier(
+                model_file=os.getenv("MODEL_FILE", "models/email_classifier.pkl")
+            )
+        except ImportError:
+            logger.info("ML dependencies not installed; keyword suggestions disabled")
+            _classifier = False
+    
+    return _classifier or None
+
+def get_monitor_supervisor():
+    """Return this worker's monitor supervisor, starting it if needed.
+    
+    Every worker runs a supervisor so any of them can take over the monitor
+    lease when the current holder stops renewing it.
+    """
+    global _monitor_supervisor
+    
+    with _monitor_supervisor_lock:
+        if _monitor_supervisor is None:
+            lease = Lease(db.engine, ttl=MONITOR_LEASE_TTL)
+            _monitor_supervisor = LeaseSupervisor(lease, check_emails_periodically,
+                                                  on_run_request=run_requested_check)
+            _monitor_supervisor.start()
+    
+    return _monitor_supervisor
+
+def _monitor_state():
+    """Return the cluster-wide monitor state with JSON-friendly timestamps."""
+    state = get_monitor_supervisor().lease.state()
+    state['running'] = state['enabled'] and state['active']
+    for field in ('acquired_at', 'renewed_at', 'expires_at'):
+        if state[field] is not None:
+            state[field] = state[field].isoformat()
+    return state
+
+def _get_stats():
+    """Return the processing statistics, cached for STATS_CACHE_SECONDS."""
+    return get_stats(path=os.getenv("STATS_FILE", DEFAULT_STATS_FILE), cache_seconds=STATS_CACHE_SECONDS)
+
+def _page_size():
+    """Return the requested page size, clamped to [1, MAX_PAGE_SIZE]."""
+    try:
+        size = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        size = DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
 def register_routes(app):
     """Register all application routes with the Flask app."""
     
@@ -37,8 +117,23 @@ def register_routes(app):
         rules = Rule.query.order_by(Rule.created_at.desc()).limit(5).all()
         logs = EmailLog.query.order_by(EmailLog.processed_at.desc()).limit(5).all()
         
-        # Check email monitoring status
-        monitoring_active = email_thread is not None and email_thread.is_alive()
+        # Aggregates come from the rollup table, never from a scan of email_log
+        daily = daily_totals(db.session, days=DASHBOARD_DAYS)
+        top_rules = rule_totals(db.session, days=DASHBOARD_DAYS)
+        stats = {
+            'rules': Rule.query.count(),
+            'sent': sum(sent for _, sent, _, _ in daily),
+            'failed': sum(failed for _, _, failed, _ in daily),
+            'suppressed': sum(suppressed for _, _, _, suppressed in daily),
+        }
+        
+        # Check email monitoring status (cluster-wide, from the monitor lease)
+        monitor = _monitor_state()
+        monitoring_active = monitor['running']
+        
+        # Delay chosen by the adaptive scheduler for the next check (None before the first cycle)
+        from utils.metrics import metrics
+        next_check_seconds = metrics.get(INTERVAL_METRIC, None)
         
         # Check if OAuth token exists
         oauth_configured = os.path.exists(TOKEN_PICKLE_PATH)
@@ -55,7 +150,14 @@ def register_routes(app):
             'index.html', 
             rules=rules, 
             logs=logs, 
+            stats=stats,
+            daily=daily,
+            top_rules=top_rules,
+            dashboard_days=DASHBOARD_DAYS,
+            next_check_seconds=next_check_seconds,
+            processing=_get_stats(),
             monitoring_active=monitoring_active,
+            monitor_holder=monitor['holder'],
             email_configured=email_configured,
             oauth_configured=oauth_configured
         )
@@ -63,8 +165,20 @@ def register_routes(app):
     @app.route('/rules')
     def list_rules():
         """Display all response rules."""
-        rules = Rule.query.order_by(Rule.created_at.desc()).all()
-        return render_template('rules.html', rules=rules)
+        try:
+            page = paginate_keyset(
+                Rule.query, [Rule.created_at, Rule.id],
+                after=request.args.get('after'), before=request.args.get('before'),
+                limit=_page_size()
+            )
+        except ValueError:
+            return redirect(url_for('list_rules'))
+        
+        # Suggested keywords are precomputed when the model is trained/loaded
+        classifier = get_classifier()
+        suggested_keywords = classifier.get_all_keywords() if classifier else {}
+        
+        return render_template('rules.html', rules=page.items, page=page, suggested_keywords=suggested_keywords)
     
     @app.route('/rules/add', methods=['GET', 'POST'])
     def add_rule():
@@ -73,6 +187,7 @@ def register_routes(app):
             keyword = request.form.get('keyword')
             response = request.form.get('response')
             is_active = True if request.form.get('is_active') else False
+            subject_only = True if request.form.get('subject_only') else False
             
             if not keyword or not response:
                 flash('Both keyword and response are required!', 'error')
@@ -88,7 +203,8 @@ def register_routes(app):
             new_rule = Rule(
                 keyword=keyword,
                 response=response,
-                is_active=is_active
+                is_active=is_active,
+                subject_only=subject_only
             )
             db.session.add(new_rule)
             db.session.commit()
@@ -96,7 +212,7 @@ def register_routes(app):
             # Also update the in-memory rules
             try:
                 from regras_email import adicionar_regra
-                adicionar_regra(keyword, response)
+                adicionar_regra(keyword, response, subject_only)
             except ImportError:
                 logger.warning("Could not update in-memory rules")
             
@@ -114,6 +230,7 @@ def register_routes(app):
             rule.keyword = request.form.get('keyword')
             rule.response = request.form.get('response')
             rule.is_active = True if request.form.get('is_active') else False
+            rule.subject_only = True if request.form.get('subject_only') else False
             
             db.session.commit()
             
@@ -148,11 +265,93 @@ def register_routes(app):
         flash(f'Rule for "{keyword}" deleted successfully!', 'success')
         return redirect(url_for('list_rules'))
     
+    @app.route('/rules/import', methods=['GET', 'POST'])
+    def import_rules():
+        """Bulk import response rules from a CSV, JSON or NDJSON file."""
+        if request.method == 'POST':
+            upload = request.files.get('file')
+            if not upload or not upload.filename:
+                flash('Please choose a file to import!', 'error')
+                return redirect(url_for('import_rules'))
+            
+            fmt = request.form.get('format') or rule_io.detect_format(upload.filename)
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            
+            try:
+                rules = rule_io.parse_rules(stream, fmt)
+            except (rule_io.RuleImportError, UnicodeDecodeError) as e:
+                errors = e.errors if isinstance(e, rule_io.RuleImportError) else [f'Invalid encoding: {str(e)}']
+                return render_template('import_rules.html', errors=errors), 400
+            
+            try:
+                summary = rule_io.import_rules(db.session, rules)
+            except Exception as e:
+                logger.error(f"Error importing rules: {str(e)}")
+                flash('Error importing rules; no changes were saved.', 'error')
+                return redirect(url_for('import_rules'))
+            
+            # Rebuild the in-memory rules once for the whole import
+            try:
+                from main import sync_rules_with_database
+                sync_rules_with_database()
+            except ImportError:
+                logger.warning("Could not update in-memory rules")
+            
+            flash(f"Imported {summary['inserted']} new and {summary['updated']} updated rules.", 'success')
+            return redirect(url_for('list_rules'))
+        
+        return render_template('import_rules.html', errors=None)
+    
+    @app.route('/rules/export', methods=['GET'])
+    def export_rules():
+        """Stream all response rules as CSV, JSON or NDJSON."""
+        fmt = request.args.get('format', 'csv')
+        if fmt not in rule_io.FORMATS:
+            return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+        
+        mimetypes = {'csv': 'text/csv', 'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+        return Response(
+            stream_with_context(rule_io.export_rules(db.session, fmt)),
+            mimetype=mimetypes[fmt],
+            headers={'Content-Disposition': f'attachment; filename=rules.{fmt}'}
+        )
+    
     @app.route('/logs')
     def view_logs():
-        """Display email processing logs."""
-        logs = EmailLog.query.order_by(EmailLog.processed_at.desc()).all()
-        return render_template('logs.html', logs=logs)
+        """Display email processing logs, newest first, with optional filters."""
+        filters = {
+            'sender': request.args.get('sender', '').strip(),
+            'rule': request.args.get('rule', '').strip(),
+            'sent': request.args.get('sent', ''),
+        }
+        
+        # Each filter is an equality on the leading column of a composite index
+        query = EmailLog.query
+        if filters['sender']:
+            query = query.filter(EmailLog.sender == filters['sender'])
+        if filters['rule'] == GENERIC_RULE_FILTER:
+            query = query.filter(EmailLog.matched_rule.is_(None))
+        elif filters['rule']:
+            query = query.filter(EmailLog.matched_rule == filters['rule'])
+        if filters['sent'] in ('true', 'false'):
+            query = query.filter(EmailLog.response_sent == (filters['sent'] == 'true'))
+            if filters['sent'] == 'false':
+                query = query.filter(EmailLog.suppressed.is_(False))
+        elif filters['sent'] == 'suppressed':
+            query = query.filter(EmailLog.suppressed.is_(True))
+        
+        try:
+            page = paginate_keyset(
+                query, [EmailLog.processed_at, EmailLog.id],
+                after=request.args.get('after'), before=request.args.get('before'),
+                limit=_page_size()
+            )
+        except ValueError:
+            return redirect(url_for('view_logs', **{k: v for k, v in filters.items() if v}))
+        
+        active_filters = {k: v for k, v in filters.items() if v}
+        return render_template('logs.html', logs=page.items, page=page, filters=filters,
+                               active_filters=active_filters, generic_rule=GENERIC_RULE_FILTER)
     
     @app.route('/settings', methods=['GET', 'POST'])
     def settings():
@@ -179,41 +378,52 @@ def register_routes(app):
         
         return render_template('settings.html', env_vars=env_vars)
     
+    @app.before_request
+    def ensure_monitor_supervisor():
+        """Enrol this worker as a monitor candidate on its first request."""
+        get_monitor_supervisor()
+    
     @app.route('/start-monitoring', methods=['POST'])
     def start_monitoring():
-        """Start the email monitoring thread."""
-        global email_thread, stop_thread
+        """Start email monitoring; exactly one worker in the cluster runs it."""
+        supervisor = get_monitor_supervisor()
         
-        if email_thread and email_thread.is_alive():
+        if _monitor_state()['running']:
             flash('Email monitoring is already running!', 'info')
             return redirect(url_for('index'))
         
-        stop_thread = False
-        email_thread = threading.Thread(target=check_emails_periodically)
-        email_thread.daemon = True
-        email_thread.start()
+        if not supervisor.lease.set_enabled(True):
+            flash('Could not start email monitoring. Check the logs for details.', 'error')
+            return redirect(url_for('index'))
+        
+        # Try to take the lease right away instead of waiting for the next heartbeat
+        supervisor.tick()
         
         flash('Email monitoring started successfully!', 'success')
         return redirect(url_for('index'))
     
     @app.route('/stop-monitoring', methods=['POST'])
     def stop_monitoring():
-        """Stop the email monitoring thread."""
-        global stop_thread
+        """Stop email monitoring on whichever worker is running it."""
+        supervisor = get_monitor_supervisor()
         
-        stop_thread = True
+        if not supervisor.lease.set_enabled(False):
+            flash('Could not stop email monitoring. Check the logs for details.', 'error')
+            return redirect(url_for('index'))
+        
+        supervisor.tick()
         flash('Email monitoring will stop after the current cycle.', 'info')
         return redirect(url_for('index'))
     
     @app.route('/check-status', methods=['GET'])
     def check_status():
-        """Check if the email monitoring thread is running."""
-        global email_thread
-        
+        """Report the cluster-wide email monitor state."""
         has_oauth_token = os.path.exists(TOKEN_PICKLE_PATH)
+        monitor = _monitor_state()
         
         status = {
-            'running': email_thread is not None and email_thread.is_alive(),
+            'running': monitor['running'],
+            'monitor': monitor,
             'email_configured': all([
                 os.getenv('EMAIL_USUARIO'),
                 os.getenv('EMAIL_SENHA'),
@@ -225,6 +435,27 @@ def register_routes(app):
         
         return jsonify(status)
     
+    @app.route('/api/metrics', methods=['GET'])
+    def api_metrics():
+        """Return the in-process counters and gauges (cascade stages, etc.)."""
+        from utils.metrics import metrics
+        return jsonify(metrics.snapshot())
+    
+    @app.route('/api/stats', methods=['GET'])
+    def api_stats():
+        """Return the precomputed processing statistics (no database queries).
+        
+        Before the first publish the counters are all zero, so dashboards
+        polling a fresh install get the usual payload.
+        """
+        stats = _get_stats()
+        if stats is None:
+            stats = empty_stats()
+        
+        response = jsonify(stats)
+        response.cache_control.max_age = int(STATS_CACHE_SECONDS)
+        return response
+    
     @app.route('/auth/gmail')
     def auth_gmail():
         """Inicia o fluxo de autenticação OAuth2 com o Gmail."""
@@ -285,35 +516,24 @@ def register_routes(app):
                     flash('Email credentials are not configured. Please check settings.', 'error')
                     return redirect(url_for('index'))
             
-            # Process emails in a separate thread
-            threading.Thread(target=process_emails_once).start()
-            
-            flash('Manual email check started. Results will appear in logs.', 'info')
+            # Runs wherever the monitor lease allows, never alongside another cycle
+            from main import check_now
+            if check_now(get_monitor_supervisor().lease) == 'requested':
+                flash('Manual email check requested from the monitoring worker. Results will appear in logs.', 'info')
+            else:
+                flash('Manual email check started. Results will appear in logs.', 'info')
         except Exception as e:
             logger.error(f"Error in manual check: {str(e)}")
             flash(f'Error checking emails: {str(e)}', 'error')
         
         return redirect(url_for('index'))
 
-def process_emails_once():
-    """Process emails once manually."""
-    from main import process_emails
-    process_emails()
+def run_requested_check():
+    """Run a check that another worker requested through the monitor lease."""
+    from main import check_now
+    check_now()
 
-def check_emails_periodically():
-    """Check for new emails at regular intervals."""
-    global stop_thread
-    
-    from main import process_emails
-    
-    while not stop_thread:
-        try:
-            process_emails()
-            # Wait for 5 minutes before checking again
-            for _ in range(300):  # 5 minutes * 60 seconds
-                if stop_thread:
-                    break
-                time.sleep(1)
-        except Exception as e:
-            logger.error(f"Error in email checking thread: {str(e)}")
-            time.sleep(60)  # Wait 1 minute before retrying if there's an error
\ No newline at end of file
+def check_emails_periodically(stop_event=None):
+    """Run the adaptive polling loop until stop_event is set (see main.poll_emails)."""
+    from main import poll_emails
+    poll_emails(stop_event)
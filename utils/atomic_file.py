@@ -0,0 +1,97 @@
+"""
+Módulo de Gravação Atômica de Arquivos
+
+Este módulo grava arquivos de forma atômica: o conteúdo é escrito em um
+arquivo temporário no mesmo diretório, sincronizado com o disco (fsync) e
+então renomeado sobre o destino. Leitores sempre veem a versão anterior
+completa ou a nova completa, nunca um arquivo truncado.
+
+Para leituras seguidas de gravação (ler, somar, gravar) por mais de um
+processo, ``file_lock`` serializa o acesso com um arquivo de trava ao lado
+do destino.
+"""
+
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas a trava entre threads do processo
+    fcntl = None
+
+# Travas entre threads do mesmo processo, por arquivo
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def atomic_write(path, data, encoding='utf-8'):
+    """
+    Grava ``data`` em ``path`` de forma atômica.
+
+    Args:
+        path (str): Caminho do arquivo de destino
+        data (str|bytes): Conteúdo a gravar
+        encoding (str): Codificação usada quando ``data`` é texto
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    if isinstance(data, str):
+        data = data.encode(encoding)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # Sincronizar o diretório para que a renomeação sobreviva a uma queda de energia
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Trava exclusiva sobre ``path`` entre processos (e entre threads).
+
+    A trava é feita em ``<path>.lock``, que não é substituído pelas
+    gravações atômicas do destino.
+
+    Args:
+        path (str): Caminho do arquivo protegido
+    """
+    lock_path = os.path.abspath(path) + '.lock'
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(lock_path, threading.Lock())
+
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,149 @@
+"""
+Módulo de Cascata de Decisão
+
+Este módulo combina as regras de palavras-chave com o classificador de
+machine learning. A correspondência compilada de palavras-chave roda
+primeiro para todos os e-mails; o classificador só é consultado, em lote,
+para os e-mails sem nenhuma regra correspondente ou com regras em conflito,
+respeitando um orçamento de tempo por ciclo.
+"""
+
+import time
+import logging
+from collections import namedtuple
+
+import regras_email
+from utils.metrics import metrics as default_metrics
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Estágios que podem decidir a resposta de um e-mail
+STAGE_RULE = 'rule'
+STAGE_ML = 'ml'
+STAGE_FALLBACK = 'fallback'
+
+# Decisão tomada para um e-mail
+CascadeDecision = namedtuple('CascadeDecision', ['resposta', 'matched_rule', 'stage', 'confidence'])
+
+
+class ResponseCascade:
+    """
+    Cascata regras → classificador para escolher a resposta de cada e-mail.
+    """
+
+    def __init__(self, classifier=None, latency_budget=2.0, batch_size=32, metrics=None):
+        """
+        Inicializa a cascata.
+
+        Args:
+            classifier: Instância de EmailClassifier, ou None para usar apenas regras
+            latency_budget (float): Tempo máximo, em segundos, gasto com o
+                classificador em cada ciclo
+            batch_size (int): Quantidade de e-mails classificados por chamada ao modelo
+            metrics: Registro de métricas (por padrão, o registro global)
+        """
+        self.classifier = classifier
+        self.latency_budget = latency_budget
+        self.batch_size = max(1, batch_size)
+        self.metrics = metrics or default_metrics
+
+    def _decide(self, stage, regras_encontradas, confidence=None):
+        """Monta a resposta e contabiliza o estágio que decidiu."""
+        resposta, matched_rule = regras_email.montar_resposta(regras_encontradas)
+        self.metrics.incr(f'cascade.{stage}')
+        return CascadeDecision(resposta, matched_rule, stage, confidence)
+
+    def route(self, emails):
+        """
+        Decide a resposta de um lote de e-mails.
+
+        Args:
+            emails (list): Dicionários com as chaves 'assunto' e 'corpo'
+
+        Returns:
+            list: Um CascadeDecision por e-mail, na mesma ordem da entrada
+        """
+        decisions = [None] * len(emails)
+        pending = []
+
+        # Estágio 1: correspondência compilada de palavras-chave
+        for idx, email_data in enumerate(emails):
+            regras_encontradas = regras_email.encontrar_regras(email_data['assunto'], email_data['corpo'])
+
+            if len(regras_encontradas) == 1 or (regras_encontradas and not self.classifier):
+                decisions[idx] = self._decide(STAGE_RULE, regras_encontradas)
+            else:
+                pending.append((idx, regras_encontradas))
+
+        # Estágio 2: classificador em lote para os e-mails não decididos
+        if pending and self.classifier:
+            pending = self._classify_pending(emails, pending, decisions)
+
+        # Estágio 3: resposta combinada (conflito) ou genérica (sem regra)
+        for idx, regras_encontradas in pending:
+            decisions[idx] = self._decide(STAGE_FALLBACK, regras_encontradas)
+
+        return decisions
+
+    def _classify_pending(self, emails, pending, decisions):
+        """
+        Classifica os e-mails pendentes em lotes até esgotar o orçamento de tempo.
+
+        Returns:
+            list: Pendências que o classificador não resolveu
+        """
+        regras_por_chave = {regra['palavra_chave'].lower(): regra for regra in regras_email.REGRAS}
+        unresolved = []
+        started = time.monotonic()
+
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+
+            if time.monotonic() - started >= self.latency_budget:
+                remaining = pending[start:]
+                logger.warning(f"Orçamento do classificador esgotado; {len(remaining)} e-mails usarão a resposta padrão")
+                self.metrics.incr('cascade.budget_exhausted', len(remaining))
+                unresolved.extend(remaining)
+                break
+
+            texts = [f"{emails[idx]['assunto']} {emails[idx]['corpo']}" for idx, _ in batch]
+            batch_started = time.monotonic()
+            predictions = self.classifier.predict_batch(texts)
+            self.metrics.incr('cascade.ml_seconds', time.monotonic() - batch_started)
+            self.metrics.incr('cascade.ml_batches')
+
+            for (idx, regras_encontradas), (predicted, confidence) in zip(batch, predictions):
+                regra = regras_por_chave.get(predicted.lower()) if predicted else None
+
+                # Em conflito, o classificador só pode escolher entre as regras encontradas
+                if regra is not None and (not regras_encontradas or regra in regras_encontradas):
+                    decisions[idx] = self._decide(STAGE_ML, [regra], confidence)
+                else:
+                    unresolved.append((idx, regras_encontradas))
+
+        return unresolved
+
+
+def load_classifier(model_file, threshold=0.6, **options):
+    """
+    Carrega o classificador, se as dependências opcionais de ML estiverem instaladas.
+
+    Args:
+        model_file (str): Caminho para arquivo do modelo treinado
+        threshold (float): Limiar de confiança para classificação
+        **options: Demais opções de EmailClassifier (ex.: feature_cache_dir)
+
+    Returns:
+        EmailClassifier ou None
+    """
+    try:
+        from utils.ml_classifier import EmailClassifier
+    except ImportError as e:
+        logger.warning(f"Dependências de ML indisponíveis ({str(e)}); usando apenas regras")
+        return None
+
+    classifier = EmailClassifier(model_file=model_file, threshold=threshold, **options)
+    if not classifier.is_trained:
+        logger.warning(f"Nenhum modelo treinado em {model_file}; usando apenas regras")
+    return classifier
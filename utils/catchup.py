@@ -0,0 +1,209 @@
+"""
+Módulo de Recuperação de Atraso (Catch-up)
+
+Após um período parado, a caixa de entrada pode acumular muitos e-mails não
+lidos. Este módulo divide esse acúmulo em blocos (chunks) processados um a
+um, até um prazo por ciclo, de modo que cada ciclo tenha duração previsível
+e o restante fique para os ciclos seguintes.
+
+O progresso é gravado em um checkpoint (arquivo JSON, gravação atômica) com
+o UIDVALIDITY da caixa e os UIDs já processados, guardados como intervalos.
+Se o processo for reiniciado no meio do acúmulo, os blocos já concluídos não
+são processados de novo. Uma mudança de UIDVALIDITY (ou de conta) invalida o
+checkpoint.
+
+A ordem do acúmulo é configurável: ``newest`` (mais recentes primeiro) ou
+``oldest`` (mais antigos primeiro). Nos dois casos, os e-mails que chegaram
+depois do ciclo anterior entram no primeiro bloco, para que o acúmulo não
+atrase as mensagens novas.
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+from utils.atomic_file import atomic_write
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Arquivo padrão do checkpoint
+DEFAULT_CHECKPOINT_FILE = 'data/catchup_checkpoint.json'
+
+# Ordens do acúmulo
+ORDER_NEWEST = 'newest'
+ORDER_OLDEST = 'oldest'
+
+# Métrica com a quantidade de e-mails ainda pendentes ao fim do ciclo
+BACKLOG_METRIC = 'catchup.backlog'
+
+
+def to_ranges(uids):
+    """
+    Compacta UIDs em intervalos fechados.
+
+    Args:
+        uids (iterable): UIDs (int)
+
+    Returns:
+        list: Intervalos [início, fim] ordenados e sem sobreposição
+    """
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ranges
+
+
+def _merge_ranges(ranges):
+    """Ordena e une intervalos sobrepostos ou adjacentes."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def plan_chunks(uids, chunk_size, order=ORDER_NEWEST, high_water=None):
+    """
+    Divide os UIDs pendentes em blocos na ordem de processamento.
+
+    Args:
+        uids (list): UIDs pendentes
+        chunk_size (int): UIDs por bloco (0 = um único bloco)
+        order (str): ``newest`` ou ``oldest``
+        high_water (int): Maior UID visto no ciclo anterior; os UIDs acima
+            dele são mensagens novas e vêm primeiro
+
+    Returns:
+        list: Blocos (listas de UIDs)
+    """
+    if order == ORDER_OLDEST:
+        fresh = sorted(uid for uid in uids if high_water is not None and uid > high_water)
+        backlog = sorted(uid for uid in uids if high_water is None or uid <= high_water)
+        ordered = fresh + backlog
+    else:
+        ordered = sorted(uids, reverse=True)
+
+    if not chunk_size or chunk_size <= 0:
+        return [ordered] if ordered else []
+    return [ordered[i:i + chunk_size] for i in range(0, len(ordered), chunk_size)]
+
+
+class CatchupCheckpoint:
+    """
+    Progresso persistido do processamento dos e-mails não lidos.
+    """
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_FILE):
+        """
+        Inicializa o checkpoint, carregando o arquivo se existir.
+
+        Args:
+            path (str): Arquivo do checkpoint
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.mailbox = None
+        self.done = []
+        self.high_water = None
+        self._load()
+
+    def _load(self):
+        """Carrega o checkpoint do arquivo (ignora arquivo ausente ou inválido)."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.mailbox = data.get('mailbox')
+            self.done = _merge_ranges(data.get('done', []))
+            self.high_water = data.get('high_water')
+        except Exception as e:
+            logger.warning(f"Checkpoint {self.path} ignorado: {str(e)}")
+
+    def save(self):
+        """Grava o checkpoint de forma atômica."""
+        with self._lock:
+            data = {
+                'mailbox': self.mailbox,
+                'done': self.done,
+                'high_water': self.high_water,
+                'updated_at': datetime.utcnow().isoformat(),
+            }
+        try:
+            atomic_write(self.path, json.dumps(data))
+        except Exception as e:
+            logger.error(f"Erro ao gravar o checkpoint {self.path}: {str(e)}")
+
+    def begin(self, account, uidvalidity, unread):
+        """
+        Prepara o checkpoint para um ciclo e retorna os UIDs ainda pendentes.
+
+        Um checkpoint de outra conta ou de outro UIDVALIDITY é descartado.
+        Os intervalos abaixo do menor UID não lido são esquecidos, pois essas
+        mensagens já não estão pendentes.
+
+        Args:
+            account (str): Conta de e-mail
+            uidvalidity (int): UIDVALIDITY da caixa selecionada
+            unread (list): UIDs não lidos
+
+        Returns:
+            list: UIDs não lidos ainda não processados
+        """
+        mailbox = f"{account}:{uidvalidity}"
+        with self._lock:
+            if uidvalidity is None or mailbox != self.mailbox:
+                if self.mailbox is not None:
+                    logger.info(f"Checkpoint reiniciado (caixa {self.mailbox} -> {mailbox})")
+                self.mailbox = mailbox if uidvalidity is not None else None
+                self.done = []
+                self.high_water = None
+
+            if unread:
+                lowest = min(unread)
+                self.done = [[max(start, lowest), end] for start, end in self.done if end >= lowest]
+            else:
+                self.done = []
+
+            return [uid for uid in unread if not self._contains(uid)]
+
+    def _contains(self, uid):
+        """True se o UID já foi processado (deve ser chamado com o lock adquirido)."""
+        for start, end in self.done:
+            if start <= uid <= end:
+                return True
+            if start > uid:
+                break
+        return False
+
+    def mark_done(self, uids):
+        """
+        Registra UIDs como processados.
+
+        Args:
+            uids (iterable): UIDs processados
+        """
+        uids = list(uids)
+        if not uids:
+            return
+        with self._lock:
+            self.done = _merge_ranges(self.done + to_ranges(uids))
+
+    def set_high_water(self, uid):
+        """
+        Registra o maior UID visto no ciclo.
+
+        Args:
+            uid (int): Maior UID não lido do ciclo
+        """
+        with self._lock:
+            if uid is not None and (self.high_water is None or uid > self.high_water):
+                self.high_water = uid
@@ -7,6 +7,7 @@ reading emails, and sending responses.
 
 import imaplib
 import email
+import email.parser
 import smtplib
 import logging
 import re
@@ -17,6 +18,10 @@ from email.header import decode_header
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Header fields always fetched in the header-first phase (enough to identify
+# the message and answer from the subject); filters may ask for more
+CABECALHOS_TRIAGEM = ('FROM', 'SUBJECT', 'DATE', 'MESSAGE-ID')
+
 class EmailHandler:
     """
     A class to handle email operations including connection,
@@ -40,6 +45,7 @@ class EmailHandler:
         self.servidor_smtp = servidor_smtp
         self.porta_smtp = porta_smtp
         self.imap = None
+        self.uidvalidity = None
     
     def conectar_email(self):
         """
@@ -53,6 +59,10 @@ class EmailHandler:
             self.imap = imaplib.IMAP4_SSL(self.servidor_imap)
             self.imap.login(self.email_usuario, self.email_senha)
             self.imap.select('INBOX')
+            
+            # UIDs are only stable while UIDVALIDITY stays the same
+            _, dados = self.imap.response('UIDVALIDITY')
+            self.uidvalidity = int(dados[0]) if dados and dados[0] else None
             logger.info(f"IMAP connection established to {self.servidor_imap}")
             return True
         except Exception as e:
@@ -64,11 +74,11 @@ class EmailHandler:
         Search for unread emails in the inbox.
         
         Returns:
-            list: List of email IDs for unread messages
+            list: UIDs (int) of the unread messages, in ascending order
         """
         try:
-            status, mensagens = self.imap.search(None, 'UNSEEN')
-            return mensagens[0].split() if status == 'OK' else []
+            status, mensagens = self.imap.uid('SEARCH', None, 'UNSEEN')
+            return sorted(int(uid) for uid in mensagens[0].split()) if status == 'OK' else []
         except Exception as e:
             logger.error(f"Error searching for unread emails: {str(e)}")
             return []
@@ -107,28 +117,61 @@ class EmailHandler:
         Fetch and extract data from a specific email.
         
         Args:
-            num: The email ID to fetch
+            num: The email UID to fetch
+            
+        Returns:
+            dict: A dictionary containing email data (remetente, assunto, corpo,
+                message_id, data)
+        """
+        raw = self.buscar_email_bruto(num)
+        return self.analisar_email(raw) if raw is not None else None
+    
+    def buscar_email_bruto(self, num):
+        """
+        Fetch the raw RFC822 bytes of a specific email (network only).
+        
+        Uses the handler's IMAP connection, so calls must not run concurrently.
+        
+        Args:
+            num: The email UID to fetch
             
         Returns:
-            dict: A dictionary containing email data (remetente, assunto, corpo)
+            bytes: The raw message, or None if the fetch failed
         """
         try:
-            status, dados = self.imap.fetch(num, '(RFC822)')
+            status, dados = self.imap.uid('FETCH', str(num), '(RFC822)')
             
             if status != 'OK':
                 logger.error(f"Error fetching email {num}: {status}")
                 return None
             
-            mensagem = email.message_from_bytes(dados[0][1])
+            # No data when the message was expunged since the search
+            if not dados or not isinstance(dados[0], tuple):
+                logger.warning(f"Email {num} is no longer in the mailbox")
+                return None
             
-            # Get and decode sender and subject
-            remetente = self._decode_email_header(mensagem['From'])
-            assunto = self._decode_email_header(mensagem['Subject'])
+            return dados[0][1]
             
-            # Extract the actual email address from "Name <email@example.com>" format
-            match = re.search(r'<([^>]+)>', remetente)
-            if match:
-                remetente = match.group(1)
+        except Exception as e:
+            logger.error(f"Error fetching email {num}: {str(e)}")
+            return None
+    
+    def analisar_email(self, raw):
+        """
+        Parse raw message bytes into the email data dictionary (CPU only).
+        
+        Does not touch the IMAP connection, so it is safe to call from several threads.
+        
+        Args:
+            raw (bytes): The raw RFC822 message
+            
+        Returns:
+            dict: A dictionary containing email data (remetente, assunto, corpo,
+                message_id, data), or None if parsing failed
+        """
+        try:
+            mensagem = email.message_from_bytes(raw)
+            dados = self._dados_cabecalho(mensagem)
             
             # Extract email body (plain text preferred, HTML as fallback)
             corpo = ""
@@ -167,16 +210,132 @@ class EmailHandler:
                     logger.warning(f"Error decoding email body: {str(e)}")
                     corpo = mensagem.get_payload(decode=True).decode('latin-1', errors='ignore')
             
-            return {
-                'remetente': remetente,
-                'assunto': assunto,
-                'corpo': corpo
-            }
+            dados['corpo'] = corpo
+            return dados
             
         except Exception as e:
             logger.error(f"Error extracting email data: {str(e)}")
             return None
     
+    def _dados_cabecalho(self, mensagem):
+        """
+        Extract the header fields used by the processing from a parsed message.
+        
+        Args:
+            mensagem (email.message.Message): Parsed message (headers only is enough)
+            
+        Returns:
+            dict: remetente, assunto, message_id and data
+        """
+        # Get and decode sender and subject
+        remetente = self._decode_email_header(mensagem['From'])
+        assunto = self._decode_email_header(mensagem['Subject'])
+        
+        # Extract the actual email address from "Name <email@example.com>" format
+        match = re.search(r'<([^>]+)>', remetente)
+        if match:
+            remetente = match.group(1)
+        
+        return {
+            'remetente': remetente,
+            'assunto': assunto,
+            'message_id': (mensagem['Message-ID'] or '').strip(),
+            'data': (mensagem['Date'] or '').strip()
+        }
+    
+    def buscar_cabecalhos(self, uids, campos=CABECALHOS_TRIAGEM):
+        """
+        Fetch the size and selected header fields of several emails in one command.
+        
+        Uses BODY.PEEK, so the messages stay unread. Uses the handler's IMAP
+        connection, so calls must not run concurrently.
+        
+        Args:
+            uids (list): Email UIDs
+            campos (tuple): Header field names to fetch
+            
+        Returns:
+            dict: {uid: (header bytes, full message size)}; UIDs missing from
+                the answer (e.g. expunged) are left out
+        """
+        if not uids:
+            return {}
+        
+        try:
+            status, dados = self.imap.uid(
+                'FETCH', ','.join(str(uid) for uid in uids),
+                f"(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS ({' '.join(campos)})])"
+            )
+            if status != 'OK':
+                logger.error(f"Error fetching email headers: {status}")
+                return {}
+        except Exception as e:
+            logger.error(f"Error fetching email headers: {str(e)}")
+            return {}
+        
+        cabecalhos = {}
+        for idx, item in enumerate(dados):
+            if not isinstance(item, tuple):
+                continue
+            
+            # Attributes may come before the header literal or right after it
+            atributos = item[0]
+            if idx + 1 < len(dados) and isinstance(dados[idx + 1], bytes):
+                atributos += dados[idx + 1]
+            
+            uid = re.search(rb'UID (\d+)', atributos)
+            tamanho = re.search(rb'RFC822\.SIZE (\d+)', atributos)
+            if uid:
+                cabecalhos[int(uid.group(1))] = (item[1], int(tamanho.group(1)) if tamanho else None)
+        
+        return cabecalhos
+    
+    def analisar_cabecalhos(self, raw_cabecalhos):
+        """
+        Parse the headers into the email data dictionary, without a body (CPU only).
+        
+        Only the header section is parsed, so full messages are cheap too.
+        
+        Args:
+            raw_cabecalhos (bytes): Header fields returned by buscar_cabecalhos,
+                or a full raw message
+            
+        Returns:
+            dict: Same keys as analisar_email, with an empty corpo and the raw
+                header values in 'cabecalhos' (lowercase names), or None if
+                parsing failed
+        """
+        try:
+            mensagem = email.parser.BytesHeaderParser().parsebytes(raw_cabecalhos)
+            dados = self._dados_cabecalho(mensagem)
+            dados['corpo'] = ''
+            dados['cabecalhos'] = {nome.lower(): str(valor) for nome, valor in mensagem.items()}
+            return dados
+        except Exception as e:
+            logger.error(f"Error parsing email headers: {str(e)}")
+            return None
+    
+    def marcar_lidos(self, uids):
+        """
+        Mark emails as read (e.g. answered from their headers, whose body was never fetched).
+        
+        Uses the handler's IMAP connection, so calls must not run concurrently.
+        
+        Args:
+            uids (list): Email UIDs
+            
+        Returns:
+            bool: True if the flags were set, False otherwise
+        """
+        if not uids:
+            return True
+        try:
+            status, _ = self.imap.uid('STORE', ','.join(str(uid) for uid in uids), '+FLAGS', '(\\Seen)')
+            return status == 'OK'
+        except Exception as e:
+            logger.error(f"Error marking emails as read: {str(e)}")
+            return False
+    
     def enviar_resposta_email(self, destinatario, assunto_original, mensagem):
         """
         Send an email response.
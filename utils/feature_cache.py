@@ -0,0 +1,375 @@
+"""
+Módulo de Cache de Vetores de Características
+
+Este módulo implementa um cache em disco dos vetores de contagem de termos
+de cada mensagem, indexado pelo hash do conteúdo. Os vetores são guardados
+em formato esparso compacto (índices e contagens int32) em um banco SQLite,
+num espaço de termos estável e apenas crescente. Assim o mesmo vetor serve
+para qualquer retreinamento e para qualquer versão do modelo, desde que a
+configuração do analisador (tokenização, acentos, n-gramas) não mude: o
+arquivo do cache é vinculado a essa configuração e descartado quando ela muda.
+
+A consulta de mensagens já presentes no cache é apenas leitura: o horário
+de uso é acumulado em memória e gravado junto com a próxima escrita (ou a
+cada ``TOUCH_FLUSH_EVERY`` consultas). A remoção também apaga os termos que
+nenhum vetor usa mais; como os ids removidos não são reaproveitados, cada
+remoção de termos incrementa a geração do dicionário (``generation``), e
+quem guardou ids de termos (ex.: o vocabulário de um modelo) deve mapeá-los
+de novo.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import Counter
+
+import numpy as np
+import sklearn
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Versão do formato armazenado; incrementar invalida caches existentes
+CACHE_FORMAT_VERSION = 1
+
+# Quantidade de gravações entre execuções da política de remoção
+EVICTION_CHECK_EVERY = 500
+
+# Quantidade de horários de uso acumulados antes de gravá-los
+TOUCH_FLUSH_EVERY = 1000
+
+
+def content_hash(text):
+    """Hash estável do conteúdo de uma mensagem."""
+    return hashlib.blake2b((text or '').encode('utf-8'), digest_size=16).hexdigest()
+
+
+class FeatureCache:
+    """
+    Cache persistente de vetores esparsos de contagem de termos.
+    """
+
+    def __init__(self, cache_dir, analyzer_params, max_bytes=64 * 1024 * 1024,
+                 max_age_days=30):
+        """
+        Inicializa o cache.
+
+        Args:
+            cache_dir (str): Diretório dos arquivos do cache
+            analyzer_params (dict): Parâmetros de análise de texto do
+                CountVectorizer (ex.: strip_accents, lowercase, ngram_range)
+            max_bytes (int): Tamanho máximo dos vetores armazenados
+            max_age_days (float): Idade máxima, desde o último uso, de uma entrada
+        """
+        self.cache_dir = cache_dir
+        self.analyzer_params = dict(analyzer_params)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 86400
+        self.version = self._compute_version(self.analyzer_params)
+        self.path = os.path.join(cache_dir, f"features-{self.version}.sqlite")
+
+        self._analyzer = CountVectorizer(**self.analyzer_params).build_analyzer()
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        # Horários de uso das entradas lidas, ainda não gravados (hash -> horário)
+        self._pending_touches = {}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._remove_stale_versions()
+
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY AUTOINCREMENT, term TEXT UNIQUE NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "hash TEXT PRIMARY KEY, indices BLOB NOT NULL, counts BLOB NOT NULL, "
+            "nbytes INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_vectors_accessed_at ON vectors (accessed_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('term_generation', 0)")
+        self._conn.commit()
+
+        # Dicionário de termos em memória (termo -> id); os ids são atribuídos
+        # pelo SQLite, então processos diferentes sempre concordam entre si
+        self._terms = {}
+        self._names = {}
+        self.generation = None
+        self._sync_terms()
+
+        self.evict()
+
+    @staticmethod
+    def _compute_version(analyzer_params):
+        """Identificador da configuração de análise que gerou os vetores."""
+        payload = json.dumps({
+            'params': {k: list(v) if isinstance(v, tuple) else v for k, v in analyzer_params.items()},
+            'sklearn': '.'.join(sklearn.__version__.split('.')[:2]),
+            'format': CACHE_FORMAT_VERSION,
+        }, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+    def _remove_stale_versions(self):
+        """Remove arquivos de cache gerados com outra configuração de análise."""
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('features-') and not name.startswith(f"features-{self.version}."):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    logger.info(f"Cache de características obsoleto removido: {name}")
+                except OSError as e:
+                    logger.warning(f"Não foi possível remover cache obsoleto {name}: {str(e)}")
+
+    def _refresh_terms(self):
+        """Carrega termos registrados por outros processos."""
+        last_id = max(self._names, default=0)
+        for term_id, term in self._conn.execute("SELECT id, term FROM terms WHERE id > ?", (last_id,)):
+            self._terms[term] = term_id
+            self._names[term_id] = term
+
+    def _sync_terms(self):
+        """Recarrega o dicionário de termos se outro processo removeu termos."""
+        generation = self._conn.execute("SELECT value FROM meta WHERE key = 'term_generation'").fetchone()[0]
+        if generation != self.generation:
+            self._terms.clear()
+            self._names.clear()
+            self._refresh_terms()
+            self.generation = generation
+
+    def _begin_write(self):
+        """Inicia uma transação de escrita com o dicionário de termos atualizado.
+
+        A transação é exclusiva entre processos, então nenhum termo usado
+        pelos vetores gravados nela pode ser removido ao mesmo tempo.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._sync_terms()
+
+    def _flush_touches(self):
+        """Grava os horários de uso acumulados (dentro de uma transação de escrita)."""
+        if self._pending_touches:
+            self._conn.executemany("UPDATE vectors SET accessed_at = ? WHERE hash = ?",
+                                   [(accessed_at, key) for key, accessed_at in self._pending_touches.items()])
+            self._pending_touches.clear()
+
+    def term_ids(self, terms):
+        """
+        Obtém (registrando, se necessário) o id de cada termo.
+
+        Args:
+            terms (iterable): Termos
+
+        Returns:
+            np.ndarray: Ids na mesma ordem dos termos
+        """
+        terms = list(terms)
+        with self._lock:
+            self._sync_terms()
+            if any(term not in self._terms for term in terms):
+                self._begin_write()
+                try:
+                    for term in terms:
+                        self._term_id(term)
+                    self._conn.commit()
+                except BaseException:
+                    self._conn.rollback()
+                    raise
+            ids = [self._terms[term] for term in terms]
+        return np.asarray(ids, dtype=np.int64)
+
+    def _term_id(self, term):
+        """Id de um termo, registrando-o no dicionário persistente se for novo."""
+        term_id = self._terms.get(term)
+        if term_id is None:
+            self._conn.execute("INSERT OR IGNORE INTO terms (term) VALUES (?)", (term,))
+            term_id = self._conn.execute("SELECT id FROM terms WHERE term = ?", (term,)).fetchone()[0]
+            self._terms[term] = term_id
+            self._names[term_id] = term
+        return term_id
+
+    def term_names(self, ids):
+        """
+        Obtém os termos correspondentes a uma lista de ids.
+
+        Args:
+            ids (iterable): Ids de termos
+
+        Returns:
+            list: Termos na mesma ordem dos ids
+        """
+        with self._lock:
+            self._sync_terms()
+            if any(int(term_id) not in self._names for term_id in ids):
+                self._refresh_terms()
+            return [self._names[int(term_id)] for term_id in ids]
+
+    def count_matrix(self, texts, min_columns=0):
+        """
+        Obtém a matriz de contagens dos textos, consultando o cache antes de analisar.
+
+        Quando todos os textos estão no cache, nada é gravado no banco.
+
+        Args:
+            texts (list): Textos das mensagens
+            min_columns (int): Largura mínima da matriz retornada
+
+        Returns:
+            scipy.sparse.csr_matrix: Matriz (textos x ids de termos); a
+            coluna de cada termo é o seu id
+        """
+        hashes = [content_hash(text) for text in texts]
+        now = time.time()
+
+        with self._lock:
+            # Consultar o cache em lotes (limite de parâmetros do SQLite)
+            unique_hashes = list(dict.fromkeys(hashes))
+            found = {}
+            for start in range(0, len(unique_hashes), 500):
+                chunk = unique_hashes[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for key, indices, counts in self._conn.execute(
+                        f"SELECT hash, indices, counts FROM vectors WHERE hash IN ({placeholders})", chunk):
+                    found[key] = (np.frombuffer(indices, dtype=np.int32), np.frombuffer(counts, dtype=np.int32))
+
+            for key in found:
+                self._pending_touches[key] = now
+
+            missing = [idx for idx, key in enumerate(hashes) if key not in found]
+            if missing or len(self._pending_touches) >= TOUCH_FLUSH_EVERY:
+                self._begin_write()
+                try:
+                    # Analisar apenas as mensagens ausentes do cache
+                    new_entries = []
+                    for idx in missing:
+                        key = hashes[idx]
+                        if key in found:
+                            continue
+                        term_counts = Counter(self._analyzer(texts[idx] or ''))
+                        indices = np.asarray([self._term_id(term) for term in term_counts], dtype=np.int32)
+                        counts = np.asarray(list(term_counts.values()), dtype=np.int32)
+                        found[key] = (indices, counts)
+                        new_entries.append((key, indices.tobytes(), counts.tobytes(),
+                                            indices.nbytes + counts.nbytes, now))
+
+                    if new_entries:
+                        self._conn.executemany(
+                            "INSERT OR REPLACE INTO vectors (hash, indices, counts, nbytes, accessed_at) "
+                            "VALUES (?, ?, ?, ?, ?)", new_entries
+                        )
+                        self._writes_since_eviction += len(new_entries)
+
+                    self._flush_touches()
+                    self._conn.commit()
+                except BaseException:
+                    self._conn.rollback()
+                    raise
+
+            rows = [found[key] for key in hashes]
+
+        if self._writes_since_eviction >= EVICTION_CHECK_EVERY:
+            self.evict()
+
+        return self._to_csr(rows, min_columns)
+
+    @staticmethod
+    def _to_csr(rows, min_columns=0):
+        """Monta uma matriz CSR a partir de pares (índices, contagens)."""
+        n_columns = max([min_columns] + [int(r[0].max()) + 1 for r in rows if len(r[0])])
+
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        for idx, (indices, _) in enumerate(rows):
+            indptr[idx + 1] = indptr[idx] + len(indices)
+
+        indices = np.concatenate([r[0] for r in rows]) if rows else np.zeros(0, dtype=np.int32)
+        data = np.concatenate([r[1] for r in rows]) if rows else np.zeros(0, dtype=np.int32)
+
+        matrix = sparse.csr_matrix((data.astype(np.int64), indices, indptr), shape=(len(rows), n_columns))
+        matrix.sort_indices()
+        return matrix
+
+    def evict(self):
+        """
+        Aplica a política de remoção: primeiro por idade, depois por tamanho.
+        Em seguida, remove os termos que nenhum vetor restante usa.
+
+        Returns:
+            int: Quantidade de entradas removidas
+        """
+        with self._lock:
+            self._writes_since_eviction = 0
+            self._begin_write()
+            try:
+                self._flush_touches()
+                removed = self._conn.execute(
+                    "DELETE FROM vectors WHERE accessed_at < ?", (time.time() - self.max_age_seconds,)
+                ).rowcount
+
+                total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM vectors").fetchone()[0]
+                if total > self.max_bytes:
+                    # Remover as entradas usadas há mais tempo até caber no limite
+                    excess = total - self.max_bytes
+                    victims = []
+                    for key, nbytes in self._conn.execute("SELECT hash, nbytes FROM vectors ORDER BY accessed_at"):
+                        if excess <= 0:
+                            break
+                        victims.append((key,))
+                        excess -= nbytes
+                    self._conn.executemany("DELETE FROM vectors WHERE hash = ?", victims)
+                    removed += len(victims)
+
+                orphans = self._remove_orphan_terms()
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+            if orphans:
+                self._sync_terms()
+
+        if removed or orphans:
+            logger.info(f"Removidas {removed} entradas e {orphans} termos do cache de características")
+        return removed
+
+    def _remove_orphan_terms(self):
+        """Remove os termos sem vetores (dentro da transação de escrita) e avança a geração."""
+        used = set()
+        for (indices,) in self._conn.execute("SELECT indices FROM vectors"):
+            used.update(np.frombuffer(indices, dtype=np.int32).tolist())
+
+        orphans = [(term_id,) for (term_id,) in self._conn.execute("SELECT id FROM terms") if term_id not in used]
+        if orphans:
+            self._conn.executemany("DELETE FROM terms WHERE id = ?", orphans)
+            self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'term_generation'")
+        return len(orphans)
+
+    def stats(self):
+        """
+        Retorna estatísticas do cache.
+
+        Returns:
+            dict: Entradas, bytes armazenados e termos conhecidos
+        """
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM vectors"
+            ).fetchone()
+        return {'version': self.version, 'entries': entries, 'bytes': total, 'terms': len(self._terms)}
+
+    def close(self):
+        """Grava os horários de uso pendentes e fecha a conexão com o banco do cache."""
+        with self._lock:
+            if self._pending_touches:
+                try:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    self._flush_touches()
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Não foi possível gravar os horários de uso do cache: {str(e)}")
+            self._conn.close()
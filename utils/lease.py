@@ -0,0 +1,423 @@
+"""
+Módulo de Concessão (Lease) do Monitoramento
+
+Este módulo garante que apenas um processo execute o monitoramento de
+e-mails por vez, mesmo com vários workers do Gunicorn (ou várias máquinas)
+compartilhando o mesmo banco. A concessão é uma linha da tabela
+``monitor_lease``: quem a detém precisa renová-la periodicamente (heartbeat);
+se o detentor parar de renovar, outro processo assume assim que ela expira.
+
+A mesma linha guarda o estado desejado (``enabled``), de modo que iniciar ou
+parar o monitoramento em qualquer worker vale para todo o cluster, e
+qualquer worker consegue informar quem está monitorando. Ela também
+registra pedidos de verificação imediata (``run_requested``) feitos em um
+processo que não detém a concessão, atendidos pelo detentor.
+
+Os prazos usam o relógio de cada processo; com várias máquinas, os relógios
+devem estar sincronizados (NTP) com folga bem menor que o TTL.
+"""
+
+import os
+import uuid
+import socket
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, update, or_
+from sqlalchemy.exc import IntegrityError
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Nome da concessão do monitoramento de e-mails
+MONITOR_LEASE = 'email-monitor'
+
+
+def default_holder_id():
+    """
+    Identificador único deste processo como detentor de concessões.
+
+    Returns:
+        str: host:pid:sufixo aleatório
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Lease:
+    """
+    Concessão exclusiva, com prazo, armazenada no banco.
+    """
+
+    def __init__(self, engine, name=MONITOR_LEASE, holder=None, ttl=60.0):
+        """
+        Inicializa a concessão.
+
+        Args:
+            engine: Engine do SQLAlchemy
+            name (str): Nome da concessão
+            holder (str): Identificador deste processo (padrão: default_holder_id())
+            ttl (float): Validade, em segundos, de cada aquisição ou renovação
+        """
+        self.engine = engine
+        self.name = name
+        self.holder = holder or default_holder_id()
+        self.ttl = timedelta(seconds=ttl)
+        self._row_created = False
+
+    def _table(self):
+        """Tabela das concessões."""
+        from models import MonitorLease
+        return MonitorLease.__table__
+
+    def _ensure_row(self):
+        """Cria a linha da concessão, se ainda não existir."""
+        if self._row_created:
+            return
+
+        table = self._table()
+        try:
+            with self.engine.begin() as connection:
+                exists = connection.execute(select(table.c.name).where(table.c.name == self.name)).first()
+                if exists is None:
+                    connection.execute(insert(table).values(name=self.name, enabled=False))
+        except IntegrityError:
+            # Outro processo criou a linha ao mesmo tempo
+            pass
+        self._row_created = True
+
+    def acquire(self):
+        """
+        Tenta obter (ou renovar) a concessão.
+
+        A atualização é condicional: só tem efeito se a concessão estiver
+        livre, expirada ou já for deste processo, de modo que dois processos
+        nunca a obtêm ao mesmo tempo.
+
+        Returns:
+            bool: True se este processo detém a concessão
+        """
+        table = self._table()
+        now = datetime.utcnow()
+        try:
+            self._ensure_row()
+            with self.engine.begin() as connection:
+                acquired = connection.execute(
+                    update(table)
+                    .where(
+                        table.c.name == self.name,
+                        or_(table.c.holder.is_(None), table.c.holder == self.holder,
+                            table.c.expires_at.is_(None), table.c.expires_at < now)
+                    )
+                    .values(holder=self.holder, acquired_at=now, renewed_at=now, expires_at=now + self.ttl,
+                            run_requested=False)
+                ).rowcount
+        except Exception as e:
+            logger.error(f"Erro ao obter a concessão {self.name}: {str(e)}")
+            return False
+
+        if acquired:
+            logger.info(f"Concessão {self.name} obtida por {self.holder}")
+        return bool(acquired)
+
+    def renew(self):
+        """
+        Renova a concessão (heartbeat).
+
+        Returns:
+            bool: True se a concessão ainda é deste processo
+        """
+        table = self._table()
+        now = datetime.utcnow()
+        try:
+            with self.engine.begin() as connection:
+                renewed = connection.execute(
+                    update(table)
+                    .where(table.c.name == self.name, table.c.holder == self.holder)
+                    .values(renewed_at=now, expires_at=now + self.ttl)
+                ).rowcount
+        except Exception as e:
+            logger.error(f"Erro ao renovar a concessão {self.name}: {str(e)}")
+            return False
+
+        if not renewed:
+            logger.warning(f"Concessão {self.name} perdida por {self.holder}")
+        return bool(renewed)
+
+    @contextmanager
+    def keep_alive(self, interval=None):
+        """
+        Renova a concessão em segundo plano enquanto o bloco é executado.
+
+        Args:
+            interval (float): Intervalo, em segundos, entre renovações
+                (padrão: um terço do TTL)
+
+        Yields:
+            threading.Event: Sinalizado quando uma renovação falha; a
+                concessão pode ter passado a outro processo e o trabalho deve parar
+        """
+        lost = threading.Event()
+        done = threading.Event()
+        interval = interval or self.ttl.total_seconds() / 3
+
+        def heartbeat():
+            while not done.wait(interval):
+                if not self.renew():
+                    lost.set()
+                    return
+
+        thread = threading.Thread(target=heartbeat, name=f"{self.name}-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            done.set()
+            thread.join()
+
+    def release(self):
+        """
+        Libera a concessão, se for deste processo.
+
+        Returns:
+            bool: True se a concessão foi liberada
+        """
+        table = self._table()
+        try:
+            with self.engine.begin() as connection:
+                released = connection.execute(
+                    update(table)
+                    .where(table.c.name == self.name, table.c.holder == self.holder)
+                    .values(holder=None, expires_at=None)
+                ).rowcount
+        except Exception as e:
+            logger.error(f"Erro ao liberar a concessão {self.name}: {str(e)}")
+            return False
+
+        if released:
+            logger.info(f"Concessão {self.name} liberada por {self.holder}")
+        return bool(released)
+
+    def request_run(self):
+        """
+        Pede ao detentor da concessão uma verificação imediata.
+
+        Returns:
+            bool: True se o pedido foi gravado
+        """
+        table = self._table()
+        try:
+            self._ensure_row()
+            with self.engine.begin() as connection:
+                connection.execute(update(table).where(table.c.name == self.name).values(run_requested=True))
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao pedir uma verificação à concessão {self.name}: {str(e)}")
+            return False
+
+    def take_run_request(self):
+        """
+        Consome o pedido de verificação imediata, se este processo for o detentor.
+
+        Returns:
+            bool: True se havia um pedido para este processo atender
+        """
+        table = self._table()
+        try:
+            with self.engine.begin() as connection:
+                taken = connection.execute(
+                    update(table)
+                    .where(table.c.name == self.name, table.c.holder == self.holder,
+                           table.c.run_requested.is_(True))
+                    .values(run_requested=False)
+                ).rowcount
+        except Exception as e:
+            logger.error(f"Erro ao consumir o pedido de verificação da concessão {self.name}: {str(e)}")
+            return False
+        return bool(taken)
+
+    def set_enabled(self, enabled):
+        """
+        Define o estado desejado, válido para todos os processos.
+
+        Args:
+            enabled (bool): Se o monitoramento deve estar em execução
+
+        Returns:
+            bool: True se o estado foi gravado
+        """
+        table = self._table()
+        try:
+            self._ensure_row()
+            with self.engine.begin() as connection:
+                connection.execute(update(table).where(table.c.name == self.name).values(enabled=enabled))
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao alterar o estado da concessão {self.name}: {str(e)}")
+            return False
+
+    def state(self):
+        """
+        Estado atual da concessão, visto do banco.
+
+        Returns:
+            dict: enabled, active (há um detentor com prazo válido), holder,
+                is_holder (o detentor é este processo), run_requested,
+                acquired_at, renewed_at e expires_at
+        """
+        table = self._table()
+        with self.engine.connect() as connection:
+            row = connection.execute(select(table).where(table.c.name == self.name)).mappings().first()
+
+        if row is None:
+            return {'enabled': False, 'active': False, 'holder': None, 'is_holder': False,
+                    'run_requested': False, 'acquired_at': None, 'renewed_at': None, 'expires_at': None}
+
+        active = row['holder'] is not None and row['expires_at'] is not None \
+            and row['expires_at'] >= datetime.utcnow()
+        return {
+            'enabled': bool(row['enabled']),
+            'active': active,
+            'holder': row['holder'] if active else None,
+            'is_holder': active and row['holder'] == self.holder,
+            'run_requested': bool(row['run_requested']),
+            'acquired_at': row['acquired_at'],
+            'renewed_at': row['renewed_at'],
+            'expires_at': row['expires_at'],
+        }
+
+
+class LeaseSupervisor:
+    """
+    Executa uma tarefa contínua apenas enquanto este processo detém a concessão.
+
+    Cada processo candidato mantém um supervisor. A cada intervalo, o
+    supervisor do detentor renova a concessão; os demais tentam obtê-la se o
+    estado desejado for "em execução". Ao perder a concessão (ou quando o
+    estado desejado passa a ser "parado"), a tarefa recebe o pedido de parada.
+    O detentor também atende, a cada verificação, os pedidos de execução
+    imediata registrados na concessão por outros processos.
+    """
+
+    def __init__(self, lease, target, interval=None, on_run_request=None):
+        """
+        Inicializa o supervisor (sem iniciar a thread).
+
+        Args:
+            lease (Lease): Concessão disputada
+            target (callable): Tarefa; recebe um threading.Event sinalizado
+                quando ela deve parar
+            interval (float): Intervalo, em segundos, entre verificações
+                (padrão: um terço do TTL da concessão)
+            on_run_request (callable): Chamado no detentor quando outro
+                processo pede uma execução imediata
+        """
+        self.lease = lease
+        self.target = target
+        self.interval = interval or lease.ttl.total_seconds() / 3
+        self.on_run_request = on_run_request
+        self._lock = threading.Lock()
+        self._shutdown = threading.Event()
+        self._thread = None
+        self._worker = None
+        self._worker_stop = None
+
+    def start(self):
+        """Inicia a thread do supervisor (sem efeito se já iniciada)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='lease-supervisor', daemon=True)
+            self._thread.start()
+        atexit.register(self.shutdown)
+
+    def _run(self):
+        """Laço da thread do supervisor."""
+        while not self._shutdown.is_set():
+            self.tick()
+            self._shutdown.wait(self.interval)
+
+    @property
+    def running_locally(self):
+        """True se a tarefa está em execução neste processo."""
+        return self._worker is not None and self._worker.is_alive()
+
+    def _start_worker(self):
+        """Inicia a tarefa em uma nova thread."""
+        self._worker_stop = threading.Event()
+        self._worker = threading.Thread(target=self.target, args=(self._worker_stop,),
+                                        name=f"{self.lease.name}-worker", daemon=True)
+        self._worker.start()
+
+    def _stop_worker(self):
+        """Pede a parada da tarefa (ela termina após o ciclo em andamento)."""
+        if self._worker_stop is not None:
+            self._worker_stop.set()
+
+    def tick(self):
+        """
+        Renova ou disputa a concessão e inicia ou para a tarefa conforme o resultado.
+        """
+        with self._lock:
+            if self._shutdown.is_set():
+                return
+
+            try:
+                state = self.lease.state()
+                enabled = state['enabled']
+            except Exception as e:
+                logger.error(f"Erro ao consultar a concessão {self.lease.name}: {str(e)}")
+                return
+
+            if self.running_locally:
+                if not enabled:
+                    self._stop_worker()
+                    self.lease.release()
+                elif not self.lease.renew():
+                    # Outro processo assumiu (ex.: este ficou sem renovar por mais que o TTL)
+                    self._stop_worker()
+                elif state['run_requested'] and self.on_run_request is not None \
+                        and self.lease.take_run_request():
+                    self.on_run_request()
+            elif enabled:
+                if self.lease.acquire():
+                    self._start_worker()
+            elif self._worker is not None:
+                # A tarefa terminou e o monitoramento foi parado
+                self._worker = None
+                self.lease.release()
+
+    def join(self, timeout=None):
+        """
+        Espera a tarefa terminar (ex.: o ciclo em andamento após shutdown()).
+
+        Args:
+            timeout (float): Tempo máximo de espera, em segundos
+
+        Returns:
+            bool: True se a tarefa não está mais em execução
+        """
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+        return not self.running_locally
+
+    def shutdown(self, timeout=10.0):
+        """
+        Para a tarefa e o supervisor e libera a concessão para outro processo.
+
+        A concessão só é liberada depois que o ciclo em andamento termina (ou
+        o tempo de espera se esgota), para que outro processo não comece
+        enquanto este ainda processa.
+
+        Args:
+            timeout (float): Tempo máximo de espera pelo fim da tarefa, em segundos
+        """
+        self._shutdown.set()
+        with self._lock:
+            self._stop_worker()
+        self.join(timeout)
+        with self._lock:
+            if self._worker is not None:
+                self.lease.release()
@@ -0,0 +1,251 @@
+"""
+Módulo de Gravação em Lote dos Logs de E-mail
+
+Este módulo implementa um gravador em segundo plano para os registros de
+EmailLog. O processamento apenas enfileira cada registro; uma thread grava a
+fila em lotes (por tamanho ou por tempo) com um único INSERT em massa por
+transação, em vez de uma transação e um fsync por e-mail. Os agregados do
+painel (``utils.rollups``) são atualizados na mesma transação.
+
+Quando a fila está cheia, quem enfileira espera (contrapressão) em vez de
+acumular registros sem limite na memória. Na finalização do processo, os
+registros pendentes são gravados antes de sair.
+"""
+
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import insert
+
+from utils.metrics import metrics as default_metrics
+from utils.rollups import apply_rollups
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Marcador que encerra a thread de gravação
+_STOP = object()
+
+
+def _fit_columns(table, record):
+    """
+    Trunca os textos do registro ao tamanho das colunas, para que um
+    assunto longo demais não impeça a gravação do lote.
+
+    Args:
+        table: Tabela de destino
+        record (dict): Registro a ser gravado
+
+    Returns:
+        dict: Registro com os textos truncados
+    """
+    fitted = dict(record)
+    for name, value in record.items():
+        length = getattr(table.c[name].type, 'length', None)
+        if length and isinstance(value, str) and len(value) > length:
+            fitted[name] = value[:length]
+    return fitted
+
+
+class EmailLogWriter:
+    """
+    Gravador em lote, em segundo plano, dos registros de EmailLog.
+    """
+
+    def __init__(self, engine, batch_size=100, flush_interval=1.0, max_queue=10000,
+                 put_timeout=30.0, max_retries=3, metrics=None):
+        """
+        Inicializa o gravador e inicia a thread de gravação.
+
+        Args:
+            engine: Engine do SQLAlchemy
+            batch_size (int): Quantidade máxima de registros por INSERT
+            flush_interval (float): Tempo máximo, em segundos, que um registro
+                espera na fila antes de ser gravado
+            max_queue (int): Capacidade da fila
+            put_timeout (float): Tempo máximo de espera por espaço na fila
+                antes de descartar o registro (None para esperar indefinidamente)
+            max_retries (int): Tentativas de gravação de um lote antes de gravar
+                seus registros um a um
+            metrics: Registro de métricas (por padrão, o registro global)
+        """
+        self.engine = engine
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max(1, max_retries)
+        self.metrics = metrics or default_metrics
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='email-log-writer', daemon=True)
+        self._thread.start()
+
+        atexit.register(self.close)
+
+    def write(self, sender, subject, matched_rule, response_sent, processed_at=None, suppressed=False):
+        """
+        Enfileira um registro de EmailLog.
+
+        Args:
+            sender (str): Remetente do e-mail
+            subject (str): Assunto do e-mail
+            matched_rule (str): Regra aplicada (None para a resposta genérica)
+            response_sent (bool): Se a resposta foi enviada
+            processed_at (datetime): Momento do processamento (padrão: agora)
+            suppressed (bool): Se a resposta foi suprimida pelo limite por remetente
+
+        Returns:
+            bool: True se o registro foi enfileirado
+        """
+        if self._closed:
+            logger.error("Gravador de logs já finalizado; registro descartado")
+            self.metrics.incr('log_writer.dropped')
+            return False
+
+        record = {
+            'sender': sender,
+            'subject': subject,
+            'matched_rule': matched_rule,
+            'response_sent': bool(response_sent),
+            'processed_at': processed_at or datetime.utcnow(),
+            'suppressed': bool(suppressed),
+        }
+
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Contrapressão: esperar a thread de gravação liberar espaço
+            self.metrics.incr('log_writer.backpressure')
+            try:
+                self._queue.put(record, timeout=self.put_timeout)
+            except queue.Full:
+                logger.error("Fila de logs cheia; registro descartado")
+                self.metrics.incr('log_writer.dropped')
+                return False
+
+        self.metrics.set_gauge('log_writer.queue_depth', self._queue.qsize())
+        return True
+
+    def _run(self):
+        """Laço da thread de gravação: agrupa registros por tamanho ou por tempo."""
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                else:
+                    batch.append(item)
+
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_batch(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+            self.metrics.set_gauge('log_writer.queue_depth', self._queue.qsize())
+
+    def _write_batch(self, batch):
+        """
+        Grava um lote em uma única transação, com novas tentativas em caso de erro.
+
+        Se o lote continuar falhando, os registros são gravados um a um, de
+        modo que apenas os registros inválidos sejam descartados.
+        """
+        from models import EmailLog
+
+        table = EmailLog.__table__
+        batch = [_fit_columns(table, record) for record in batch]
+
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(insert(table), batch)
+                    # Agregados do painel na mesma transação dos logs brutos
+                    apply_rollups(connection, batch)
+                self.metrics.incr('log_writer.written', len(batch))
+                self.metrics.incr('log_writer.batches')
+                return True
+            except Exception as e:
+                logger.error(f"Erro ao gravar {len(batch)} logs (tentativa {attempt}): {str(e)}")
+                if attempt < self.max_retries:
+                    time.sleep(min(0.5 * 2 ** (attempt - 1), 5.0))
+
+        return self._write_rows(table, batch)
+
+    def _write_rows(self, table, batch):
+        """Grava os registros de um lote um a um, descartando apenas os que falharem."""
+        written = 0
+        for record in batch:
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(insert(table), [record])
+                    apply_rollups(connection, [record])
+                written += 1
+            except Exception as e:
+                logger.error(f"Log de {record.get('sender')!r} descartado: {str(e)}")
+                self.metrics.incr('log_writer.dropped')
+
+        if written:
+            self.metrics.incr('log_writer.written', written)
+        return written == len(batch)
+
+    def flush(self, timeout=None):
+        """
+        Espera até que todos os registros enfileirados sejam gravados.
+
+        Args:
+            timeout (float): Tempo máximo de espera (None para esperar indefinidamente)
+
+        Returns:
+            bool: True se a fila foi esvaziada dentro do prazo
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        """
+        Grava os registros pendentes e finaliza a thread de gravação.
+
+        Args:
+            timeout (float): Tempo máximo de espera pela gravação final
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error("Fila de logs cheia na finalização")
+        self._thread.join(timeout)
+
+        pending = self._queue.qsize()
+        if pending:
+            logger.error(f"{pending} logs não foram gravados na finalização")
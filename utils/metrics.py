@@ -0,0 +1,201 @@
+"""
+Módulo de Métricas
+
+Este módulo implementa um registro simples de métricas em memória
+(contadores, medidores e observações), compartilhado pelos componentes do
+processo e seguro para uso entre threads.
+
+Cada contador também guarda seus incrementos por minuto na última hora,
+permitindo calcular taxas recentes (ex.: e-mails por minuto) sem consultar
+o banco. As observações (ex.: duração de cada ciclo) guardam contagem,
+soma, mínimo, máximo e uma amostra dos valores mais recentes.
+"""
+
+import time
+import threading
+from collections import defaultdict, deque
+
+# Minutos de histórico mantidos para o cálculo de taxas
+RATE_WINDOW_MINUTES = 60
+
+# Quantidade de valores recentes guardados por observação (para percentis)
+OBSERVATION_SAMPLE_SIZE = 256
+
+
+class Metrics:
+    """
+    Registro de contadores e medidores do processo.
+    """
+
+    def __init__(self):
+        """Inicializa o registro vazio."""
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._windows = defaultdict(deque)
+        self._observations = {}
+
+    def incr(self, name, value=1):
+        """
+        Incrementa um contador.
+
+        Args:
+            name (str): Nome do contador (ex.: 'cascade.rule')
+            value (int|float): Valor a somar
+        """
+        minute = int(time.time() // 60)
+        with self._lock:
+            self._counters[name] += value
+
+            # Incrementos por minuto, para as taxas recentes
+            window = self._windows[name]
+            if window and window[-1][0] == minute:
+                window[-1][1] += value
+            else:
+                window.append([minute, value])
+                while window[0][0] <= minute - RATE_WINDOW_MINUTES:
+                    window.popleft()
+
+    def rate(self, name, minutes=1):
+        """
+        Taxa média de um contador, por minuto, nos últimos minutos.
+
+        Args:
+            name (str): Nome do contador
+            minutes (int): Tamanho da janela, em minutos (até RATE_WINDOW_MINUTES),
+                incluindo o minuto atual
+
+        Returns:
+            float: Incrementos por minuto
+        """
+        minutes = max(1, min(minutes, RATE_WINDOW_MINUTES))
+        first_minute = int(time.time() // 60) - minutes + 1
+        with self._lock:
+            total = sum(value for minute, value in self._windows.get(name, ()) if minute >= first_minute)
+        return total / minutes
+
+    def observe(self, name, value):
+        """
+        Registra uma observação (ex.: duração de um ciclo, em segundos).
+
+        Args:
+            name (str): Nome da observação
+            value (int|float): Valor observado
+        """
+        with self._lock:
+            observation = self._observations.get(name)
+            if observation is None:
+                observation = self._observations[name] = {
+                    'count': 0, 'sum': 0.0, 'min': value, 'max': value,
+                    'recent': deque(maxlen=OBSERVATION_SAMPLE_SIZE),
+                }
+            observation['count'] += 1
+            observation['sum'] += value
+            observation['min'] = min(observation['min'], value)
+            observation['max'] = max(observation['max'], value)
+            observation['recent'].append(value)
+
+    def summary(self, name):
+        """
+        Resumo de uma observação.
+
+        Args:
+            name (str): Nome da observação
+
+        Returns:
+            dict: count, avg, min, max, last, p50 e p95 (percentis dos
+            valores recentes), ou None se não houver observações
+        """
+        with self._lock:
+            observation = self._observations.get(name)
+            if observation is None:
+                return None
+            recent = sorted(observation['recent'])
+            count, total = observation['count'], observation['sum']
+            last = observation['recent'][-1]
+            minimum, maximum = observation['min'], observation['max']
+
+        return {
+            'count': count,
+            'avg': total / count,
+            'min': minimum,
+            'max': maximum,
+            'last': last,
+            'p50': recent[int(0.50 * (len(recent) - 1))],
+            'p95': recent[int(0.95 * (len(recent) - 1))],
+        }
+
+    def set_gauge(self, name, value):
+        """
+        Define o valor atual de um medidor.
+
+        Args:
+            name (str): Nome do medidor
+            value (int|float): Valor atual
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def get(self, name, default=0):
+        """
+        Obtém o valor de um contador ou medidor.
+
+        Args:
+            name (str): Nome da métrica
+            default: Valor retornado se a métrica não existir
+
+        Returns:
+            O valor atual da métrica
+        """
+        with self._lock:
+            if name in self._counters:
+                return self._counters[name]
+            return self._gauges.get(name, default)
+
+    def snapshot(self, prefix=None):
+        """
+        Retorna uma cópia das métricas atuais.
+
+        Args:
+            prefix (str): Se informado, retorna apenas métricas com este prefixo
+
+        Returns:
+            dict: {'counters': {...}, 'gauges': {...}, 'observations': {...}}
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            names = list(self._observations)
+
+        if prefix:
+            counters = {k: v for k, v in counters.items() if k.startswith(prefix)}
+            gauges = {k: v for k, v in gauges.items() if k.startswith(prefix)}
+            names = [name for name in names if name.startswith(prefix)]
+
+        observations = {name: self.summary(name) for name in names}
+        return {'counters': counters, 'gauges': gauges, 'observations': observations}
+
+    def restore(self, counters):
+        """
+        Soma contadores salvos anteriormente (ex.: após reiniciar o processo).
+
+        Os incrementos restaurados não entram no cálculo das taxas.
+
+        Args:
+            counters (dict): Nome do contador -> valor
+        """
+        with self._lock:
+            for name, value in counters.items():
+                self._counters[name] += value
+
+    def reset(self):
+        """Zera todas as métricas."""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._windows.clear()
+            self._observations.clear()
+
+
+# Registro global do processo
+metrics = Metrics()
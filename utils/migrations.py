@@ -0,0 +1,161 @@
+"""
+Módulo de Migrações do Banco de Dados
+
+O ``db.create_all()`` cria apenas tabelas ausentes: índices e colunas novas
+em tabelas já existentes precisam de uma migração. Cada migração tem um
+número sequencial e é aplicada uma única vez; o último número aplicado fica
+registrado na tabela ``schema_version``.
+
+As migrações devem ser idempotentes (ex.: ``checkfirst=True``), pois em um
+banco novo o ``create_all()`` já terá criado os objetos que elas adicionam.
+"""
+
+import logging
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, select, insert, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+
+# Registro das migrações aplicadas
+schema_version = Table(
+    'schema_version', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _create_indexes(connection, table, names):
+    """Cria os índices declarados no modelo que ainda não existem no banco."""
+    for index in table.indexes:
+        if index.name in names:
+            index.create(connection, checkfirst=True)
+
+
+def _add_columns(connection, table, names):
+    """Adiciona as colunas declaradas no modelo que ainda não existem no banco."""
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    for name in names:
+        if name not in existing:
+            spec = CreateColumn(table.c[name]).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {spec}"))
+
+
+def _add_pagination_indexes(connection):
+    """Índices compostos da paginação por chave de /logs e /rules."""
+    from models import Rule, EmailLog
+
+    _create_indexes(connection, EmailLog.__table__, {
+        'ix_email_log_processed_at_id',
+        'ix_email_log_sender_processed_at_id',
+        'ix_email_log_matched_rule_processed_at_id',
+        'ix_email_log_response_sent_processed_at_id',
+    })
+    _create_indexes(connection, Rule.__table__, {'ix_rule_created_at_id'})
+
+
+def _backfill_email_log_rollups(connection):
+    """Preenche os agregados do painel com os logs já existentes."""
+    from models import EmailLogRollup
+    from utils.rollups import rebuild_rollups
+
+    EmailLogRollup.__table__.create(connection, checkfirst=True)
+    rebuild_rollups(connection)
+
+
+def _add_suppressed_columns(connection):
+    """Respostas suprimidas pelo limite por remetente nos logs e agregados."""
+    from models import EmailLog, EmailLogRollup
+
+    _add_columns(connection, EmailLog.__table__, ['suppressed'])
+    _add_columns(connection, EmailLogRollup.__table__, ['suppressed_count'])
+
+
+def _seed_rules_version(connection):
+    """Cria a linha única de rules_version, para que nenhum gravador precise criá-la."""
+    from models import RulesVersion
+
+    table = RulesVersion.__table__
+    table.create(connection, checkfirst=True)
+    if connection.execute(select(table.c.id).where(table.c.id == 1)).first() is None:
+        connection.execute(insert(table).values(id=1, version=0, updated_at=datetime.utcnow()))
+
+
+def _add_run_requested_column(connection):
+    """Pedido de verificação imediata ao detentor da concessão do monitoramento."""
+    from models import MonitorLease
+
+    _add_columns(connection, MonitorLease.__table__, ['run_requested'])
+
+
+def _add_subject_only_column(connection):
+    """Regras cuja palavra-chave é procurada apenas no assunto."""
+    from models import Rule
+
+    _add_columns(connection, Rule.__table__, ['subject_only'])
+
+
+# Migrações em ordem: (número, descrição, função que recebe a conexão)
+MIGRATIONS = [
+    (1, 'Índices de paginação por chave de email_log e rule', _add_pagination_indexes),
+    (2, 'Agregados por hora/dia e regra de email_log', _backfill_email_log_rollups),
+    (3, 'Colunas de respostas suprimidas em email_log e email_log_rollup', _add_suppressed_columns),
+    (4, 'Linha inicial de rules_version', _seed_rules_version),
+    (5, 'Coluna de pedido de verificação em monitor_lease', _add_run_requested_column),
+    (6, 'Coluna de regras somente do assunto em rule', _add_subject_only_column),
+]
+
+
+def current_version(connection):
+    """
+    Obtém o número da última migração aplicada.
+
+    Args:
+        connection: Conexão do SQLAlchemy
+
+    Returns:
+        int: Última versão aplicada (0 se nenhuma)
+    """
+    schema_version.create(connection, checkfirst=True)
+    versions = connection.execute(select(schema_version.c.version)).scalars().all()
+    return max(versions, default=0)
+
+
+def run_migrations(engine):
+    """
+    Aplica as migrações pendentes, cada uma em sua própria transação.
+
+    Args:
+        engine: Engine do SQLAlchemy
+
+    Returns:
+        int: Quantidade de migrações aplicadas
+    """
+    with engine.begin() as connection:
+        applied = current_version(connection)
+
+    count = 0
+    for version, description, migrate in MIGRATIONS:
+        if version <= applied:
+            continue
+
+        try:
+            with engine.begin() as connection:
+                migrate(connection)
+                connection.execute(insert(schema_version).values(
+                    version=version, description=description, applied_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Outro processo aplicou a mesma migração ao mesmo tempo
+            logger.info(f"Migração {version} já aplicada por outro processo")
+            continue
+
+        logger.info(f"Migração {version} aplicada: {description}")
+        count += 1
+
+    return count
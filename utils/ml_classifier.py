@@ -4,14 +4,25 @@ Módulo de Classificação de E-mails com Machine Learning
 Este módulo implementa um classificador de e-mails simples usando
 técnicas básicas de machine learning para melhorar a detecção de
 palavras-chave e categorização de e-mails.
+
+O retreinamento pode ser executado em um processo separado: cada
+treinamento gera um artefato versionado e um arquivo ponteiro indica a
+versão ativa. Todos os processos que usam o classificador observam esse
+ponteiro e trocam o modelo em memória de forma atômica, continuando a
+servir o modelo anterior até que o novo esteja pronto.
 """
 
 import os
 import pickle
 import logging
+import numbers
+import threading
+import multiprocessing
 import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.pipeline import Pipeline
 from sklearn.model_selection import train_test_split
@@ -20,261 +31,858 @@ import joblib
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Versão do formato do artefato salvo em disco
+ARTIFACT_FORMAT_VERSION = '2.0'
+
+# Parâmetros de análise de texto (tokenização, acentos e n-gramas); os
+# vetores do cache de características dependem apenas deles
+ANALYZER_PARAMS = {'strip_accents': 'unicode', 'lowercase': True, 'ngram_range': (1, 2)}
+
+# Quantidade de palavras-chave por classe pré-calculadas no treinamento
+KEYWORDS_TOP_N = 20
+
+# Estado imutável do modelo em uso; substituído por inteiro a cada troca
+ModelSnapshot = namedtuple('ModelSnapshot', ['model', 'classes', 'version', 'keywords'])
+
+
+def build_pipeline(max_features=5000, ngram_range=ANALYZER_PARAMS['ngram_range'], min_df=2,
+                   max_df=0.85, alpha=0.1):
+    """
+    Cria o pipeline (não treinado) de pré-processamento e classificação.
+
+    Contagem de termos seguida de TF-IDF equivale a um TfidfVectorizer,
+    mas permite treinar e classificar a partir de contagens em cache.
+
+    Args:
+        max_features (int): Tamanho máximo do vocabulário
+        ngram_range (tuple): Faixa de n-gramas extraídos
+        min_df (int|float): Frequência mínima de documento de um termo
+        max_df (float): Frequência máxima de documento de um termo
+        alpha (float): Suavização do Naive Bayes
+
+    Returns:
+        Pipeline: Pipeline pronto para ``fit``
+    """
+    return Pipeline([
+        ('vectorizer', CountVectorizer(
+            max_features=max_features,
+            min_df=min_df,
+            max_df=max_df,
+            strip_accents=ANALYZER_PARAMS['strip_accents'],
+            lowercase=ANALYZER_PARAMS['lowercase'],
+            ngram_range=ngram_range
+        )),
+        ('tfidf', TfidfTransformer()),
+        ('classifier', MultinomialNB(alpha=alpha))
+    ])
+
+
+def _select_vocabulary(counts, feature_cache, max_features=5000, min_df=2, max_df=0.85):
+    """
+    Seleciona o vocabulário a partir de contagens no espaço de termos do cache.
+
+    Aplica os mesmos filtros do CountVectorizer: frequência de documento
+    mínima e máxima e, depois, os ``max_features`` termos mais frequentes.
+
+    Returns:
+        tuple: (ids dos termos selecionados, termos), em ordem alfabética
+    """
+    n_docs = counts.shape[0]
+    doc_freq = np.bincount(counts.indices, minlength=counts.shape[1])
+    max_doc_count = max_df if isinstance(max_df, numbers.Integral) else max_df * n_docs
+    min_doc_count = min_df if isinstance(min_df, numbers.Integral) else min_df * n_docs
+
+    candidates = np.flatnonzero((doc_freq >= max(min_doc_count, 1)) & (doc_freq <= max_doc_count))
+    if len(candidates) == 0:
+        raise ValueError("Nenhum termo restante após o filtro de frequência de documento")
+
+    names = feature_cache.term_names(candidates)
+    order = np.argsort(np.asarray(names, dtype=object))
+    candidates = candidates[order]
+    names = [names[i] for i in order]
+
+    if max_features is not None and len(candidates) > max_features:
+        term_freq = np.asarray(counts.sum(axis=0)).ravel()[candidates]
+        keep = np.sort(np.argsort(-term_freq, kind='mergesort')[:max_features])
+        candidates = candidates[keep]
+        names = [names[i] for i in keep]
+
+    return candidates, names
+
+
+def _fit_from_counts(counts, labels, feature_cache, alpha=0.1):
+    """
+    Treina o pipeline a partir da matriz de contagens do cache.
+
+    Returns:
+        tuple: (pipeline treinado, equivalente ao de ``build_pipeline``,
+        ids no cache dos termos do vocabulário)
+    """
+    template = build_pipeline(alpha=alpha).named_steps['vectorizer']
+    term_ids, names = _select_vocabulary(
+        counts, feature_cache, template.max_features, template.min_df, template.max_df
+    )
+
+    # Vetorizador com vocabulário fixo: classifica textos novos sem o cache
+    vectorizer = CountVectorizer(vocabulary={name: i for i, name in enumerate(names)}, **ANALYZER_PARAMS)
+    vectorizer.fit([''])
+
+    X = counts[:, term_ids]
+    tfidf = TfidfTransformer().fit(X)
+    classifier = MultinomialNB(alpha=alpha).fit(tfidf.transform(X), labels)
+
+    model = Pipeline([('vectorizer', vectorizer), ('tfidf', tfidf), ('classifier', classifier)])
+    return model, term_ids
+
+
+def _fit_model(texts, labels, feature_cache=None):
+    """
+    Treina um novo pipeline sem alterar nenhum modelo em uso.
+
+    Args:
+        texts (list): Lista de textos para treinamento
+        labels (list): Lista de rótulos correspondentes
+        feature_cache (FeatureCache): Cache consultado antes de vetorizar
+
+    Returns:
+        tuple: (pipeline treinado, lista de classes, acurácia)
+    """
+    classes = sorted(list(set(labels)))
+
+    if feature_cache is not None:
+        counts = feature_cache.count_matrix(texts)
+        labels = np.asarray(labels)
+
+        # Mesma divisão que train_test_split aplicaria aos textos
+        train_idx, test_idx = train_test_split(np.arange(len(texts)), test_size=0.2, random_state=42)
+
+        model, term_ids = _fit_from_counts(counts[train_idx], labels[train_idx], feature_cache)
+        X_test = model.named_steps['tfidf'].transform(counts[test_idx][:, term_ids])
+        predicted = model.named_steps['classifier'].predict(X_test)
+        accuracy = float(np.mean(predicted == labels[test_idx]))
+
+        return model, classes, accuracy
+
+    # Criar pipeline de pré-processamento e classificação
+    model = build_pipeline()
+
+    # Dividir dados em treino e teste
+    X_train, X_test, y_train, y_test = train_test_split(
+        texts, labels, test_size=0.2, random_state=42
+    )
+
+    # Treinar e avaliar o modelo
+    model.fit(X_train, y_train)
+    accuracy = model.score(X_test, y_test)
+
+    return model, classes, accuracy
+
+
+def _class_feature_weights(model):
+    """Retorna a matriz (classes x termos) de relevância do classificador, ou None."""
+    classifier = model.named_steps['classifier']
+
+    if hasattr(classifier, 'feature_log_prob_'):
+        # Para Naive Bayes
+        return classifier.feature_log_prob_
+    if hasattr(classifier, 'coef_'):
+        # Fallback para outros classificadores
+        return classifier.coef_
+    return None
+
+
+def _top_feature_indices(weights, top_n):
+    """Índices dos ``top_n`` maiores pesos, do mais relevante para o menos relevante."""
+    top_n = min(top_n, len(weights))
+    if top_n <= 0:
+        return []
+
+    # Seleção parcial O(n) seguida de ordenação apenas dos selecionados
+    indices = np.argpartition(weights, -top_n)[-top_n:]
+    return indices[np.argsort(weights[indices])[::-1]]
+
+
+def _compute_top_keywords(model, classes, top_n=KEYWORDS_TOP_N):
+    """
+    Calcula as palavras-chave mais relevantes de cada classe.
+
+    Args:
+        model: Pipeline treinado
+        classes (list): Classes do modelo
+        top_n (int): Número de palavras-chave por classe
+
+    Returns:
+        dict: Mapeamento classe -> lista de palavras-chave, da mais relevante
+        para a menos relevante
+    """
+    weights = _class_feature_weights(model)
+    if weights is None or len(weights) == 0:
+        return {}
+
+    feature_names = model.named_steps['vectorizer'].get_feature_names_out()
+
+    return {
+        class_name: [str(feature_names[i]) for i in _top_feature_indices(weights[class_idx], top_n)]
+        for class_idx, class_name in enumerate(classes)
+    }
+
+
+def _atomic_dump(obj, path):
+    """Grava um objeto com joblib em arquivo temporário e o renomeia atomicamente."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_pointer(pointer_file, version):
+    """Atualiza atomicamente o arquivo ponteiro com a versão ativa."""
+    tmp_path = f"{pointer_file}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pointer_file)
+
+
+def _versions_dir(model_file):
+    """Diretório onde os artefatos versionados são armazenados."""
+    return os.path.join(os.path.dirname(model_file) or '.', 'versions')
+
+
+def _pointer_file(model_file):
+    """Arquivo que indica a versão ativa do modelo."""
+    return f"{model_file}.current"
+
+
+def _artifact_path(model_file, version):
+    """Caminho do artefato de uma versão específica."""
+    stem = os.path.splitext(os.path.basename(model_file))[0]
+    return os.path.join(_versions_dir(model_file), f"{stem}-{version}.pkl")
+
+
+def _publish_model(model_file, model, classes, accuracy=None, keep_versions=5, keywords=None):
+    """
+    Grava um novo artefato versionado e o torna a versão ativa.
+
+    Args:
+        model_file (str): Caminho base do modelo
+        model: Pipeline treinado
+        classes (list): Classes do modelo
+        accuracy (float): Acurácia medida no treinamento
+        keep_versions (int): Quantidade de versões antigas mantidas em disco
+        keywords (dict): Palavras-chave por classe; calculadas se omitidas
+
+    Returns:
+        str: Identificador da versão publicada
+    """
+    version = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    os.makedirs(_versions_dir(model_file), exist_ok=True)
+
+    if keywords is None:
+        keywords = _compute_top_keywords(model, classes)
+
+    model_data = {
+        'model': model,
+        'classes': classes,
+        'keywords': keywords,
+        'accuracy': accuracy,
+        'timestamp': datetime.now(),
+        'model_version': version,
+        'version': ARTIFACT_FORMAT_VERSION
+    }
+
+    # O artefato fica completo em disco antes de o ponteiro ser trocado
+    _atomic_dump(model_data, _artifact_path(model_file, version))
+    _write_pointer(_pointer_file(model_file), version)
+
+    _prune_versions(model_file, keep_versions, keep=version)
+    return version
+
+
+def _list_versions(model_file):
+    """Lista as versões disponíveis em disco, da mais antiga para a mais recente."""
+    versions_dir = _versions_dir(model_file)
+    if not os.path.isdir(versions_dir):
+        return []
+
+    prefix = os.path.splitext(os.path.basename(model_file))[0] + '-'
+    versions = [
+        name[len(prefix):-len('.pkl')]
+        for name in os.listdir(versions_dir)
+        if name.startswith(prefix) and name.endswith('.pkl')
+    ]
+    return sorted(versions)
+
+
+def _prune_versions(model_file, keep_versions, keep=None):
+    """Remove versões antigas, preservando as mais recentes e a versão ativa."""
+    if keep_versions is None or keep_versions <= 0:
+        return
+
+    versions = _list_versions(model_file)
+    for version in versions[:-keep_versions]:
+        if version == keep:
+            continue
+        try:
+            os.remove(_artifact_path(model_file, version))
+        except OSError as e:
+            logger.warning(f"Não foi possível remover a versão {version}: {str(e)}")
+
+
+def _open_feature_cache(settings):
+    """Abre o cache de características descrito por ``settings`` (ou None)."""
+    if not settings:
+        return None
+
+    from utils.feature_cache import FeatureCache
+    return FeatureCache(analyzer_params=ANALYZER_PARAMS, **settings)
+
+
+def _train_and_publish(model_file, texts, labels, keep_versions, feature_cache_settings=None):
+    """
+    Ponto de entrada do processo de retreinamento em segundo plano.
+
+    Returns:
+        tuple: (versão publicada, acurácia)
+    """
+    feature_cache = _open_feature_cache(feature_cache_settings)
+    try:
+        model, classes, accuracy = _fit_model(texts, labels, feature_cache)
+    finally:
+        if feature_cache is not None:
+            feature_cache.close()
+    version = _publish_model(model_file, model, classes, accuracy, keep_versions)
+    return version, accuracy
+
+
 class EmailClassifier:
     """
     Classificador de e-mails que utiliza aprendizado de máquina para
     categorizar mensagens e melhorar a detecção de palavras-chave.
     """
-    
-    def __init__(self, model_file='models/email_classifier.pkl', threshold=0.6):
+
+    def __init__(self, model_file='models/email_classifier.pkl', threshold=0.6,
+                 reload_interval=5.0, keep_versions=5, feature_cache_dir=None,
+                 feature_cache_max_bytes=64 * 1024 * 1024, feature_cache_max_age_days=30):
         """
         Inicializa o classificador de e-mails.
-        
+
         Args:
             model_file (str): Caminho para arquivo do modelo treinado
             threshold (float): Limiar de confiança para classificação (0.0 a 1.0)
+            reload_interval (float): Intervalo mínimo, em segundos, entre
+                verificações de nova versão publicada por outro processo
+            keep_versions (int): Quantidade de versões mantidas em disco
+            feature_cache_dir (str): Diretório do cache de vetores de
+                características; None desativa o cache
+            feature_cache_max_bytes (int): Tamanho máximo do cache
+            feature_cache_max_age_days (float): Idade máxima de uma entrada do cache
         """
         self.model_file = model_file
         self.threshold = threshold
-        self.model = None
-        self.classes = []
-        self.is_trained = False
-        
+        self.reload_interval = reload_interval
+        self.keep_versions = keep_versions
+
+        self._feature_cache_settings = None
+        if feature_cache_dir:
+            self._feature_cache_settings = {
+                'cache_dir': feature_cache_dir,
+                'max_bytes': feature_cache_max_bytes,
+                'max_age_days': feature_cache_max_age_days,
+            }
+        self.feature_cache = _open_feature_cache(self._feature_cache_settings)
+        self._vocabulary_ids = (None, None)
+
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._pointer_stat = None
+        self._last_check = 0.0
+        self._executor = None
+        self._pending_training = None
+
         # Tentar carregar modelo existente
         self.load_model()
-    
-    def load_model(self):
+
+    @property
+    def model(self):
+        """Pipeline atualmente em uso (ou None)."""
+        snapshot = self._snapshot
+        return snapshot.model if snapshot else None
+
+    @property
+    def classes(self):
+        """Classes do modelo atualmente em uso."""
+        snapshot = self._snapshot
+        return snapshot.classes if snapshot else []
+
+    @property
+    def version(self):
+        """Versão do modelo atualmente em uso."""
+        snapshot = self._snapshot
+        return snapshot.version if snapshot else None
+
+    @property
+    def keywords(self):
+        """Palavras-chave pré-calculadas por classe do modelo em uso."""
+        snapshot = self._snapshot
+        return snapshot.keywords if snapshot else {}
+
+    @property
+    def is_trained(self):
+        """Indica se existe um modelo pronto para classificar."""
+        return self._snapshot is not None
+
+    def _swap(self, model, classes, version, keywords=None):
+        """Troca atomicamente o modelo em uso."""
+        if keywords is None:
+            keywords = _compute_top_keywords(model, classes)
+        self._snapshot = ModelSnapshot(model, list(classes), version, keywords)
+
+    def _read_pointer(self):
+        """Lê a versão ativa indicada pelo arquivo ponteiro."""
+        pointer_file = _pointer_file(self.model_file)
+        try:
+            with open(pointer_file, 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _pointer_signature(self):
+        """Assinatura barata (mtime, tamanho) do arquivo ponteiro."""
+        try:
+            stat = os.stat(_pointer_file(self.model_file))
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def load_model(self, version=None):
         """
         Carrega um modelo previamente treinado.
-        
+
+        Args:
+            version (str): Versão específica a carregar; por padrão, a
+                versão ativa indicada pelo ponteiro
+
         Returns:
             bool: True se o modelo foi carregado com sucesso, False caso contrário
         """
-        if os.path.exists(self.model_file):
-            try:
-                model_data = joblib.load(self.model_file)
-                
-                self.model = model_data.get('model')
-                self.classes = model_data.get('classes', [])
-                self.is_trained = True
-                
-                logger.info(f"Modelo carregado com {len(self.classes)} classes: {', '.join(self.classes)}")
-                return True
-                
-            except Exception as e:
-                logger.error(f"Erro ao carregar modelo: {str(e)}")
-        
+        with self._lock:
+            self._pointer_stat = self._pointer_signature()
+            version = version or self._read_pointer()
+
+            if version:
+                path = _artifact_path(self.model_file, version)
+            else:
+                # Formato antigo: um único arquivo sem versionamento
+                path = self.model_file
+
+            if os.path.exists(path):
+                try:
+                    model_data = joblib.load(path)
+
+                    classes = model_data.get('classes', [])
+                    # Artefatos antigos não trazem palavras-chave; são calculadas aqui
+                    self._swap(model_data.get('model'), classes,
+                               model_data.get('model_version', version),
+                               model_data.get('keywords'))
+
+                    logger.info(f"Modelo carregado com {len(classes)} classes: {', '.join(classes)}")
+                    return True
+
+                except Exception as e:
+                    logger.error(f"Erro ao carregar modelo: {str(e)}")
+                    return False
+
         logger.info("Nenhum modelo existente encontrado")
         return False
-    
+
+    def check_for_update(self, force=False):
+        """
+        Verifica se outro processo publicou uma nova versão e, se sim, a carrega.
+
+        A verificação é apenas um stat do arquivo ponteiro e é limitada a uma
+        vez a cada ``reload_interval`` segundos. Enquanto a nova versão é
+        carregada, as classificações continuam usando o modelo anterior.
+
+        Args:
+            force (bool): Se True, ignora o intervalo mínimo entre verificações
+
+        Returns:
+            bool: True se uma nova versão foi carregada
+        """
+        now = datetime.now().timestamp()
+        if not force and now - self._last_check < self.reload_interval:
+            return False
+        self._last_check = now
+
+        signature = self._pointer_signature()
+        if signature is None or signature == self._pointer_stat:
+            return False
+
+        version = self._read_pointer()
+        if version is None or version == self.version:
+            self._pointer_stat = signature
+            return False
+
+        logger.info(f"Nova versão do modelo detectada: {version}")
+        return self.load_model(version)
+
     def save_model(self):
         """
-        Salva o modelo treinado.
-        
+        Salva o modelo em uso como uma nova versão e a torna ativa.
+
         Returns:
             bool: True se o modelo foi salvo com sucesso, False caso contrário
         """
-        if not self.is_trained or self.model is None:
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.model is None:
             logger.warning("Tentativa de salvar modelo não treinado")
             return False
-        
+
         try:
-            # Criar diretório se não existir
-            os.makedirs(os.path.dirname(self.model_file), exist_ok=True)
-            
-            # Preparar dados do modelo
-            model_data = {
-                'model': self.model,
-                'classes': self.classes,
-                'timestamp': datetime.now(),
-                'version': '1.0'
-            }
-            
-            # Salvar modelo
-            joblib.dump(model_data, self.model_file)
-            
-            logger.info(f"Modelo salvo em {self.model_file}")
+            version = _publish_model(self.model_file, snapshot.model, snapshot.classes,
+                                     keep_versions=self.keep_versions,
+                                     keywords=snapshot.keywords)
+            self._swap(snapshot.model, snapshot.classes, version, snapshot.keywords)
+            self._pointer_stat = self._pointer_signature()
+
+            logger.info(f"Modelo salvo em {self.model_file} (versão {version})")
             return True
-            
+
         except Exception as e:
             logger.error(f"Erro ao salvar modelo: {str(e)}")
             return False
-    
+
     def train(self, texts, labels):
         """
-        Treina o modelo com os dados fornecidos.
-        
+        Treina o modelo com os dados fornecidos no processo atual.
+
+        O novo modelo é treinado à parte e só substitui o modelo em uso
+        depois de publicado em disco.
+
         Args:
             texts (list): Lista de textos para treinamento
             labels (list): Lista de rótulos correspondentes
-            
+
         Returns:
             float: Acurácia do modelo após treinamento
         """
         if not texts or not labels or len(texts) != len(labels):
             logger.error("Dados de treinamento inválidos")
             return 0.0
-        
+
         try:
-            # Obter classes únicas
-            self.classes = sorted(list(set(labels)))
-            
-            # Criar pipeline de pré-processamento e classificação
-            self.model = Pipeline([
-                ('vectorizer', TfidfVectorizer(
-                    max_features=5000,
-                    min_df=2,
-                    max_df=0.85,
-                    strip_accents='unicode',
-                    lowercase=True,
-                    ngram_range=(1, 2)
-                )),
-                ('classifier', MultinomialNB(alpha=0.1))
-            ])
-            
-            # Dividir dados em treino e teste
-            X_train, X_test, y_train, y_test = train_test_split(
-                texts, labels, test_size=0.2, random_state=42
-            )
-            
-            # Treinar modelo
-            self.model.fit(X_train, y_train)
-            
-            # Avaliar o modelo
-            accuracy = self.model.score(X_test, y_test)
-            
-            self.is_trained = True
-            logger.info(f"Modelo treinado com acurácia de {accuracy:.2f} em {len(self.classes)} classes")
-            
-            # Salvar modelo
-            self.save_model()
-            
+            model, classes, accuracy = _fit_model(texts, labels, self.feature_cache)
+            logger.info(f"Modelo treinado com acurácia de {accuracy:.2f} em {len(classes)} classes")
+
+            # Publicar e trocar o modelo em uso
+            keywords = _compute_top_keywords(model, classes)
+            version = _publish_model(self.model_file, model, classes, accuracy,
+                                     self.keep_versions, keywords)
+            with self._lock:
+                self._swap(model, classes, version, keywords)
+                self._pointer_stat = self._pointer_signature()
+
             return accuracy
-            
+
         except Exception as e:
             logger.error(f"Erro ao treinar modelo: {str(e)}")
-            self.is_trained = False
             return 0.0
-    
+
+    def train_async(self, texts, labels):
+        """
+        Treina o modelo em um processo separado.
+
+        O processo grava um artefato versionado e atualiza o ponteiro; ao
+        final, este processo carrega a nova versão. Os demais processos a
+        detectam via ``check_for_update``. Apenas um treinamento é executado
+        por vez.
+
+        Args:
+            texts (list): Lista de textos para treinamento
+            labels (list): Lista de rótulos correspondentes
+
+        Returns:
+            Future: Futuro com a tupla (versão, acurácia), ou None se os
+            dados forem inválidos
+        """
+        if not texts or not labels or len(texts) != len(labels):
+            logger.error("Dados de treinamento inválidos")
+            return None
+
+        with self._lock:
+            if self._pending_training and not self._pending_training.done():
+                logger.info("Retreinamento já em andamento; nova solicitação ignorada")
+                return self._pending_training
+
+            if self._executor is None:
+                # 'spawn' evita herdar locks de threads do processo web
+                self._executor = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+
+            future = self._executor.submit(
+                _train_and_publish, self.model_file, list(texts), list(labels),
+                self.keep_versions, self._feature_cache_settings
+            )
+            self._pending_training = future
+
+        future.add_done_callback(self._on_training_done)
+        logger.info(f"Retreinamento iniciado em segundo plano com {len(texts)} exemplos")
+        return future
+
+    def _on_training_done(self, future):
+        """Carrega a versão publicada ao final do retreinamento em segundo plano."""
+        try:
+            version, accuracy = future.result()
+            logger.info(f"Retreinamento concluído: versão {version}, acurácia de {accuracy:.2f}")
+            self.load_model(version)
+        except Exception as e:
+            logger.error(f"Erro no retreinamento em segundo plano: {str(e)}")
+
+    def list_versions(self):
+        """
+        Lista as versões do modelo disponíveis em disco.
+
+        Returns:
+            list: Versões ordenadas da mais antiga para a mais recente
+        """
+        return _list_versions(self.model_file)
+
+    def rollback(self, version=None):
+        """
+        Reativa uma versão anterior do modelo em todos os processos.
+
+        Args:
+            version (str): Versão a ativar; por padrão, a versão imediatamente
+                anterior à ativa
+
+        Returns:
+            bool: True se a versão foi ativada com sucesso
+        """
+        versions = self.list_versions()
+        current = self._read_pointer()
+
+        if version is None:
+            older = [v for v in versions if current is None or v < current]
+            if not older:
+                logger.warning("Nenhuma versão anterior disponível para rollback")
+                return False
+            version = older[-1]
+        elif version not in versions:
+            logger.error(f"Versão de modelo inexistente: {version}")
+            return False
+
+        try:
+            _write_pointer(_pointer_file(self.model_file), version)
+        except OSError as e:
+            logger.error(f"Erro ao ativar versão {version}: {str(e)}")
+            return False
+
+        logger.info(f"Rollback do modelo para a versão {version}")
+        return self.load_model(version)
+
+    def close(self):
+        """Encerra o processo de retreinamento e fecha o cache, se existirem."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self.feature_cache is not None:
+            self.feature_cache.close()
+            self.feature_cache = None
+
     def predict(self, text):
         """
         Classifica um texto usando o modelo treinado.
-        
+
         Args:
             text (str): Texto a ser classificado
-            
+
         Returns:
             tuple: (classe_predita, confiança) ou (None, 0.0) se falhar
         """
-        if not self.is_trained or not text:
+        if not text:
             return None, 0.0
-        
+        return self.predict_batch([text])[0]
+
+    def _cached_features(self, snapshot, texts):
+        """
+        Obtém a matriz de contagens no vocabulário do modelo via cache.
+
+        Returns:
+            scipy.sparse matrix ou None se o modelo não suportar o cache
+        """
+        if self.feature_cache is None or 'tfidf' not in snapshot.model.named_steps:
+            return None
+
+        counts = self.feature_cache.count_matrix(texts)
+
+        key, term_ids = self._vocabulary_ids
+        if key != (snapshot.version, self.feature_cache.generation) or term_ids is None:
+            # Mapeia cada coluna do modelo para o id do termo no cache (uma vez
+            # por versão do modelo e por geração do dicionário de termos)
+            names = snapshot.model.named_steps['vectorizer'].get_feature_names_out()
+            term_ids = self.feature_cache.term_ids(names)
+            self._vocabulary_ids = ((snapshot.version, self.feature_cache.generation), term_ids)
+
+        width = int(term_ids.max()) + 1
+        if counts.shape[1] < width:
+            counts.resize((counts.shape[0], width))
+        return counts[:, term_ids]
+
+    def _predict_proba(self, snapshot, texts):
+        """Probabilidades por classe, consultando o cache de características quando possível."""
+        counts = self._cached_features(snapshot, texts)
+        if counts is None:
+            return snapshot.model.predict_proba(texts)
+
+        tfidf = snapshot.model.named_steps['tfidf']
+        return snapshot.model.named_steps['classifier'].predict_proba(tfidf.transform(counts))
+
+    def predict_batch(self, texts):
+        """
+        Classifica vários textos com uma única chamada ao modelo.
+
+        Args:
+            texts (list): Textos a serem classificados
+
+        Returns:
+            list: Uma tupla (classe_predita, confiança) por texto, com
+            classe_predita None quando a confiança não atinge o limiar
+        """
+        self.check_for_update()
+
+        snapshot = self._snapshot
+        if snapshot is None or not texts:
+            return [(None, 0.0) for _ in texts]
+
         try:
-            # Obter probabilidades para cada classe
-            proba = self.model.predict_proba([text])[0]
-            
-            # Obter índice da classe com maior probabilidade
-            max_idx = np.argmax(proba)
-            
-            # Obter classe e confiança
-            predicted_class = self.classes[max_idx]
-            confidence = proba[max_idx]
-            
-            # Verificar se a confiança excede o limiar
-            if confidence >= self.threshold:
-                return predicted_class, confidence
-            else:
-                return None, confidence
-                
+            proba = self._predict_proba(snapshot, list(texts))
+            max_idx = np.argmax(proba, axis=1)
+            confidences = proba[np.arange(len(max_idx)), max_idx]
+
+            return [
+                (snapshot.classes[idx] if confidence >= self.threshold else None, float(confidence))
+                for idx, confidence in zip(max_idx, confidences)
+            ]
+
         except Exception as e:
-            logger.error(f"Erro ao classificar texto: {str(e)}")
-            return None, 0.0
-    
+            logger.error(f"Erro ao classificar textos em lote: {str(e)}")
+            return [(None, 0.0) for _ in texts]
+
     def get_keywords_by_class(self, class_name, top_n=10):
         """
         Obtém as palavras-chave mais relevantes para uma classe específica.
-        
+
+        As palavras-chave são calculadas uma única vez, quando o modelo é
+        treinado ou carregado; consultas com ``top_n`` até ``KEYWORDS_TOP_N``
+        são atendidas diretamente da memória.
+
         Args:
             class_name (str): Nome da classe
             top_n (int): Número de palavras-chave a retornar
-            
+
         Returns:
-            list: Lista de palavras-chave mais relevantes
+            list: Lista de palavras-chave, da mais relevante para a menos relevante
         """
-        if not self.is_trained or not class_name in self.classes:
+        snapshot = self._snapshot
+        if snapshot is None or not class_name in snapshot.classes:
             return []
-        
+
+        keywords = snapshot.keywords.get(class_name, [])
+        if top_n <= len(keywords) or len(keywords) < KEYWORDS_TOP_N:
+            return keywords[:top_n]
+
+        # Pedido maior que o pré-calculado: calcular sob demanda
         try:
-            # Obter o vectorizer do pipeline
-            vectorizer = self.model.named_steps['vectorizer']
-            classifier = self.model.named_steps['classifier']
-            
-            # Obter o índice da classe
-            class_idx = self.classes.index(class_name)
-            
-            # Obter os coeficientes do classificador para a classe
-            if hasattr(classifier, 'feature_log_prob_'):
-                # Para Naive Bayes
-                class_features = classifier.feature_log_prob_[class_idx]
-            else:
-                # Fallback para outros classificadores
-                class_features = classifier.coef_[class_idx] if hasattr(classifier, 'coef_') else []
-            
-            if len(class_features) == 0:
-                return []
-            
-            # Obter recursos (palavras) do vectorizer
-            feature_names = vectorizer.get_feature_names_out()
-            
-            # Ordenar por relevância
-            top_indices = np.argsort(class_features)[-top_n:]
-            
-            # Obter palavras-chave
-            return [feature_names[i] for i in top_indices]
-            
+            return _compute_top_keywords(snapshot.model, snapshot.classes, top_n).get(class_name, [])
         except Exception as e:
             logger.error(f"Erro ao obter palavras-chave: {str(e)}")
             return []
-    
+
+    def get_all_keywords(self, top_n=10):
+        """
+        Obtém as palavras-chave pré-calculadas de todas as classes.
+
+        Args:
+            top_n (int): Número de palavras-chave por classe
+
+        Returns:
+            dict: Mapeamento classe -> lista de palavras-chave
+        """
+        self.check_for_update()
+        return {class_name: keywords[:top_n] for class_name, keywords in self.keywords.items()}
+
     def add_training_example(self, text, label, train_now=False):
         """
         Adiciona um novo exemplo de treinamento e opcionalmente retreina o modelo.
-        
+
         Args:
             text (str): Texto do exemplo
             label (str): Rótulo da classe
-            train_now (bool): Se True, retreina o modelo imediatamente
-            
+            train_now (bool): Se True, inicia o retreinamento em segundo plano;
+                o modelo atual continua em uso até a nova versão ficar pronta
+
         Returns:
             bool: True se adicionado com sucesso, False caso contrário
         """
         try:
             # Obter exemplos existentes ou inicializar novos
             examples_file = os.path.join(os.path.dirname(self.model_file), 'training_examples.pkl')
-            
+
             if os.path.exists(examples_file):
                 with open(examples_file, 'rb') as f:
                     examples = pickle.load(f)
             else:
                 examples = {'texts': [], 'labels': []}
-            
+
             # Adicionar novo exemplo
             examples['texts'].append(text)
             examples['labels'].append(label)
-            
+
             # Salvar exemplos
             os.makedirs(os.path.dirname(examples_file), exist_ok=True)
             with open(examples_file, 'wb') as f:
                 pickle.dump(examples, f)
-            
+
             logger.info(f"Exemplo de treinamento adicionado para a classe '{label}'")
-            
-            # Retreinar o modelo, se solicitado
+
+            # Retreinar o modelo em segundo plano, se solicitado
             if train_now:
-                return self.train(examples['texts'], examples['labels']) > 0.0
-            
+                return self.train_async(examples['texts'], examples['labels']) is not None
+
             return True
-            
+
         except Exception as e:
             logger.error(f"Erro ao adicionar exemplo de treinamento: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+
+def main():
+    """Ferramenta de linha de comando para listar e reverter versões do modelo."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gerencia as versões do classificador de e-mails")
+    parser.add_argument('--model-file', default=os.getenv('MODEL_FILE', 'models/email_classifier.pkl'))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="Lista as versões disponíveis")
+    rollback_parser = subparsers.add_parser('rollback', help="Reativa uma versão anterior")
+    rollback_parser.add_argument('version', nargs='?', default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    classifier = EmailClassifier(model_file=args.model_file)
+
+    if args.command == 'list':
+        current = classifier.version
+        for version in classifier.list_versions():
+            marker = '*' if version == current else ' '
+            print(f"{marker} {version}")
+    else:
+        return 0 if classifier.rollback(args.version) else 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,411 @@
+"""
+Módulo da Caixa de Saída (Outbox)
+
+Este módulo desacopla o processamento dos e-mails do envio das respostas.
+O ciclo de processamento apenas grava cada resposta na tabela
+``outbox_message`` (de forma idempotente, pela chave da mensagem
+respondida); o ``OutboxSender`` envia as respostas pendentes em lotes.
+
+Uma falha de envio não perde a resposta: ela volta a ficar pendente, com
+espera exponencial entre as tentativas, até um número máximo de tentativas,
+quando passa ao estado ``dead`` (fila de mensagens mortas). O log do e-mail
+(EmailLog) e as estatísticas são registrados quando a resposta chega a um
+estado final (``sent`` ou ``dead``).
+
+Para que dois processos não enviem a mesma resposta, cada lote é reservado
+com uma atualização condicional (estado ``sending`` e um token do lote).
+Reservas abandonadas (ex.: processo encerrado no meio do envio) voltam a
+ficar disponíveis após ``sending_timeout``; nesse caso raro, uma resposta
+pode ser enviada duas vezes (entrega "pelo menos uma vez").
+"""
+
+import uuid
+import atexit
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, insert, update, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+
+from utils.metrics import metrics as default_metrics
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Estados de uma resposta na caixa de saída
+STATUS_PENDING = 'pending'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_DEAD = 'dead'
+
+# Tamanho máximo do assunto (coluna OutboxMessage.subject)
+MAX_SUBJECT_LENGTH = 255
+
+# Prefixo das métricas da caixa de saída: medidores com a quantidade de
+# respostas por estado (``outbox.pending``, ``outbox.sending``, ``outbox.dead``)
+# e contadores de eventos do remetente
+METRIC_PREFIX = 'outbox.'
+OUTBOX_DELIVERED = 'outbox.delivered'
+OUTBOX_RETRIED = 'outbox.retried'
+OUTBOX_DEAD_LETTERED = 'outbox.dead_lettered'
+OUTBOX_DEFERRED = 'outbox.deferred'
+
+
+def enqueue(engine, replies):
+    """
+    Grava respostas na caixa de saída, ignorando as que já estão nela.
+
+    Args:
+        engine: Engine do SQLAlchemy
+        replies (list): Dicionários com idempotency_key, recipient, subject,
+            body e matched_rule
+
+    Returns:
+        int: Quantidade de respostas recebidas (incluindo as já existentes)
+    """
+    from models import OutboxMessage
+
+    if not replies:
+        return 0
+
+    table = OutboxMessage.__table__
+    now = datetime.utcnow()
+    rows = [{
+        'idempotency_key': reply['idempotency_key'],
+        'recipient': reply['recipient'],
+        'subject': (reply.get('subject') or '')[:MAX_SUBJECT_LENGTH],
+        'body': reply['body'],
+        'matched_rule': reply.get('matched_rule'),
+        'status': STATUS_PENDING,
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+    } for reply in replies]
+
+    dialect = engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        dialect_insert = None
+
+    if dialect_insert is not None:
+        with engine.begin() as connection:
+            connection.execute(
+                dialect_insert(table).on_conflict_do_nothing(index_elements=['idempotency_key']), rows
+            )
+    else:
+        # Bancos sem ON CONFLICT: uma transação por resposta
+        for row in rows:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(table).values(**row))
+            except IntegrityError:
+                pass
+
+    return len(rows)
+
+
+def status_counts(connection):
+    """
+    Quantidade de respostas em cada estado.
+
+    Args:
+        connection: Conexão (ou sessão) do SQLAlchemy
+
+    Returns:
+        dict: {estado: quantidade}
+    """
+    from models import OutboxMessage
+
+    table = OutboxMessage.__table__
+    rows = connection.execute(select(table.c.status, func.count()).group_by(table.c.status)).all()
+    return {status: count for status, count in rows}
+
+
+def requeue_dead(engine):
+    """
+    Devolve as respostas mortas à fila, com as tentativas zeradas.
+
+    Args:
+        engine: Engine do SQLAlchemy
+
+    Returns:
+        int: Quantidade de respostas devolvidas
+    """
+    from models import OutboxMessage
+
+    table = OutboxMessage.__table__
+    with engine.begin() as connection:
+        return connection.execute(
+            update(table).where(table.c.status == STATUS_DEAD)
+            .values(status=STATUS_PENDING, attempts=0, next_attempt_at=datetime.utcnow(), last_error=None)
+        ).rowcount
+
+
+class OutboxSender:
+    """
+    Envia as respostas pendentes da caixa de saída.
+    """
+
+    def __init__(self, engine, send, rate_limiter=None, log_writer=None, on_final=None,
+                 batch_size=20, workers=4, max_attempts=5, backoff_seconds=60.0,
+                 max_backoff_seconds=3600.0, sending_timeout=300.0, poll_interval=30.0,
+                 metrics=None):
+        """
+        Inicializa o remetente (sem iniciar a thread).
+
+        Args:
+            engine: Engine do SQLAlchemy
+            send (callable): Envia uma resposta; recebe (destinatario,
+                assunto_original, mensagem) e retorna True se enviou
+            rate_limiter (SendRateLimiter): Limites de envio da conta (None = sem limite)
+            log_writer (EmailLogWriter): Grava o EmailLog de cada resposta finalizada
+            on_final (callable): Chamado com (matched_rule, sucesso) quando uma
+                resposta chega a um estado final (ex.: estatísticas)
+            batch_size (int): Respostas reservadas por lote
+            workers (int): Envios simultâneos
+            max_attempts (int): Tentativas antes de desistir (estado ``dead``)
+            backoff_seconds (float): Espera após a primeira falha (dobra a cada falha)
+            max_backoff_seconds (float): Espera máxima entre tentativas
+            sending_timeout (float): Tempo após o qual uma reserva abandonada é retomada
+            poll_interval (float): Intervalo da thread de envio em segundo plano
+            metrics: Registro de métricas (por padrão, o registro global)
+        """
+        self.engine = engine
+        self.send = send
+        self.rate_limiter = rate_limiter
+        self.log_writer = log_writer
+        self.on_final = on_final
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.sending_timeout = timedelta(seconds=sending_timeout)
+        self.poll_interval = poll_interval
+        self.metrics = metrics or default_metrics
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+
+    def _table(self):
+        """Tabela da caixa de saída."""
+        from models import OutboxMessage
+        return OutboxMessage.__table__
+
+    def _claim(self):
+        """
+        Reserva o próximo lote de respostas vencidas.
+
+        Returns:
+            list: Linhas reservadas (mappings)
+        """
+        table = self._table()
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        claimable = or_(
+            and_(table.c.status == STATUS_PENDING, table.c.next_attempt_at <= now),
+            and_(table.c.status == STATUS_SENDING, table.c.claimed_at < now - self.sending_timeout),
+        )
+
+        with self.engine.begin() as connection:
+            ids = connection.execute(
+                select(table.c.id).where(claimable)
+                .order_by(table.c.next_attempt_at, table.c.id).limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                return []
+
+            # Atualização condicional: outro processo pode ter reservado as mesmas linhas
+            connection.execute(
+                update(table).where(table.c.id.in_(ids), claimable)
+                .values(status=STATUS_SENDING, claim_token=token, claimed_at=now)
+            )
+            return connection.execute(
+                select(table).where(table.c.claim_token == token, table.c.status == STATUS_SENDING)
+                .order_by(table.c.next_attempt_at, table.c.id)
+            ).mappings().all()
+
+    def _finish(self, row, values):
+        """Grava o resultado de uma resposta reservada por este remetente."""
+        table = self._table()
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(table).where(table.c.id == row['id'], table.c.claim_token == row['claim_token'])
+                .values(claim_token=None, claimed_at=None, **values)
+            )
+
+    def _backoff(self, attempts):
+        """Espera antes da próxima tentativa, com variação aleatória de ±10%."""
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.9, 1.1))
+
+    def _record_final(self, row, success):
+        """Registra o EmailLog e as estatísticas de uma resposta finalizada."""
+        self.metrics.incr(OUTBOX_DELIVERED if success else OUTBOX_DEAD_LETTERED)
+        if self.on_final is not None:
+            self.on_final(row['matched_rule'], success)
+        if self.log_writer is not None:
+            self.log_writer.write(
+                sender=row['recipient'],
+                subject=row['subject'],
+                matched_rule=row['matched_rule'],
+                response_sent=success
+            )
+
+    def _deliver(self, row):
+        """
+        Envia uma resposta reservada e grava o resultado.
+
+        Returns:
+            bool: False se o limite de envio adiou a resposta
+        """
+        if self.rate_limiter is not None and not self.rate_limiter.acquire():
+            # Sem cota agora: devolver à fila sem contar tentativa
+            self._finish(row, {'status': STATUS_PENDING,
+                               'next_attempt_at': datetime.utcnow() + timedelta(seconds=self.poll_interval)})
+            self.metrics.incr(OUTBOX_DEFERRED)
+            return False
+
+        attempts = row['attempts'] + 1
+        error = None
+        try:
+            success = self.send(
+                destinatario=row['recipient'],
+                assunto_original=row['subject'],
+                mensagem=row['body']
+            )
+            if not success:
+                error = 'Envio recusado (detalhes no log)'
+        except Exception as e:
+            success = False
+            error = str(e)
+
+        now = datetime.utcnow()
+        if success:
+            logger.info(f"📤 Response sent to {row['recipient']}")
+            self._finish(row, {'status': STATUS_SENT, 'attempts': attempts, 'sent_at': now, 'last_error': None})
+            self._record_final(row, True)
+        elif attempts >= self.max_attempts:
+            logger.error(f"Resposta para {row['recipient']} descartada após {attempts} tentativas: {error}")
+            self._finish(row, {'status': STATUS_DEAD, 'attempts': attempts, 'last_error': error})
+            self._record_final(row, False)
+        else:
+            retry_at = now + self._backoff(attempts)
+            logger.warning(
+                f"Falha ao enviar resposta para {row['recipient']} (tentativa {attempts}); "
+                f"nova tentativa em {retry_at:%H:%M:%S}"
+            )
+            self._finish(row, {'status': STATUS_PENDING, 'attempts': attempts,
+                               'next_attempt_at': retry_at, 'last_error': error})
+            self.metrics.incr(OUTBOX_RETRIED)
+        return True
+
+    def _release(self, rows):
+        """Devolve à fila respostas reservadas e não enviadas."""
+        for row in rows:
+            self._finish(row, {'status': STATUS_PENDING})
+
+    @property
+    def running(self):
+        """True se a thread de envio em segundo plano está em execução."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def drain(self, max_batches=None, stop_event=None):
+        """
+        Envia as respostas vencidas, em lotes, até a fila esvaziar.
+
+        Para ao atingir o limite de envio (as respostas restantes ficam pendentes).
+
+        Args:
+            max_batches (int): Quantidade máxima de lotes (None = sem limite)
+            stop_event (threading.Event): Sinalizado para parar após o lote em andamento
+
+        Returns:
+            int: Quantidade de respostas processadas (enviadas, reagendadas ou descartadas)
+        """
+        processed = 0
+        batches = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='outbox-send') as executor:
+            while max_batches is None or batches < max_batches:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                try:
+                    rows = self._claim()
+                except Exception as e:
+                    logger.error(f"Erro ao reservar respostas da caixa de saída: {str(e)}")
+                    break
+                if not rows:
+                    break
+                batches += 1
+
+                results = list(executor.map(self._deliver_safely, rows))
+                processed += sum(1 for delivered in results if delivered)
+                if not all(results):
+                    break
+
+        self._publish_counts()
+        return processed
+
+    def _deliver_safely(self, row):
+        """_deliver com tratamento de erros (a resposta volta à fila)."""
+        try:
+            return self._deliver(row)
+        except Exception as e:
+            logger.error(f"Erro ao processar resposta {row['id']} da caixa de saída: {str(e)}")
+            try:
+                self._release([row])
+            except Exception:
+                pass
+            return False
+
+    def _publish_counts(self):
+        """Publica a quantidade de respostas por estado."""
+        try:
+            with self.engine.connect() as connection:
+                counts = status_counts(connection)
+        except Exception as e:
+            logger.error(f"Erro ao contar respostas da caixa de saída: {str(e)}")
+            return
+        for status in (STATUS_PENDING, STATUS_SENDING, STATUS_DEAD):
+            self.metrics.set_gauge(METRIC_PREFIX + status, counts.get(status, 0))
+
+    def start(self):
+        """Inicia a thread que envia as respostas vencidas periodicamente (sem efeito se já iniciada)."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='outbox-sender', daemon=True)
+        self._thread.start()
+        if not self._atexit_registered:
+            atexit.register(self.stop, 10.0)
+            self._atexit_registered = True
+
+    def _run(self):
+        """Laço da thread de envio."""
+        while not self._stop.is_set():
+            self.drain(stop_event=self._stop)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def wake(self):
+        """Antecipa o próximo envio da thread (ex.: após enfileirar respostas)."""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """
+        Para a thread de envio após o lote em andamento.
+
+        Args:
+            timeout (float): Tempo máximo de espera, em segundos
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,113 @@
+"""
+Módulo de Paginação por Chave (Keyset)
+
+Em vez de OFFSET, cada página continua a partir dos valores das colunas de
+ordenação do último item exibido (ex.: ``(processed_at, id)``). Com um
+índice composto nessas colunas, o custo de qualquer página é o mesmo da
+primeira, independentemente do tamanho da tabela.
+
+O cursor enviado ao navegador é a lista desses valores, em JSON codificado
+em base64 (seguro para URLs).
+"""
+
+import json
+import base64
+from datetime import datetime
+from collections import namedtuple
+from sqlalchemy import tuple_
+
+# Página de resultados e cursores para as páginas vizinhas (None se não houver)
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor', 'prev_cursor'])
+
+
+def encode_cursor(values):
+    """
+    Codifica os valores das colunas de ordenação em um cursor.
+
+    Args:
+        values (list): Valores das colunas, na ordem da ordenação
+
+    Returns:
+        str: Cursor seguro para URLs
+    """
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    token = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    return token.decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """
+    Decodifica um cursor gerado por ``encode_cursor``.
+
+    Args:
+        token (str): Cursor
+        columns (list): Colunas de ordenação, usadas para converter os tipos
+
+    Returns:
+        tuple: Valores das colunas
+
+    Raises:
+        ValueError: Se o cursor for inválido
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Cursor inválido: {str(e)}")
+
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        raise ValueError("Cursor inválido: quantidade de valores incorreta")
+
+    values = []
+    for value, column in zip(payload, columns):
+        python_type = column.type.python_type
+        if python_type is datetime:
+            if not isinstance(value, str):
+                raise ValueError(f"Cursor inválido: tipo incorreto para {column.key}")
+            value = datetime.fromisoformat(value)
+        elif isinstance(value, bool) and python_type is not bool or not isinstance(value, python_type):
+            raise ValueError(f"Cursor inválido: tipo incorreto para {column.key}")
+        values.append(value)
+    return tuple(values)
+
+
+def paginate_keyset(query, columns, after=None, before=None, limit=50):
+    """
+    Obtém uma página de resultados em ordem decrescente das colunas.
+
+    Args:
+        query: Consulta do Flask-SQLAlchemy já filtrada (sem ordenação)
+        columns (list): Colunas de ordenação, terminando em uma coluna única
+            (ex.: ``[EmailLog.processed_at, EmailLog.id]``)
+        after (str): Cursor do último item da página anterior (página seguinte)
+        before (str): Cursor do primeiro item da página seguinte (página anterior)
+        limit (int): Quantidade de itens por página
+
+    Returns:
+        KeysetPage: Itens e cursores da página
+
+    Raises:
+        ValueError: Se algum cursor for inválido
+    """
+    key = tuple_(*columns)
+
+    def cursor_of(item):
+        return encode_cursor([getattr(item, column.key) for column in columns])
+
+    if before:
+        # Página anterior: percorrer em ordem crescente e inverter o resultado
+        query = query.filter(key > tuple_(*decode_cursor(before, columns)))
+        rows = query.order_by(*[column.asc() for column in columns]).limit(limit + 1).all()
+        has_prev = len(rows) > limit
+        items = list(reversed(rows[:limit]))
+        next_cursor = cursor_of(items[-1]) if items else None
+        prev_cursor = cursor_of(items[0]) if items and has_prev else None
+        return KeysetPage(items, next_cursor, prev_cursor)
+
+    if after:
+        query = query.filter(key < tuple_(*decode_cursor(after, columns)))
+    rows = query.order_by(*[column.desc() for column in columns]).limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = cursor_of(items[-1]) if len(rows) > limit else None
+    prev_cursor = cursor_of(items[0]) if items and after else None
+    return KeysetPage(items, next_cursor, prev_cursor)
@@ -0,0 +1,222 @@
+"""
+Módulo de Pipeline em Estágios
+
+Este módulo executa um processamento como uma sequência de estágios ligados
+por filas limitadas (produtor/consumidor). Cada estágio tem suas próprias
+threads, de modo que uma etapa lenta (ex.: envio SMTP) não impede as
+anteriores (ex.: busca IMAP e análise) de continuarem; quando a fila de um
+estágio enche, os estágios anteriores esperam (contrapressão) em vez de
+acumular itens sem limite na memória.
+
+Para cada estágio são publicadas métricas com a profundidade da fila
+(``pipeline.<estágio>.queue_depth``), os itens processados
+(``pipeline.<estágio>.items``, cuja taxa por minuto indica a vazão), os
+erros e o tempo de processamento, permitindo identificar o gargalo.
+"""
+
+import time
+import queue
+import logging
+import threading
+
+from utils.metrics import metrics as default_metrics
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Marcador que encerra uma thread de estágio
+_STOP = object()
+
+
+class Stage:
+    """
+    Etapa do pipeline.
+
+    A função recebe um item e retorna o item para o próximo estágio (None
+    descarta o item). Com ``batch_size`` maior que 1, recebe uma lista de
+    itens e retorna uma lista de resultados.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=100, batch_size=1, batch_wait=0.1):
+        """
+        Inicializa o estágio.
+
+        Args:
+            name (str): Nome do estágio (usado nas métricas e nos logs)
+            func (callable): Função aplicada a cada item (ou lote)
+            workers (int): Quantidade de threads do estágio
+            queue_size (int): Capacidade da fila de entrada do estágio
+            batch_size (int): Quantidade máxima de itens por chamada da função
+            batch_wait (float): Tempo máximo, em segundos, de espera para
+                completar um lote
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+
+
+class _StageStats:
+    """
+    Contadores de uma execução de um estágio.
+    """
+
+    def __init__(self):
+        """Inicializa os contadores zerados."""
+        self.lock = threading.Lock()
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+
+
+class Pipeline:
+    """
+    Sequência de estágios ligados por filas limitadas.
+    """
+
+    def __init__(self, stages, metrics=None):
+        """
+        Inicializa o pipeline.
+
+        Args:
+            stages (list): Estágios, na ordem de execução
+            metrics: Registro de métricas (por padrão, o registro global)
+        """
+        if not stages:
+            raise ValueError("O pipeline precisa de ao menos um estágio")
+        self.stages = stages
+        self.metrics = metrics or default_metrics
+
+    def _metric(self, stage, name):
+        """Nome de uma métrica do estágio."""
+        return f"pipeline.{stage.name}.{name}"
+
+    def _get_batch(self, stage, inbox, stats):
+        """
+        Retira da fila o próximo item ou lote.
+
+        Returns:
+            tuple: (itens, encerrar)
+        """
+        item = inbox.get()
+        if item is _STOP:
+            return [], True
+
+        items = [item]
+        deadline = time.monotonic() + stage.batch_wait
+        while len(items) < stage.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = inbox.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Devolver o marcador para encerrar após este lote
+                inbox.put(_STOP)
+                break
+            items.append(item)
+
+        depth = inbox.qsize()
+        with stats.lock:
+            stats.max_queue_depth = max(stats.max_queue_depth, depth)
+        self.metrics.set_gauge(self._metric(stage, 'queue_depth'), depth)
+        return items, False
+
+    def _worker(self, stage, inbox, outbox, stats):
+        """Laço de uma thread do estágio."""
+        while True:
+            items, stop = self._get_batch(stage, inbox, stats)
+            if stop:
+                return
+
+            started = time.monotonic()
+            try:
+                if stage.batch_size > 1:
+                    results = stage.func(items) or []
+                else:
+                    results = [stage.func(items[0])]
+            except Exception as e:
+                logger.error(f"Erro no estágio {stage.name}: {str(e)}")
+                self.metrics.incr(self._metric(stage, 'errors'), len(items))
+                with stats.lock:
+                    stats.errors += len(items)
+                continue
+            elapsed = time.monotonic() - started
+
+            self.metrics.incr(self._metric(stage, 'items'), len(items))
+            self.metrics.observe(self._metric(stage, 'seconds'), elapsed / len(items))
+            with stats.lock:
+                stats.items += len(items)
+                stats.busy_seconds += elapsed
+
+            if outbox is not None:
+                for result in results:
+                    if result is not None:
+                        outbox.put(result)
+
+    def run(self, items):
+        """
+        Processa os itens por todos os estágios e espera a conclusão.
+
+        Args:
+            items (iterable): Itens de entrada do primeiro estágio
+
+        Returns:
+            dict: Por estágio, itens processados, erros, tempo ocupado,
+                vazão (itens/s) e maior profundidade de fila observada
+        """
+        inboxes = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        stats = [_StageStats() for _ in self.stages]
+        threads = []
+
+        for idx, stage in enumerate(self.stages):
+            outbox = inboxes[idx + 1] if idx + 1 < len(self.stages) else None
+            stage_threads = [
+                threading.Thread(
+                    target=self._worker, args=(stage, inboxes[idx], outbox, stats[idx]),
+                    name=f"pipeline-{stage.name}-{n}", daemon=True
+                )
+                for n in range(stage.workers)
+            ]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        started = time.monotonic()
+        try:
+            for item in items:
+                inboxes[0].put(item)
+        finally:
+            # Encerrar os estágios em ordem: cada um termina depois de esvaziar sua fila
+            for idx, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    inboxes[idx].put(_STOP)
+                for thread in threads[idx]:
+                    thread.join()
+                self.metrics.set_gauge(self._metric(stage, 'queue_depth'), 0)
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        report = {
+            stage.name: {
+                'items': stage_stats.items,
+                'errors': stage_stats.errors,
+                'busy_seconds': round(stage_stats.busy_seconds, 3),
+                'items_per_second': round(stage_stats.items / elapsed, 2),
+                'max_queue_depth': stage_stats.max_queue_depth,
+            }
+            for stage, stage_stats in zip(self.stages, stats)
+        }
+
+        if any(stage_report['items'] for stage_report in report.values()):
+            summary = ', '.join(
+                f"{name}: {stage_report['items']} itens, {stage_report['busy_seconds']}s ocupado, "
+                f"fila máx. {stage_report['max_queue_depth']}"
+                for name, stage_report in report.items()
+            )
+            logger.info(f"Pipeline concluído em {elapsed:.2f}s ({summary})")
+        return report
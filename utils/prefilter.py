@@ -0,0 +1,193 @@
+"""
+Módulo de Pré-filtro por Cabeçalhos
+
+Este módulo descarta, apenas pelos cabeçalhos, os e-mails que não devem ser
+respondidos: notificações de falha de entrega (bounces), respostas
+automáticas de outros sistemas (que poderiam criar laços de respostas),
+listas de discussão, newsletters e mensagens da própria conta. O filtro roda
+antes de qualquer trabalho com o corpo (análise, NLP, envio e log).
+
+As regras são expressões regulares compiladas uma única vez, aplicadas ao
+valor de um cabeçalho. O pacote padrão (``DEFAULT_RULES``) pode ser
+complementado ou ter regras desativadas por um arquivo JSON:
+
+    {
+        "disable": ["list_unsubscribe"],
+        "rules": [
+            {"name": "fornecedor_x", "header": "from", "pattern": "@fornecedor-x\\.com$"}
+        ]
+    }
+
+Cada regra tem um contador de ocorrências (``prefilter.<nome>``).
+"""
+
+import re
+import json
+import logging
+
+from utils.metrics import metrics as default_metrics
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Prefixo dos contadores de ocorrências por regra
+METRIC_PREFIX = 'prefilter.'
+
+# Nome da regra embutida que descarta e-mails enviados pela própria conta
+OWN_ADDRESS_RULE = 'own_address'
+
+# Pacote padrão de regras: (nome, cabeçalho, padrão). O cabeçalho "from" é
+# comparado com o endereço do remetente já decodificado; os demais, com o
+# valor bruto do cabeçalho. Um cabeçalho ausente nunca corresponde.
+DEFAULT_RULES = [
+    {'name': 'automated_sender', 'header': 'from',
+     'pattern': r'^(mailer-daemon|postmaster|no-?reply|do-?not-?reply|bounces?)([+._-][^@]*)?@'},
+    {'name': 'null_return_path', 'header': 'return-path', 'pattern': r'^\s*<\s*>\s*$'},
+    {'name': 'auto_submitted', 'header': 'auto-submitted', 'pattern': r'^(?!\s*no\s*$)\s*\S'},
+    {'name': 'x_autoreply', 'header': 'x-autoreply', 'pattern': r'\S'},
+    {'name': 'x_autorespond', 'header': 'x-autorespond', 'pattern': r'\S'},
+    {'name': 'auto_response_suppress', 'header': 'x-auto-response-suppress',
+     'pattern': r'\b(all|autoreply|oof)\b'},
+    {'name': 'precedence', 'header': 'precedence', 'pattern': r'^\s*(bulk|list|junk|auto_reply)\s*$'},
+    {'name': 'list_id', 'header': 'list-id', 'pattern': r'\S'},
+    {'name': 'list_unsubscribe', 'header': 'list-unsubscribe', 'pattern': r'\S'},
+]
+
+
+class HeaderRule:
+    """
+    Regra compilada aplicada ao valor de um cabeçalho.
+    """
+
+    def __init__(self, name, header, pattern):
+        """
+        Compila a regra.
+
+        Args:
+            name (str): Nome da regra (usado no contador de ocorrências)
+            header (str): Nome do cabeçalho
+            pattern (str): Expressão regular (sem distinção de maiúsculas)
+
+        Raises:
+            ValueError: Se o nome do cabeçalho for inválido
+            re.error: Se o padrão for inválido
+        """
+        # O nome é repassado ao comando IMAP que busca os cabeçalhos
+        if not re.fullmatch(r'[A-Za-z0-9-]+', header or ''):
+            raise ValueError(f"cabeçalho inválido: {header!r}")
+        self.name = name
+        self.header = header.lower()
+        self.regex = re.compile(pattern, re.IGNORECASE)
+
+    def matches(self, value):
+        """
+        Verifica o valor do cabeçalho.
+
+        Args:
+            value (str): Valor do cabeçalho (None se ausente)
+
+        Returns:
+            bool: True se o e-mail deve ser descartado
+        """
+        return value is not None and self.regex.search(value) is not None
+
+
+class Prefilter:
+    """
+    Conjunto de regras de descarte por cabeçalhos.
+    """
+
+    def __init__(self, rules=None, own_addresses=(), metrics=None):
+        """
+        Inicializa o filtro.
+
+        Args:
+            rules (list): Regras (dicionários com name, header e pattern);
+                por padrão, DEFAULT_RULES. Regras inválidas são ignoradas.
+            own_addresses (iterable): Endereços da própria conta
+            metrics: Registro de métricas (por padrão, o registro global)
+        """
+        self.metrics = metrics or default_metrics
+        self.own_addresses = {address.strip().lower() for address in own_addresses if address}
+        self.rules = []
+        for rule in DEFAULT_RULES if rules is None else rules:
+            try:
+                self.rules.append(HeaderRule(rule['name'], rule['header'], rule['pattern']))
+            except (KeyError, ValueError, re.error) as e:
+                logger.error(f"Regra de pré-filtro inválida ignorada ({rule}): {str(e)}")
+
+    @property
+    def header_names(self):
+        """
+        Cabeçalhos consultados pelas regras (além de From).
+
+        Returns:
+            tuple: Nomes em maiúsculas, sem repetição
+        """
+        names = []
+        for rule in self.rules:
+            name = rule.header.upper()
+            if name != 'FROM' and name not in names:
+                names.append(name)
+        return tuple(names)
+
+    def check(self, email_data):
+        """
+        Procura a primeira regra que descarta o e-mail e conta a ocorrência.
+
+        Args:
+            email_data (dict): Dados do e-mail com 'remetente' e 'cabecalhos'
+                (nomes em minúsculas)
+
+        Returns:
+            str: Nome da regra que descartou o e-mail, ou None se ele segue adiante
+        """
+        sender = (email_data.get('remetente') or '').strip().lower()
+        headers = email_data.get('cabecalhos') or {}
+
+        name = None
+        if sender in self.own_addresses:
+            name = OWN_ADDRESS_RULE
+        else:
+            for rule in self.rules:
+                value = sender if rule.header == 'from' else headers.get(rule.header)
+                if rule.matches(value):
+                    name = rule.name
+                    break
+
+        if name is not None:
+            self.metrics.incr(METRIC_PREFIX + name)
+        return name
+
+
+def load_rules(path=None):
+    """
+    Monta a lista de regras: o pacote padrão mais as alterações do arquivo.
+
+    Args:
+        path (str): Arquivo JSON com "disable" (nomes) e "rules" (novas
+            regras ou substitutas de regras com o mesmo nome); None para o
+            pacote padrão
+
+    Returns:
+        list: Regras (dicionários com name, header e pattern)
+    """
+    rules = [dict(rule) for rule in DEFAULT_RULES]
+    if not path:
+        return rules
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return rules
+    except Exception as e:
+        logger.error(f"Erro ao ler as regras de pré-filtro de {path}: {str(e)}")
+        return rules
+
+    disabled = set(config.get('disable', []))
+    custom = {rule.get('name'): rule for rule in config.get('rules', [])}
+    rules = [custom.pop(rule['name'], rule) for rule in rules if rule['name'] not in disabled]
+    rules.extend(rule for name, rule in custom.items() if name not in disabled)
+    logger.info(f"{len(rules)} regras de pré-filtro carregadas ({path})")
+    return rules
@@ -0,0 +1,196 @@
+"""
+Módulo de Limite de Envio (Token Bucket)
+
+Este módulo limita a taxa de envio de respostas por conta de e-mail, como os
+provedores exigem (ex.: o Gmail limita os envios por minuto e por dia). Cada
+conta tem dois baldes de fichas: um por minuto e outro por dia. Cada envio
+consome uma ficha de cada balde, e as fichas são repostas continuamente.
+
+Quando falta ficha no balde por minuto, o envio espera (suavizando rajadas)
+em vez de falhar. Quando a espera passaria do limite configurado (ex.: cota
+diária esgotada), o envio é adiado: a resposta continua na caixa de saída
+e é enviada em uma tentativa posterior.
+
+As fichas restantes de cada conta são publicadas como métricas
+(``rate_limit.<conta>.minute_remaining`` e ``rate_limit.<conta>.day_remaining``).
+"""
+
+import time
+import logging
+import threading
+
+from utils.metrics import metrics as default_metrics
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Prefixo das métricas do limite de envio
+METRIC_PREFIX = 'rate_limit.'
+
+
+class TokenBucket:
+    """
+    Balde de fichas com reposição contínua.
+    """
+
+    def __init__(self, capacity, period, clock=time.monotonic):
+        """
+        Inicializa o balde cheio.
+
+        Args:
+            capacity (int): Quantidade máxima de fichas
+            period (float): Tempo, em segundos, para repor o balde vazio
+            clock (callable): Relógio monotônico (substituível nos testes)
+        """
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.clock = clock
+        self.tokens = float(capacity)
+        self._updated = clock()
+
+    def _refill(self):
+        """Repõe as fichas acumuladas desde a última atualização."""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self):
+        """
+        Fichas disponíveis agora.
+
+        Returns:
+            float: Quantidade de fichas
+        """
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, tokens=1):
+        """
+        Tempo até haver fichas suficientes.
+
+        Args:
+            tokens (int): Fichas necessárias
+
+        Returns:
+            float: Espera em segundos (0 se já houver fichas)
+        """
+        self._refill()
+        missing = tokens - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def consume(self, tokens=1):
+        """
+        Retira fichas (o saldo pode ficar negativo, ex.: ao registrar envios já feitos).
+
+        Args:
+            tokens (int): Fichas retiradas
+        """
+        self._refill()
+        self.tokens -= tokens
+
+
+class SendRateLimiter:
+    """
+    Limites de envio por minuto e por dia de uma conta.
+    """
+
+    def __init__(self, account, per_minute=20, per_day=500, max_wait=120.0, metrics=None,
+                 clock=time.monotonic):
+        """
+        Inicializa os baldes cheios.
+
+        Args:
+            account (str): Conta de e-mail (usada nos nomes das métricas)
+            per_minute (int): Envios permitidos por minuto (0 para não limitar)
+            per_day (int): Envios permitidos a cada 24 horas (0 para não limitar)
+            max_wait (float): Espera máxima, em segundos, por um envio antes de adiá-lo
+            metrics: Registro de métricas (por padrão, o registro global)
+            clock (callable): Relógio monotônico (substituível nos testes)
+        """
+        self.account = account
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.max_wait = max_wait
+        self.metrics = metrics or default_metrics
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._buckets = {}
+        if per_minute:
+            self._buckets['minute'] = TokenBucket(per_minute, 60.0, clock)
+        if per_day:
+            self._buckets['day'] = TokenBucket(per_day, 86400.0, clock)
+
+        self._publish()
+
+    def _metric(self, name):
+        """Nome de uma métrica da conta."""
+        return f"{METRIC_PREFIX}{self.account}.{name}"
+
+    def _publish(self):
+        """Publica as fichas restantes e os limites como medidores."""
+        for name, bucket in self._buckets.items():
+            self.metrics.set_gauge(self._metric(f'{name}_remaining'), max(0, int(bucket.available())))
+            self.metrics.set_gauge(self._metric(f'{name}_limit'), bucket.capacity)
+
+    def record_sent(self, count):
+        """
+        Desconta do limite diário envios feitos antes desta instância existir
+        (ex.: por outro processo ou antes de um reinício).
+
+        Args:
+            count (int): Quantidade de envios a descontar
+        """
+        day = self._buckets.get('day')
+        if count <= 0 or day is None:
+            return
+        with self._lock:
+            day.consume(count)
+            self._publish()
+
+    def acquire(self, timeout=None):
+        """
+        Obtém permissão para um envio, esperando se necessário.
+
+        Args:
+            timeout (float): Espera máxima, em segundos (padrão: max_wait)
+
+        Returns:
+            bool: True se o envio pode ser feito; False se deve ser adiado
+        """
+        timeout = self.max_wait if timeout is None else timeout
+        deadline = self.clock() + timeout
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                wait = max([bucket.wait_time() for bucket in self._buckets.values()] or [0.0])
+                if wait <= 0:
+                    for bucket in self._buckets.values():
+                        bucket.consume()
+                    self._publish()
+                    if waited:
+                        self.metrics.incr(self._metric('waited_seconds'), waited)
+                    return True
+
+                if self.clock() + wait > deadline:
+                    self._publish()
+                    self.metrics.incr(self._metric('deferred'))
+                    logger.warning(
+                        f"Limite de envio da conta {self.account} atingido; "
+                        f"próxima ficha em {wait:.0f}s, envio adiado"
+                    )
+                    return False
+
+            time.sleep(wait)
+            waited += wait
+
+    def remaining(self):
+        """
+        Fichas restantes em cada balde.
+
+        Returns:
+            dict: {'minute': int, 'day': int} (apenas os limites ativos)
+        """
+        with self._lock:
+            return {name: max(0, int(bucket.available())) for name, bucket in self._buckets.items()}
@@ -0,0 +1,299 @@
+"""
+Módulo de Índice de Mensagens Respondidas
+
+Este módulo impede respostas automáticas duplicadas. Cada mensagem
+respondida é registrada na tabela ``responded_message`` pelo seu Message-ID
+(ou, na falta dele, por um hash do conteúdo) e consultada antes da
+correspondência de regras e do envio. Os registros expiram após um período
+(TTL).
+
+Para que a consulta continue barata com um histórico grande, o índice
+mantém em memória um filtro de Bloom com todas as chaves válidas (uma
+resposta negativa dispensa o banco) e um cache LRU das chaves recentes.
+Chaves gravadas por outros processos entram no filtro a cada ``refresh()``,
+chamado no início de cada ciclo de processamento.
+"""
+
+import math
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.exc import IntegrityError
+
+from utils.metrics import metrics as default_metrics
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Tamanho máximo da chave (coluna RespondedMessage.key)
+MAX_KEY_LENGTH = 255
+
+# Margem de leitura das chaves novas, para diferenças de relógio entre processos
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+
+def message_key(email_data):
+    """
+    Chave de uma mensagem no índice.
+
+    Usa o Message-ID normalizado; se ausente (ou longo demais), um hash do
+    remetente, assunto, data e corpo.
+
+    Args:
+        email_data (dict): Dados extraídos do e-mail
+
+    Returns:
+        str: Chave da mensagem
+    """
+    message_id = (email_data.get('message_id') or '').strip().strip('<>').strip().lower()
+    if message_id and len(message_id) + 4 <= MAX_KEY_LENGTH:
+        return f"mid:{message_id}"
+
+    content = '\x00'.join([
+        message_id,
+        email_data.get('remetente') or '',
+        email_data.get('assunto') or '',
+        email_data.get('data') or '',
+        email_data.get('corpo') or '',
+    ])
+    return f"sha:{hashlib.blake2b(content.encode('utf-8'), digest_size=20).hexdigest()}"
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom simples sobre um bytearray.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        """
+        Inicializa o filtro vazio.
+
+        Args:
+            capacity (int): Quantidade de chaves prevista
+            error_rate (float): Taxa de falsos positivos desejada nessa capacidade
+        """
+        capacity = max(1, capacity)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        """Posições dos bits da chave (hash duplo)."""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        """Adiciona uma chave."""
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        """False se a chave certamente não foi adicionada."""
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class ReplyIndex:
+    """
+    Índice persistente das mensagens já respondidas.
+    """
+
+    def __init__(self, engine, ttl_days=30, lru_size=10000, bloom_capacity=100000,
+                 prune_interval=3600.0, metrics=None):
+        """
+        Inicializa o índice.
+
+        Args:
+            engine: Engine do SQLAlchemy
+            ttl_days (float): Dias durante os quais uma mensagem respondida é lembrada
+            lru_size (int): Quantidade de chaves recentes mantidas em memória
+            bloom_capacity (int): Capacidade mínima do filtro de Bloom
+            prune_interval (float): Intervalo mínimo, em segundos, entre remoções
+                dos registros expirados
+            metrics: Registro de métricas (por padrão, o registro global)
+        """
+        self.engine = engine
+        self.ttl = timedelta(days=ttl_days)
+        self.lru_size = max(1, lru_size)
+        self.bloom_capacity = bloom_capacity
+        self.prune_interval = timedelta(seconds=prune_interval)
+        self.metrics = metrics or default_metrics
+
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._bloom = None
+        self._loaded_until = None
+        self._last_prune = None
+
+    def _load_bloom(self):
+        """Reconstrói o filtro de Bloom com as chaves ainda válidas do banco."""
+        from models import RespondedMessage
+
+        table = RespondedMessage.__table__
+        cutoff = datetime.utcnow() - self.ttl
+        valid = table.c.responded_at >= cutoff
+        with self.engine.connect() as connection:
+            count = connection.execute(select(func.count()).select_from(table).where(valid)).scalar()
+
+            # Dimensionar com folga para as chaves novas até a próxima reconstrução
+            bloom = BloomFilter(max(self.bloom_capacity, 2 * count))
+            for key in connection.execution_options(yield_per=5000).execute(
+                    select(table.c.key).where(valid)).scalars():
+                bloom.add(key)
+
+        self._bloom = bloom
+        self._loaded_until = datetime.utcnow()
+        logger.info(f"Índice de mensagens respondidas carregado: {count} chaves")
+
+    def refresh(self):
+        """
+        Adiciona ao filtro de Bloom as chaves registradas por outros processos.
+
+        Lê apenas os registros gravados desde a última leitura (com uma
+        margem para diferenças de relógio), usando o índice de responded_at.
+        Também remove os registros expirados, se já for a hora.
+        """
+        from models import RespondedMessage
+
+        self.prune()
+
+        with self._lock:
+            if self._bloom is None:
+                self._load_bloom()
+                return
+
+            table = RespondedMessage.__table__
+            since = self._loaded_until - REFRESH_OVERLAP
+            now = datetime.utcnow()
+            with self.engine.connect() as connection:
+                for key in connection.execute(select(table.c.key).where(table.c.responded_at >= since)).scalars():
+                    self._bloom.add(key)
+            self._loaded_until = now
+
+    def _remember(self, key, responded_at):
+        """Guarda a chave no cache LRU."""
+        self._recent[key] = responded_at
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.lru_size:
+            self._recent.popitem(last=False)
+
+    def contains(self, key):
+        """
+        Verifica se a mensagem já foi respondida dentro do TTL.
+
+        Args:
+            key (str): Chave da mensagem (ver ``message_key``)
+
+        Returns:
+            bool: True se a mensagem já foi respondida
+        """
+        from models import RespondedMessage
+
+        cutoff = datetime.utcnow() - self.ttl
+        with self._lock:
+            if self._bloom is None:
+                self._load_bloom()
+
+            if key not in self._bloom:
+                self.metrics.incr('reply_index.bloom_negative')
+                return False
+
+            responded_at = self._recent.get(key)
+            if responded_at is not None:
+                self._recent.move_to_end(key)
+                self.metrics.incr('reply_index.lru_hit')
+                return responded_at >= cutoff
+
+        # Possível positivo: confirmar no banco (consulta pela chave primária)
+        table = RespondedMessage.__table__
+        with self.engine.connect() as connection:
+            responded_at = connection.execute(
+                select(table.c.responded_at).where(table.c.key == key)
+            ).scalar()
+
+        self.metrics.incr('reply_index.db_lookup')
+        if responded_at is None:
+            return False
+
+        with self._lock:
+            self._remember(key, responded_at)
+        return responded_at >= cutoff
+
+    def add(self, key, sender=None):
+        """
+        Registra uma mensagem como respondida.
+
+        Args:
+            key (str): Chave da mensagem (ver ``message_key``)
+            sender (str): Remetente da mensagem
+
+        Returns:
+            bool: True se o registro foi gravado
+        """
+        from models import RespondedMessage
+
+        table = RespondedMessage.__table__
+        now = datetime.utcnow()
+        try:
+            with self.engine.begin() as connection:
+                # Registro expirado ainda não removido: renovar a data
+                renewed = connection.execute(
+                    update(table).where(table.c.key == key).values(sender=sender, responded_at=now)
+                ).rowcount
+                if not renewed:
+                    connection.execute(insert(table).values(key=key, sender=sender, responded_at=now))
+        except IntegrityError:
+            # Outro processo registrou a mesma mensagem ao mesmo tempo
+            pass
+        except Exception as e:
+            logger.error(f"Erro ao registrar mensagem respondida {key}: {str(e)}")
+            return False
+
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(key)
+            self._remember(key, now)
+        return True
+
+    def prune(self, force=False):
+        """
+        Remove os registros expirados e reconstrói o filtro de Bloom.
+
+        Executa no máximo uma vez por ``prune_interval``, exceto com ``force``.
+
+        Args:
+            force (bool): Remover mesmo antes do intervalo mínimo
+
+        Returns:
+            int: Quantidade de registros removidos
+        """
+        from models import RespondedMessage
+
+        now = datetime.utcnow()
+        if not force and self._last_prune is not None and now - self._last_prune < self.prune_interval:
+            return 0
+        self._last_prune = now
+
+        table = RespondedMessage.__table__
+        try:
+            with self.engine.begin() as connection:
+                removed = connection.execute(
+                    delete(table).where(table.c.responded_at < now - self.ttl)
+                ).rowcount
+        except Exception as e:
+            logger.error(f"Erro ao remover mensagens respondidas expiradas: {str(e)}")
+            return 0
+
+        with self._lock:
+            self._load_bloom()
+            cutoff = now - self.ttl
+            for key in [key for key, responded_at in self._recent.items() if responded_at < cutoff]:
+                del self._recent[key]
+
+        if removed:
+            logger.info(f"{removed} mensagens respondidas expiradas removidas do índice")
+        return removed
@@ -0,0 +1,174 @@
+"""
+Módulo de Retenção dos Logs de E-mail
+
+Este módulo arquiva e remove os logs brutos mais antigos que o período de
+retenção. Os registros são lidos em lotes na ordem de ``(processed_at, id)``
+(usando o índice da paginação), gravados em um arquivo NDJSON compactado
+com gzip e só então removidos do banco, um lote por transação, para não
+bloquear o processamento nem a interface por muito tempo.
+
+Os agregados do painel (``email_log_rollup``) são mantidos; apenas os
+agregados por hora mais antigos que ``hourly_rollup_days`` são removidos.
+As respostas já enviadas da caixa de saída (``outbox_message``) seguem o
+mesmo período de retenção dos logs; as descartadas (``dead``) são mantidas
+para análise.
+
+Uso pela linha de comando (ex.: diariamente via cron):
+    python -m utils.retention --days 90 --archive-dir data/archive
+"""
+
+import os
+import gzip
+import json
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func
+
+from utils.outbox import STATUS_SENT
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+
+def _serialize(row):
+    """Converte um log em uma linha NDJSON."""
+    record = dict(row)
+    record['processed_at'] = record['processed_at'].isoformat() if record['processed_at'] else None
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def archive_and_prune(engine, retention_days, archive_dir='data/archive', chunk_size=1000,
+                      hourly_rollup_days=90, dry_run=False):
+    """
+    Arquiva e remove os logs mais antigos que o período de retenção.
+
+    Cada lote é gravado e sincronizado com o disco antes de ser removido do
+    banco; se o processo for interrompido, o arquivo contém ao menos todos
+    os registros já removidos.
+
+    Args:
+        engine: Engine do SQLAlchemy
+        retention_days (int): Idade máxima, em dias, dos logs brutos
+        archive_dir (str): Diretório dos arquivos gerados
+        chunk_size (int): Quantidade de logs arquivados e removidos por transação
+        hourly_rollup_days (int): Idade máxima dos agregados por hora
+            (None para mantê-los)
+        dry_run (bool): Apenas contar os logs que seriam arquivados
+
+    Returns:
+        dict: Quantidade de logs arquivados, arquivo gerado, agregados e
+            respostas enviadas removidos
+    """
+    from models import EmailLog, EmailLogRollup, OutboxMessage
+
+    log = EmailLog.__table__
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    summary = {'archived': 0, 'archive_file': None, 'rollups_removed': 0, 'outbox_removed': 0}
+
+    columns = [log.c.id, log.c.sender, log.c.subject, log.c.matched_rule,
+               log.c.processed_at, log.c.response_sent, log.c.suppressed]
+    base_query = (
+        select(*columns)
+        .where(log.c.processed_at < cutoff)
+        .order_by(log.c.processed_at, log.c.id)
+        .limit(chunk_size)
+    )
+
+    if dry_run:
+        with engine.connect() as connection:
+            summary['archived'] = connection.execute(
+                select(func.count()).select_from(log).where(log.c.processed_at < cutoff)
+            ).scalar()
+        return summary
+
+    raw_file = None
+    archive_file = None
+    archive_path = None
+    try:
+        while True:
+            with engine.begin() as connection:
+                rows = connection.execute(base_query).mappings().all()
+                if not rows:
+                    break
+
+                if archive_file is None:
+                    os.makedirs(archive_dir, exist_ok=True)
+                    stamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+                    archive_path = os.path.join(
+                        archive_dir, f"email_log-before-{cutoff:%Y%m%d}-{stamp}.ndjson.gz"
+                    )
+                    raw_file = open(archive_path, 'wb')
+                    archive_file = gzip.GzipFile(fileobj=raw_file, mode='wb')
+
+                archive_file.write(''.join(_serialize(row) for row in rows).encode('utf-8'))
+
+                # Garantir que o lote está no disco antes de removê-lo do banco
+                archive_file.flush()
+                raw_file.flush()
+                os.fsync(raw_file.fileno())
+
+                connection.execute(delete(log).where(log.c.id.in_([row['id'] for row in rows])))
+
+            summary['archived'] += len(rows)
+            logger.info(f"{summary['archived']} logs arquivados até agora")
+    finally:
+        if archive_file is not None:
+            archive_file.close()
+            raw_file.close()
+
+    summary['archive_file'] = archive_path
+
+    if hourly_rollup_days is not None:
+        rollup = EmailLogRollup.__table__
+        rollup_cutoff = datetime.utcnow() - timedelta(days=hourly_rollup_days)
+        with engine.begin() as connection:
+            summary['rollups_removed'] = connection.execute(
+                delete(rollup).where(rollup.c.granularity == 'hour', rollup.c.bucket_start < rollup_cutoff)
+            ).rowcount
+
+    # O conteúdo das respostas enviadas já está no log; basta removê-las
+    outbox = OutboxMessage.__table__
+    with engine.begin() as connection:
+        summary['outbox_removed'] = connection.execute(
+            delete(outbox).where(outbox.c.status == STATUS_SENT, outbox.c.sent_at < cutoff)
+        ).rowcount
+
+    logger.info(
+        f"Retenção concluída: {summary['archived']} logs arquivados em {archive_path}, "
+        f"{summary['rollups_removed']} agregados por hora e "
+        f"{summary['outbox_removed']} respostas enviadas removidos"
+    )
+    return summary
+
+
+def main():
+    """Ponto de entrada da linha de comando."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Arquiva e remove logs de e-mail antigos")
+    parser.add_argument('--days', type=int, default=int(os.getenv('LOG_RETENTION_DAYS', 90)),
+                        help="Idade máxima, em dias, dos logs brutos")
+    parser.add_argument('--archive-dir', default=os.getenv('LOG_ARCHIVE_DIR', 'data/archive'))
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--hourly-rollup-days', type=int,
+                        default=int(os.getenv('ROLLUP_HOURLY_RETENTION_DAYS', 90)))
+    parser.add_argument('--dry-run', action='store_true', help="Apenas contar os logs afetados")
+    args = parser.parse_args()
+
+    from app import app, db
+
+    with app.app_context():
+        summary = archive_and_prune(
+            db.engine, args.days, archive_dir=args.archive_dir, chunk_size=args.chunk_size,
+            hourly_rollup_days=args.hourly_rollup_days, dry_run=args.dry_run
+        )
+
+    if args.dry_run:
+        print(f"{summary['archived']} logs seriam arquivados")
+    else:
+        print(f"{summary['archived']} logs arquivados em {summary['archive_file']}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
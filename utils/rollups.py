@@ -0,0 +1,248 @@
+"""
+Módulo de Agregados dos Logs de E-mail
+
+Este módulo mantém a tabela ``email_log_rollup``: contagens de respostas
+enviadas, com falha e suprimidas (limite por remetente) por hora e por dia,
+para cada regra. Os agregados são
+atualizados de forma incremental (upsert somando às contagens existentes) na
+mesma transação em que os logs são gravados, e o painel consulta apenas
+essa tabela, nunca os logs brutos.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from collections import defaultdict
+from sqlalchemy import select, insert, update, delete, func, false, inspect
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Granularidades mantidas
+GRANULARITIES = ('hour', 'day')
+
+# Linhas por comando de upsert (limite de parâmetros do SQLite)
+UPSERT_CHUNK_SIZE = 150
+
+
+def bucket_start(moment, granularity):
+    """
+    Início do intervalo (hora ou dia) que contém um instante.
+
+    Args:
+        moment (datetime): Instante
+        granularity (str): 'hour' ou 'day'
+
+    Returns:
+        datetime: Início do intervalo
+    """
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate(records):
+    """
+    Agrega registros de log por intervalo e regra.
+
+    Args:
+        records (iterable): Dicionários com processed_at, matched_rule,
+            response_sent e (opcional) suppressed
+
+    Returns:
+        dict: (granularidade, início, regra) -> [enviados, falhas, suprimidos]
+    """
+    counts = defaultdict(lambda: [0, 0, 0])
+    for record in records:
+        moment = record['processed_at'] or datetime.utcnow()
+        rule = record['matched_rule'] or ''
+        if record.get('suppressed'):
+            column = 2
+        else:
+            column = 0 if record['response_sent'] else 1
+        for granularity in GRANULARITIES:
+            counts[(granularity, bucket_start(moment, granularity), rule)][column] += 1
+    return counts
+
+
+def apply_rollups(connection, records):
+    """
+    Soma os registros aos agregados, na transação da conexão informada.
+
+    Args:
+        connection: Conexão do SQLAlchemy (dentro de uma transação)
+        records (iterable): Registros de log gravados
+    """
+    _upsert_counts(connection, aggregate(records))
+
+
+def _upsert_counts(connection, counts):
+    """Soma as contagens agregadas às linhas existentes, criando as ausentes."""
+    from models import EmailLogRollup
+
+    table = EmailLogRollup.__table__
+    rows = [
+        {'granularity': granularity, 'bucket_start': start, 'rule': rule,
+         'sent_count': sent, 'failed_count': failed, 'suppressed_count': suppressed}
+        for (granularity, start, rule), (sent, failed, suppressed) in counts.items()
+    ]
+
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        _apply_rollups_portable(connection, table, rows)
+        return
+
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        statement = dialect_insert(table).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        statement = statement.on_conflict_do_update(
+            index_elements=['granularity', 'bucket_start', 'rule'],
+            set_={
+                'sent_count': table.c.sent_count + statement.excluded.sent_count,
+                'failed_count': table.c.failed_count + statement.excluded.failed_count,
+                'suppressed_count': table.c.suppressed_count + statement.excluded.suppressed_count,
+            }
+        )
+        connection.execute(statement)
+
+
+def _apply_rollups_portable(connection, table, rows):
+    """Upsert linha a linha para bancos sem ON CONFLICT."""
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.granularity == row['granularity'],
+                   table.c.bucket_start == row['bucket_start'],
+                   table.c.rule == row['rule'])
+            .values(sent_count=table.c.sent_count + row['sent_count'],
+                    failed_count=table.c.failed_count + row['failed_count'],
+                    suppressed_count=table.c.suppressed_count + row['suppressed_count'])
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**row))
+
+
+def rebuild_rollups(connection, batch_size=5000):
+    """
+    Recalcula todos os agregados a partir dos logs brutos.
+
+    Usado no preenchimento inicial; os logs são lidos em lotes, sem
+    carregar a tabela inteira em memória. Funciona também antes da
+    migração que adiciona a coluna ``suppressed`` (nenhum log suprimido).
+
+    Args:
+        connection: Conexão do SQLAlchemy (dentro de uma transação)
+        batch_size (int): Quantidade de logs lidos por vez
+
+    Returns:
+        int: Quantidade de logs agregados
+    """
+    from models import EmailLog, EmailLogRollup
+
+    log = EmailLog.__table__
+    connection.execute(delete(EmailLogRollup.__table__))
+
+    columns = {column['name'] for column in inspect(connection).get_columns(log.name)}
+    suppressed = log.c.suppressed if 'suppressed' in columns else false().label('suppressed')
+    result = connection.execution_options(yield_per=batch_size).execute(
+        select(log.c.processed_at, log.c.matched_rule, log.c.response_sent, suppressed)
+    )
+
+    # O número de intervalos é pequeno: agregar tudo em memória e gravar uma vez
+    total = 0
+
+    def records():
+        nonlocal total
+        for record in result.mappings():
+            total += 1
+            yield record
+
+    _upsert_counts(connection, aggregate(records()))
+
+    logger.info(f"Agregados recalculados a partir de {total} logs")
+    return total
+
+
+def daily_totals(session, days=14):
+    """
+    Totais diários de enviados, falhas e suprimidos.
+
+    Args:
+        session: Sessão do SQLAlchemy
+        days (int): Quantidade de dias, incluindo hoje
+
+    Returns:
+        list: Tuplas (dia, enviados, falhas, suprimidos), do mais antigo ao mais recente,
+        incluindo dias sem e-mails
+    """
+    from models import EmailLogRollup
+
+    first_day = bucket_start(datetime.utcnow(), 'day') - timedelta(days=days - 1)
+    rows = session.execute(
+        select(EmailLogRollup.bucket_start,
+               func.sum(EmailLogRollup.sent_count), func.sum(EmailLogRollup.failed_count),
+               func.sum(EmailLogRollup.suppressed_count))
+        .where(EmailLogRollup.granularity == 'day', EmailLogRollup.bucket_start >= first_day)
+        .group_by(EmailLogRollup.bucket_start)
+    ).all()
+
+    by_day = {day: (sent or 0, failed or 0, suppressed or 0) for day, sent, failed, suppressed in rows}
+    totals = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        totals.append((day,) + by_day.get(day, (0, 0, 0)))
+    return totals
+
+
+def rule_totals(session, days=30, limit=10):
+    """
+    Totais por regra no período, das mais acionadas para as menos.
+
+    Args:
+        session: Sessão do SQLAlchemy
+        days (int): Quantidade de dias, incluindo hoje
+        limit (int): Quantidade máxima de regras
+
+    Returns:
+        list: Tuplas (regra, enviados, falhas, suprimidos); regra '' é a
+        resposta genérica
+    """
+    from models import EmailLogRollup
+
+    first_day = bucket_start(datetime.utcnow(), 'day') - timedelta(days=days - 1)
+    sent = func.sum(EmailLogRollup.sent_count)
+    failed = func.sum(EmailLogRollup.failed_count)
+    suppressed = func.sum(EmailLogRollup.suppressed_count)
+    rows = session.execute(
+        select(EmailLogRollup.rule, sent, failed, suppressed)
+        .where(EmailLogRollup.granularity == 'day', EmailLogRollup.bucket_start >= first_day)
+        .group_by(EmailLogRollup.rule)
+        .order_by((sent + failed + suppressed).desc())
+        .limit(limit)
+    ).all()
+    return [(rule, sent or 0, failed or 0, suppressed or 0) for rule, sent, failed, suppressed in rows]
+
+
+def sent_since(connection, since):
+    """
+    Quantidade de respostas enviadas desde um momento, pelos agregados por hora.
+
+    A hora que contém ``since`` é contada inteira, de modo que o resultado
+    nunca é menor que o número real de envios.
+
+    Args:
+        connection: Conexão (ou sessão) do SQLAlchemy
+        since (datetime): Início do período (UTC)
+
+    Returns:
+        int: Respostas enviadas no período
+    """
+    from models import EmailLogRollup
+
+    table = EmailLogRollup.__table__
+    return connection.execute(
+        select(func.sum(table.c.sent_count))
+        .where(table.c.granularity == 'hour', table.c.bucket_start >= bucket_start(since, 'hour'))
+    ).scalar() or 0
@@ -0,0 +1,313 @@
+"""
+Importação e Exportação de Regras
+
+Este módulo implementa a importação em massa de regras (CSV, JSON ou NDJSON)
+com validação e upsert em uma única transação, e a exportação das regras em
+fluxo (streaming), sem carregar a tabela inteira em memória.
+
+Uso pela linha de comando:
+    python -m utils.rule_io import regras.csv
+    python -m utils.rule_io export --format ndjson --output regras.ndjson
+"""
+
+import io
+import os
+import csv
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import select, insert, update
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Formatos suportados
+FORMATS = ('csv', 'json', 'ndjson')
+
+# Tamanho máximo da palavra-chave (coluna Rule.keyword)
+MAX_KEYWORD_LENGTH = 100
+
+# Quantidade de linhas lidas do banco por vez na exportação
+EXPORT_BATCH_SIZE = 1000
+
+# Valores aceitos como verdadeiro/falso nas colunas is_active e subject_only
+_TRUE_VALUES = {'1', 'true', 't', 'yes', 'y', 'sim', 's'}
+_FALSE_VALUES = {'0', 'false', 'f', 'no', 'n', 'nao', 'não'}
+
+
+class RuleImportError(Exception):
+    """Erro de validação de um arquivo de regras; ``errors`` lista os problemas."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} erro(s) no arquivo de regras")
+        self.errors = errors
+
+
+def detect_format(filename, default='csv'):
+    """
+    Deduz o formato a partir da extensão do arquivo.
+
+    Args:
+        filename (str): Nome do arquivo
+        default (str): Formato usado se a extensão não for reconhecida
+
+    Returns:
+        str: 'csv', 'json' ou 'ndjson'
+    """
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson'):
+        return 'ndjson'
+    return extension if extension in FORMATS else default
+
+
+def _read_records(stream, fmt):
+    """Lê os registros brutos do arquivo, com o número da linha/item de cada um."""
+    if fmt == 'csv':
+        for line_number, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_number, row
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                yield line_number, json.loads(line)
+    elif fmt == 'json':
+        data = json.load(stream)
+        # Aceita lista de objetos ou o instantâneo gravado pelo RuleManager
+        if isinstance(data, dict):
+            rules = data.get('rules', [])
+            if not isinstance(rules, list):
+                raise ValueError("'rules' deve ser uma lista")
+            data = [
+                {'keyword': item[0], 'response': item[1]} if isinstance(item, list) and len(item) == 2 else item
+                for item in rules
+            ]
+        if not isinstance(data, list):
+            raise ValueError("o conteúdo deve ser uma lista de objetos")
+        for item_number, item in enumerate(data, start=1):
+            yield item_number, item
+    else:
+        raise ValueError(f"Formato não suportado: {fmt}")
+
+
+def _parse_bool(value, default=True):
+    """Converte o valor de uma coluna booleana; None para valores inválidos."""
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    return None
+
+
+def parse_rules(stream, fmt):
+    """
+    Lê e valida as regras de um arquivo.
+
+    Cada registro precisa de ``keyword`` (ou ``palavra_chave``) e ``response``
+    (ou ``resposta``); ``is_active`` e ``subject_only`` são opcionais. Se a mesma palavra-chave
+    aparecer mais de uma vez, vale a última ocorrência.
+
+    Args:
+        stream: Arquivo de texto aberto
+        fmt (str): 'csv', 'json' ou 'ndjson'
+
+    Returns:
+        list: Regras validadas ({'keyword', 'response', 'is_active', 'subject_only'})
+
+    Raises:
+        RuleImportError: Se algum registro for inválido
+    """
+    rules = {}
+    errors = []
+
+    try:
+        for position, record in _read_records(stream, fmt):
+            if not isinstance(record, dict):
+                errors.append(f"Linha {position}: registro deve ser um objeto")
+                continue
+
+            keyword = record.get('keyword') or record.get('palavra_chave') or ''
+            response = record.get('response') or record.get('resposta') or ''
+            if not isinstance(keyword, str) or not isinstance(response, str):
+                errors.append(f"Linha {position}: palavra-chave e resposta devem ser texto")
+                continue
+            keyword = keyword.strip()
+            response = response.strip()
+            is_active = _parse_bool(record.get('is_active'))
+            subject_only = _parse_bool(record.get('subject_only'), default=False)
+
+            if not keyword:
+                errors.append(f"Linha {position}: palavra-chave ausente")
+            elif len(keyword) > MAX_KEYWORD_LENGTH:
+                errors.append(f"Linha {position}: palavra-chave com mais de {MAX_KEYWORD_LENGTH} caracteres")
+            elif not response:
+                errors.append(f"Linha {position}: resposta ausente para '{keyword}'")
+            elif is_active is None:
+                errors.append(f"Linha {position}: valor inválido para is_active")
+            elif subject_only is None:
+                errors.append(f"Linha {position}: valor inválido para subject_only")
+            else:
+                rules[keyword] = {'keyword': keyword, 'response': response, 'is_active': is_active,
+                                  'subject_only': subject_only}
+    except (ValueError, KeyError, csv.Error) as e:
+        errors.append(f"Arquivo inválido: {str(e)}")
+
+    if errors:
+        raise RuleImportError(errors)
+
+    return list(rules.values())
+
+
+def import_rules(session, rules):
+    """
+    Insere ou atualiza as regras em uma única transação.
+
+    Uma consulta carrega as palavras-chave existentes; as novas regras são
+    inseridas e as existentes atualizadas com operações em massa.
+
+    Args:
+        session: Sessão do SQLAlchemy
+        rules (list): Regras validadas por ``parse_rules``
+
+    Returns:
+        dict: Quantidade de regras inseridas e atualizadas
+    """
+    from models import Rule, bump_rules_version
+
+    now = datetime.utcnow()
+    existing = dict(session.execute(select(Rule.keyword, Rule.id)).all())
+
+    inserts = []
+    updates = []
+    for rule in rules:
+        rule_id = existing.get(rule['keyword'])
+        if rule_id is None:
+            inserts.append({**rule, 'created_at': now, 'updated_at': now})
+        else:
+            updates.append({'id': rule_id, 'response': rule['response'],
+                            'is_active': rule['is_active'], 'subject_only': rule['subject_only'],
+                            'updated_at': now})
+
+    try:
+        if inserts:
+            session.execute(insert(Rule), inserts)
+        if updates:
+            session.execute(update(Rule), updates)
+
+        # Operações em massa não disparam os eventos do mapeamento
+        if inserts or updates:
+            bump_rules_version(session)
+
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    logger.info(f"Importação de regras: {len(inserts)} inseridas, {len(updates)} atualizadas")
+    return {'inserted': len(inserts), 'updated': len(updates)}
+
+
+def export_rules(session, fmt='csv'):
+    """
+    Exporta as regras em fluxo, lendo o banco em lotes.
+
+    Args:
+        session: Sessão do SQLAlchemy
+        fmt (str): 'csv', 'json' ou 'ndjson'
+
+    Yields:
+        str: Trechos do arquivo exportado
+    """
+    from models import Rule
+
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato não suportado: {fmt}")
+
+    rows = session.execute(
+        select(Rule.keyword, Rule.response, Rule.is_active, Rule.subject_only)
+        .order_by(Rule.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['keyword', 'response', 'is_active', 'subject_only'])
+        for partition in rows.partitions():
+            for keyword, response, is_active, subject_only in partition:
+                writer.writerow([keyword, response, 'true' if is_active else 'false',
+                                 'true' if subject_only else 'false'])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    first = True
+    if fmt == 'json':
+        yield '['
+    for partition in rows.partitions():
+        chunk = []
+        for keyword, response, is_active, subject_only in partition:
+            item = json.dumps({'keyword': keyword, 'response': response, 'is_active': bool(is_active),
+                               'subject_only': bool(subject_only)}, ensure_ascii=False)
+            if fmt == 'json':
+                chunk.append(item if first else ',' + item)
+            else:
+                chunk.append(item + '\n')
+            first = False
+        yield ''.join(chunk)
+    if fmt == 'json':
+        yield ']'
+
+
+def main():
+    """Ponto de entrada da linha de comando."""
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Importa e exporta regras de resposta em massa")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="Importa regras de um arquivo")
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=FORMATS, help="Padrão: deduzido da extensão")
+
+    export_parser = subparsers.add_parser('export', help="Exporta as regras")
+    export_parser.add_argument('--format', choices=FORMATS, default='csv')
+    export_parser.add_argument('--output', help="Arquivo de saída (padrão: saída padrão)")
+
+    args = parser.parse_args()
+
+    from app import app, db
+
+    with app.app_context():
+        if args.command == 'import':
+            fmt = args.format or detect_format(args.file)
+            try:
+                with open(args.file, 'r', encoding='utf-8-sig', newline='') as f:
+                    rules = parse_rules(f, fmt)
+            except RuleImportError as e:
+                for error in e.errors:
+                    print(error, file=sys.stderr)
+                return 1
+
+            summary = import_rules(db.session, rules)
+            print(f"{summary['inserted']} regras inseridas, {summary['updated']} atualizadas")
+            return 0
+
+        output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            for chunk in export_rules(db.session, args.format):
+                output.write(chunk)
+        finally:
+            if args.output:
+                output.close()
+        return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
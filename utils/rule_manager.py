@@ -3,38 +3,87 @@ Gerenciador de Regras
 
 Este módulo implementa um gerenciador para as regras de resposta automática,
 permitindo carregar, adicionar e gerenciar regras de resposta.
+
+O arquivo de regras é um instantâneo do estado do banco de dados: alterações
+próximas são agrupadas em uma única gravação (debounce), feita de forma
+atômica (arquivo temporário, fsync e renomeação).
 """
 
 import os
 import json
+import atexit
 import logging
+import threading
+import weakref
 from datetime import datetime
 from sqlalchemy.exc import SQLAlchemyError
+from utils.atomic_file import atomic_write
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Versão do formato do arquivo de regras (a versão 1 é a lista de objetos)
+RULES_FILE_FORMAT = 2
+
+# Gerenciadores ativos, gravados ao encerrar o processo (referências fracas,
+# para que o registro no atexit não os mantenha vivos)
+_instances = weakref.WeakSet()
+
+
+def _flush_all():
+    """Grava as alterações pendentes de todos os gerenciadores ativos."""
+    for manager in list(_instances):
+        manager.flush()
+
+
+atexit.register(_flush_all)
+
 class RuleManager:
     """
     Classe para gerenciar regras de resposta automática.
     """
     
-    def __init__(self, db_session=None, rules_file='data/rules.json'):
+    def __init__(self, db_session=None, rules_file='data/rules.json', save_delay=1.0):
         """
         Inicializa o gerenciador de regras.
         
         Args:
             db_session: Sessão do SQLAlchemy para acesso ao banco de dados
             rules_file (str): Caminho para o arquivo JSON de regras alternativo
+            save_delay (float): Segundos aguardados para agrupar alterações
+                antes de gravar o arquivo de regras
         """
         self.db_session = db_session
         self.rules_file = rules_file
+        self.save_delay = save_delay
         self.rules_dict = {}
         self.last_update = None
+        self.rules_version = None
+        self._stale = False
+        
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._dirty = False
+        self._file_version = self._read_file_version()
+        
+        # Gravar alterações pendentes ao encerrar o processo
+        _instances.add(self)
+        
+        # Ser avisado, no mesmo processo, quando uma alteração de regras for confirmada
+        if self.db_session:
+            try:
+                from models import on_rules_changed
+                on_rules_changed(self._mark_stale)
+            except Exception as e:
+                logger.warning(f"Notificação de alterações de regras indisponível: {str(e)}")
         
         # Carregar regras
         self.load_rules()
     
+    def _mark_stale(self):
+        """Marca as regras em memória como desatualizadas."""
+        self._stale = True
+    
     def load_rules(self):
         """
         Carrega regras do banco de dados ou arquivo JSON.
@@ -45,19 +94,27 @@ class RuleManager:
         # Tentar carregar do banco de dados primeiro
         if self.db_session:
             try:
-                from models import Rule
+                from models import Rule, get_rules_version
                 
+                # Ler a versão antes das regras: uma alteração concorrente
+                # apenas provoca um novo recarregamento na próxima verificação
+                self._stale = False
+                version = get_rules_version(self.db_session)
                 db_rules = self.db_session.query(Rule).filter_by(is_active=True).all()
                 
-                # Limpar regras existentes
-                self.rules_dict.clear()
-                
-                # Adicionar regras do banco de dados
-                for rule in db_rules:
-                    self.rules_dict[rule.keyword] = rule.response
+                # Substituir as regras em memória pelas do banco de dados
+                with self._save_lock:
+                    self.rules_dict.clear()
+                    for rule in db_rules:
+                        self.rules_dict[rule.keyword] = rule.response
                 
+                self.rules_version = version
                 self.last_update = datetime.now()
-                logger.info(f"Carregadas {len(self.rules_dict)} regras do banco de dados")
+                logger.info(f"Carregadas {len(self.rules_dict)} regras do banco de dados (versão {version})")
+                
+                # Manter o arquivo como instantâneo do banco de dados
+                if self._file_version != version:
+                    self.save_rules()
                 
                 return self.rules_dict
                 
@@ -68,16 +125,12 @@ class RuleManager:
         # Se não conseguiu carregar do banco de dados, tenta do arquivo
         try:
             if os.path.exists(self.rules_file):
-                with open(self.rules_file, 'r', encoding='utf-8') as f:
-                    rules_data = json.load(f)
+                rules, version = self._read_rules_file()
                 
-                # Limpar regras existentes
-                self.rules_dict.clear()
-                
-                # Adicionar regras do arquivo
-                for rule in rules_data:
-                    if 'palavra_chave' in rule and 'resposta' in rule:
-                        self.rules_dict[rule['palavra_chave']] = rule['resposta']
+                # Substituir as regras em memória pelas do arquivo
+                with self._save_lock:
+                    self.rules_dict = rules
+                self.rules_version = version
                 
                 self.last_update = datetime.now()
                 logger.info(f"Carregadas {len(self.rules_dict)} regras do arquivo {self.rules_file}")
@@ -87,11 +140,54 @@ class RuleManager:
                 
         except Exception as e:
             logger.error(f"Erro ao carregar regras do arquivo: {str(e)}")
-            # Usar regras padrão
-            self._load_default_rules()
+            
+            # Preservar o arquivo inválido para análise em vez de sobrescrevê-lo
+            self._quarantine_rules_file()
+            
+            # Manter as regras já carregadas; usar as padrão apenas se não houver nenhuma
+            if not self.rules_dict:
+                self._load_default_rules()
         
         return self.rules_dict
     
+    def _read_rules_file(self):
+        """
+        Lê o arquivo de regras, aceitando o formato atual e o antigo.
+        
+        Returns:
+            tuple: (dicionário de regras, versão das regras no banco ou None)
+        """
+        with open(self.rules_file, 'r', encoding='utf-8') as f:
+            rules_data = json.load(f)
+        
+        # Formato antigo: lista de objetos {"palavra_chave", "resposta"}
+        if isinstance(rules_data, list):
+            rules = {
+                rule['palavra_chave']: rule['resposta']
+                for rule in rules_data
+                if 'palavra_chave' in rule and 'resposta' in rule
+            }
+            return rules, None
+        
+        # Formato atual: pares [palavra_chave, resposta] com a versão do banco
+        return dict(rules_data['rules']), rules_data.get('rules_version')
+    
+    def _read_file_version(self):
+        """Versão do banco registrada no arquivo de regras, sem carregar as regras."""
+        try:
+            return self._read_rules_file()[1]
+        except Exception:
+            return None
+    
+    def _quarantine_rules_file(self):
+        """Renomeia um arquivo de regras inválido para que não seja sobrescrito."""
+        try:
+            corrupt_file = f"{self.rules_file}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            os.replace(self.rules_file, corrupt_file)
+            logger.warning(f"Arquivo de regras inválido movido para {corrupt_file}")
+        except OSError as e:
+            logger.error(f"Erro ao preservar arquivo de regras inválido: {str(e)}")
+    
     def _load_default_rules(self):
         """Carrega regras padrão quando não há outra fonte disponível."""
         self.rules_dict = {
@@ -114,33 +210,70 @@ class RuleManager:
         self.last_update = datetime.now()
         logger.info(f"Carregadas {len(self.rules_dict)} regras padrão")
     
-    def save_rules(self):
+    def save_rules(self, immediate=False):
         """
-        Salva regras no arquivo JSON.
+        Agenda a gravação das regras no arquivo JSON.
         
+        Alterações feitas dentro de ``save_delay`` segundos são agrupadas em
+        uma única gravação.
+        
+        Args:
+            immediate (bool): Se True, grava imediatamente
+            
         Returns:
-            bool: True se o salvamento foi bem-sucedido, False caso contrário
+            bool: True se a gravação foi agendada ou concluída com sucesso
         """
-        try:
-            # Criar diretório se não existir
-            os.makedirs(os.path.dirname(self.rules_file), exist_ok=True)
+        with self._save_lock:
+            self._dirty = True
             
-            # Converter para o formato de lista
-            rules_list = [
-                {"palavra_chave": palavra_chave, "resposta": resposta}
-                for palavra_chave, resposta in self.rules_dict.items()
-            ]
+            if not immediate and self.save_delay > 0:
+                if self._save_timer is None:
+                    self._save_timer = threading.Timer(self.save_delay, self.flush)
+                    self._save_timer.daemon = True
+                    self._save_timer.start()
+                return True
+        
+        return self.flush()
+    
+    def flush(self):
+        """
+        Grava as alterações pendentes de forma atômica.
+        
+        A gravação é feita sob o mesmo bloqueio das alterações em memória, de
+        modo que um instantâneo mais antigo nunca sobrescreve um mais novo.
+        
+        Returns:
+            bool: True se não havia alterações ou se a gravação foi bem-sucedida
+        """
+        with self._save_lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
             
-            # Salvar no arquivo
-            with open(self.rules_file, 'w', encoding='utf-8') as f:
-                json.dump(rules_list, f, ensure_ascii=False, indent=4)
+            if not self._dirty:
+                return True
             
-            logger.info(f"Regras salvas em {self.rules_file}")
-            return True
+            # Instantâneo consistente das regras e da versão correspondente
+            snapshot = {
+                "format": RULES_FILE_FORMAT,
+                "rules_version": self.rules_version,
+                "saved_at": datetime.now().isoformat(),
+                "rules": [[palavra_chave, resposta] for palavra_chave, resposta in self.rules_dict.items()]
+            }
+            self._dirty = False
             
-        except Exception as e:
-            logger.error(f"Erro ao salvar regras: {str(e)}")
-            return False
+            try:
+                # JSON compacto: carrega rapidamente mesmo com muitas regras
+                atomic_write(self.rules_file, json.dumps(snapshot, ensure_ascii=False, separators=(',', ':')))
+                
+                self._file_version = snapshot["rules_version"]
+                logger.info(f"Regras salvas em {self.rules_file}")
+                return True
+                
+            except Exception as e:
+                logger.error(f"Erro ao salvar regras: {str(e)}")
+                self._dirty = True
+                return False
     
     def add_rule(self, keyword, response):
         """
@@ -155,7 +288,8 @@ class RuleManager:
         """
         try:
             # Adicionar ao dicionário em memória
-            self.rules_dict[keyword] = response
+            with self._save_lock:
+                self.rules_dict[keyword] = response
             
             # Adicionar ao banco de dados, se disponível
             if self.db_session:
@@ -210,8 +344,8 @@ class RuleManager:
         """
         try:
             # Remover do dicionário em memória
-            if keyword in self.rules_dict:
-                del self.rules_dict[keyword]
+            with self._save_lock:
+                self.rules_dict.pop(keyword, None)
             
             # Remover do banco de dados, se disponível
             if self.db_session:
@@ -262,24 +396,24 @@ class RuleManager:
             dict: Dicionário com as regras atualizadas
         """
         # Se forçado ou não houver atualização anterior, recarregar
-        if force or not self.last_update:
+        if force or not self.last_update or self._stale:
             return self.load_rules()
         
-        # Verificar se o banco de dados foi atualizado (se disponível)
+        # Verificar a versão das regras no banco de dados (uma leitura por chave primária)
         if self.db_session:
             try:
-                from models import Rule
+                from models import get_rules_version
                 
-                latest_rule = self.db_session.query(Rule).order_by(Rule.updated_at.desc()).first()
-                
-                if latest_rule and latest_rule.updated_at > self.last_update:
+                if get_rules_version(self.db_session) != self.rules_version:
                     logger.info("Detectada atualização nas regras do banco de dados")
                     return self.load_rules()
+                
+                return self.rules_dict
                     
             except Exception as e:
                 logger.error(f"Erro ao verificar atualizações de regras: {str(e)}")
         
-        # Verificar se o arquivo foi atualizado
+        # Sem banco de dados: verificar se o arquivo foi atualizado
         if os.path.exists(self.rules_file):
             file_mtime = datetime.fromtimestamp(os.path.getmtime(self.rules_file))
             
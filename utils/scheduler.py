@@ -3,101 +3,326 @@ Módulo de Agendamento
 
 Este módulo implementa funcionalidades para agendamento de tarefas,
 como verificação periódica de novos e-mails.
+
+O intervalo entre verificações é adaptativo: diminui quando os ciclos
+recentes encontraram e-mails, aumenta quando não encontraram (sempre entre
+um mínimo e um máximo) e recua exponencialmente em caso de erro. Uma
+variação aleatória (jitter) evita que várias contas verifiquem o servidor
+exatamente ao mesmo tempo.
 """
 
+import os
 import time
+import random
 import threading
 import logging
-import schedule
 from datetime import datetime
 
+from utils.metrics import metrics as default_metrics
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Métrica com o intervalo escolhido para a próxima verificação
+INTERVAL_METRIC = 'scheduler.interval_seconds'
+
+class AdaptiveInterval:
+    """
+    Calcula o intervalo até a próxima verificação a partir dos resultados anteriores.
+    """
+    
+    def __init__(self, min_seconds=30, max_seconds=900, initial_seconds=300,
+                 shrink_factor=0.5, grow_factor=1.5, jitter=0.1,
+                 backoff_seconds=30, max_backoff_seconds=1800, metrics=None):
+        """
+        Inicializa o cálculo do intervalo.
+        
+        Args:
+            min_seconds (float): Intervalo mínimo entre verificações
+            max_seconds (float): Intervalo máximo entre verificações
+            initial_seconds (float): Intervalo inicial
+            shrink_factor (float): Multiplicador do intervalo quando há e-mails
+            grow_factor (float): Multiplicador do intervalo quando não há e-mails
+            jitter (float): Variação aleatória máxima, como fração do intervalo
+            backoff_seconds (float): Espera após o primeiro erro consecutivo
+                (dobra a cada novo erro)
+            max_backoff_seconds (float): Espera máxima após erros
+            metrics: Registro de métricas (por padrão, o registro global)
+        """
+        if min_seconds <= 0 or max_seconds < min_seconds:
+            raise ValueError("Intervalos inválidos: é preciso 0 < mínimo <= máximo")
+        
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.shrink_factor = shrink_factor
+        self.grow_factor = grow_factor
+        self.jitter = jitter
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.metrics = metrics or default_metrics
+        
+        self.interval = self._clamp(initial_seconds)
+        self.consecutive_errors = 0
+    
+    def _clamp(self, seconds):
+        """Limita o intervalo ao mínimo e ao máximo."""
+        return max(self.min_seconds, min(self.max_seconds, seconds))
+    
+    def set_base(self, seconds):
+        """
+        Define o intervalo atual (ex.: alterado pelo usuário).
+        
+        Args:
+            seconds (float): Novo intervalo, limitado ao mínimo e ao máximo
+        """
+        self.interval = self._clamp(seconds)
+    
+    def record_result(self, found):
+        """
+        Ajusta o intervalo após um ciclo bem-sucedido.
+        
+        Args:
+            found (int): Quantidade de e-mails encontrados no ciclo
+        """
+        self.consecutive_errors = 0
+        factor = self.shrink_factor if found else self.grow_factor
+        self.interval = self._clamp(self.interval * factor)
+    
+    def record_error(self):
+        """Registra um ciclo com erro (a próxima espera usa recuo exponencial)."""
+        self.consecutive_errors += 1
+    
+    def next_delay(self):
+        """
+        Calcula a espera até a próxima verificação e a publica como métrica.
+        
+        Returns:
+            float: Espera em segundos
+        """
+        if self.consecutive_errors:
+            base = min(self.max_backoff_seconds,
+                       self.backoff_seconds * 2 ** (self.consecutive_errors - 1))
+        else:
+            base = self.interval
+        
+        delay = base * (1 + random.uniform(-self.jitter, self.jitter))
+        delay = max(1.0, delay)
+        self.metrics.set_gauge(INTERVAL_METRIC, round(delay, 1))
+        return delay
+
+def adaptive_interval_from_env(env=None, metrics=None):
+    """
+    Cria o cálculo do intervalo a partir das variáveis de ambiente.
+    
+    Variáveis (em segundos): CHECK_INTERVAL (intervalo inicial),
+    CHECK_INTERVAL_MIN, CHECK_INTERVAL_MAX e CHECK_MAX_BACKOFF; CHECK_JITTER
+    é a variação aleatória como fração do intervalo.
+    
+    Args:
+        env (dict): Variáveis de ambiente (padrão: os.environ)
+        metrics: Registro de métricas (por padrão, o registro global)
+    
+    Returns:
+        AdaptiveInterval: Cálculo do intervalo configurado
+    """
+    env = os.environ if env is None else env
+    return AdaptiveInterval(
+        min_seconds=float(env.get('CHECK_INTERVAL_MIN', 30)),
+        max_seconds=float(env.get('CHECK_INTERVAL_MAX', 900)),
+        initial_seconds=float(env.get('CHECK_INTERVAL', 300)),
+        jitter=float(env.get('CHECK_JITTER', 0.1)),
+        max_backoff_seconds=float(env.get('CHECK_MAX_BACKOFF', 1800)),
+        metrics=metrics
+    )
+
 class EmailScheduler:
     """
     Classe para agendar e executar verificações periódicas de e-mail.
+    
+    A thread do agendador dorme em uma condição até o horário da próxima
+    verificação ou até um pedido (execução imediata, mudança de intervalo ou
+    parada), sem acordar periodicamente. Ela é a única a executar o
+    callback, de modo que dois ciclos nunca se sobrepõem: pedidos de
+    execução imediata feitos durante um ciclo ficam na fila e são atendidos
+    logo após ele. Cada agendador tem seu próprio estado, então vários
+    podem coexistir no mesmo processo.
     """
     
-    def __init__(self, interval_minutes=5, start_immediately=True):
+    def __init__(self, interval_minutes=5, start_immediately=True, min_seconds=30,
+                 max_seconds=900, jitter=0.1, interval=None, callback=None, run_immediately=False):
         """
         Inicializa o agendador.
         
         Args:
-            interval_minutes (int): Intervalo entre verificações em minutos
+            interval_minutes (int): Intervalo inicial entre verificações em minutos
             start_immediately (bool): Se True, inicia o agendamento imediatamente
+            min_seconds (float): Intervalo mínimo entre verificações
+            max_seconds (float): Intervalo máximo entre verificações
+            jitter (float): Variação aleatória máxima, como fração do intervalo
+            interval (AdaptiveInterval): Cálculo do intervalo já configurado
+                (substitui os quatro parâmetros anteriores)
+            callback (callable): Função executada a cada verificação
+            run_immediately (bool): Se True, a primeira verificação é feita ao
+                iniciar, em vez de após o primeiro intervalo
         """
         self.interval_minutes = interval_minutes
-        self.running = False
-        self.scheduler_thread = None
-        self.callback = None
+        self.callback = callback
+        self.run_immediately = run_immediately
+        self.interval = interval or AdaptiveInterval(
+            min_seconds=min_seconds,
+            max_seconds=max(max_seconds, min_seconds),
+            initial_seconds=interval_minutes * 60,
+            jitter=jitter
+        )
+        
+        # Estado protegido pela condição
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._next_run = None
+        self._run_requested = False
+        self._busy = False
+        self._cycles_started = 0
+        self._cycles_finished = 0
+        self._last_finished = None
+        self._last_ok = None
         
         if start_immediately:
             self.start()
     
-    def _run_continuously(self):
-        """Executa o agendador em um loop contínuo."""
-        self.running = True
+    def _wait_until_due(self):
+        """
+        Dorme até a próxima verificação, um pedido de execução ou a parada.
         
-        while self.running:
-            schedule.run_pending()
-            time.sleep(1)
+        Deve ser chamado com a condição adquirida.
+        
+        Returns:
+            bool: True se uma verificação deve ser executada, False se o agendador parou
+        """
+        while not self._stopping and not self._run_requested:
+            timeout = self._next_run - time.monotonic()
+            if timeout <= 0:
+                break
+            self._cond.wait(timeout)
+        return not self._stopping
     
-    def _job(self):
-        """Função executada a cada intervalo agendado."""
-        if self.callback:
+    def _run_continuously(self):
+        """Executa as verificações até o agendador ser parado."""
+        while True:
+            with self._cond:
+                if not self._wait_until_due():
+                    return
+                self._run_requested = False
+                self._busy = True
+                self._cycles_started += 1
+            
+            ok = False
             try:
-                logger.info(f"Executando verificação agendada em {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                self.callback()
-            except Exception as e:
-                logger.error(f"Erro ao executar tarefa agendada: {str(e)}")
-        else:
-            logger.warning("Tarefa agendada executada, mas nenhum callback foi definido")
+                ok = self._job()
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._last_ok = ok
+                    self._cycles_finished += 1
+                    self._last_finished = time.monotonic()
+                    self._schedule_next()
+                    self._cond.notify_all()
     
-    def start(self):
-        """Inicia o agendador em uma thread separada."""
-        if self.running:
-            logger.warning("Agendador já está em execução")
+    def _job(self):
+        """
+        Executa o callback e registra o resultado no intervalo adaptativo.
+        
+        O callback deve retornar a quantidade de e-mails encontrados, ou
+        None em caso de falha; o resultado define o próximo intervalo.
+        
+        Returns:
+            bool: True se a verificação foi bem-sucedida
+        """
+        if not self.callback:
+            logger.warning("Tarefa agendada executada, mas nenhum callback foi definido")
             return False
         
         try:
-            # Limpar agendamentos anteriores
-            schedule.clear()
-            
-            # Agendar a execução periódica
-            schedule.every(self.interval_minutes).minutes.do(self._job)
-            
-            # Iniciar thread do agendador
-            self.scheduler_thread = threading.Thread(target=self._run_continuously)
-            self.scheduler_thread.daemon = True
-            self.scheduler_thread.start()
-            
-            logger.info(f"Agendador iniciado com intervalo de {self.interval_minutes} minutos")
-            return True
-            
+            logger.info(f"Executando verificação agendada em {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            found = self.callback()
         except Exception as e:
-            logger.error(f"Erro ao iniciar agendador: {str(e)}")
-            self.running = False
+            logger.error(f"Erro ao executar tarefa agendada: {str(e)}")
+            found = None
+        
+        if found is None:
+            self.interval.record_error()
             return False
+        
+        self.interval.record_result(found)
+        return True
     
-    def stop(self):
-        """Para o agendador."""
-        if not self.running:
-            logger.warning("Agendador não está em execução")
-            return
+    def _schedule_next(self):
+        """
+        Define o horário da próxima verificação com o intervalo adaptativo.
         
-        try:
-            self.running = False
-            schedule.clear()
+        Deve ser chamado com a condição adquirida.
+        """
+        delay = self.interval.next_delay()
+        self._next_run = (self._last_finished or time.monotonic()) + delay
+        logger.info(f"Próxima verificação em {delay:.0f} segundos")
+    
+    def start(self):
+        """
+        Inicia o agendador em uma thread separada.
+        
+        Returns:
+            bool: True se o agendador foi iniciado
+        """
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                if not self._stopping:
+                    logger.warning("Agendador já está em execução")
+                    return False
+                
+                # Parada pedida, mas o ciclo em andamento ainda não terminou: a thread continua
+                self._stopping = False
+                logger.info("Agendador retomado")
+                return True
             
-            # Aguardar a thread do agendador terminar (com timeout)
-            if self.scheduler_thread and self.scheduler_thread.is_alive():
-                self.scheduler_thread.join(timeout=5)
+            self._stopping = False
+            if self.run_immediately:
+                self._next_run = time.monotonic()
+            else:
+                self._schedule_next()
             
+            try:
+                self._thread = threading.Thread(target=self._run_continuously, name='email-scheduler',
+                                                daemon=True)
+                self._thread.start()
+            except Exception as e:
+                logger.error(f"Erro ao iniciar agendador: {str(e)}")
+                self._thread = None
+                return False
+        
+        logger.info(f"Agendador iniciado com intervalo de {self.interval.interval / 60:.1f} minutos")
+        return True
+    
+    def stop(self, timeout=5):
+        """
+        Para o agendador após o ciclo em andamento.
+        
+        Args:
+            timeout (float): Tempo máximo de espera pelo ciclo em andamento,
+                em segundos (None para esperar até o fim)
+        """
+        with self._cond:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                logger.warning("Agendador não está em execução")
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("Agendador parará ao fim do ciclo em andamento")
+        else:
             logger.info("Agendador parado")
-            
-        except Exception as e:
-            logger.error(f"Erro ao parar agendador: {str(e)}")
     
     def set_callback(self, callback_function):
         """
@@ -111,7 +336,10 @@ class EmailScheduler:
     
     def set_interval(self, minutes):
         """
-        Altera o intervalo entre verificações.
+        Altera o intervalo entre verificações sem reiniciar o agendador.
+        
+        A próxima verificação é reagendada a partir do fim do último ciclo
+        com o novo intervalo.
         
         Args:
             minutes (int): Novo intervalo em minutos
@@ -121,37 +349,80 @@ class EmailScheduler:
             minutes = 1
         
         self.interval_minutes = minutes
+        with self._cond:
+            self.interval.set_base(minutes * 60)
+            # Durante um ciclo, o próximo horário é definido ao fim dele
+            if not self._busy and self._thread is not None:
+                self._schedule_next()
+                self._cond.notify_all()
         
-        # Reiniciar o agendador com o novo intervalo
-        if self.running:
-            was_running = True
-            self.stop()
-        else:
-            was_running = False
-        
-        if was_running:
-            self.start()
-            
         logger.info(f"Intervalo alterado para {self.interval_minutes} minutos")
     
-    def run_now(self):
+    def run_now(self, wait=False, timeout=None):
         """
-        Executa a tarefa agendada imediatamente, fora do agendamento.
+        Pede uma verificação imediata.
+        
+        Com o agendador em execução, o pedido é atendido pela thread do
+        agendador assim que ela estiver livre (pedidos feitos antes do início
+        da verificação são atendidos juntos). Sem ele, a verificação é
+        executada na thread de quem chama, após qualquer outra em andamento.
+        
+        Args:
+            wait (bool): Esperar o fim da verificação
+            timeout (float): Tempo máximo de espera, em segundos
         
         Returns:
-            bool: True se a execução foi bem-sucedida, False caso contrário
+            bool: True se a verificação foi enfileirada ou, com wait=True,
+                concluída com sucesso; False caso contrário
         """
         if not self.callback:
             logger.warning("Tentativa de execução imediata, mas nenhum callback foi definido")
             return False
         
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive() or self._stopping:
+                return self._run_inline()
+            
+            target = self._cycles_started + 1
+            self._run_requested = True
+            self._cond.notify_all()
+            logger.info("Verificação imediata enfileirada")
+            
+            if not wait:
+                return True
+            done = self._cond.wait_for(lambda: self._cycles_finished >= target, timeout)
+            return bool(done and self._last_ok)
+    
+    def _run_inline(self):
+        """
+        Executa uma verificação na thread atual, sem sobrepor outra.
+        
+        Deve ser chamado com a condição adquirida.
+        
+        Returns:
+            bool: True se a verificação foi bem-sucedida
+        """
+        self._cond.wait_for(lambda: not self._busy)
+        self._busy = True
+        self._cycles_started += 1
+        self._cond.release()
+        ok = False
         try:
             logger.info("Executando verificação imediata")
-            self._job()
-            return True
-        except Exception as e:
-            logger.error(f"Erro ao executar verificação imediata: {str(e)}")
-            return False
+            ok = self._job()
+        finally:
+            self._cond.acquire()
+            self._busy = False
+            self._last_ok = ok
+            self._cycles_finished += 1
+            self._last_finished = time.monotonic()
+            self._cond.notify_all()
+        return ok
+    
+    @property
+    def running(self):
+        """True se a thread do agendador está em execução e não foi parada."""
+        return self._thread is not None and self._thread.is_alive() and not self._stopping
     
     def is_running(self):
         """
@@ -160,4 +431,4 @@ class EmailScheduler:
         Returns:
             bool: True se o agendador estiver em execução, False caso contrário
         """
-        return self.running and (self.scheduler_thread and self.scheduler_thread.is_alive()) 
\ No newline at end of file
+        return self.running
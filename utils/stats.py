@@ -0,0 +1,302 @@
+"""
+Módulo de Estatísticas do Processamento
+
+Este módulo calcula as estatísticas exibidas no painel (e-mails por minuto,
+taxa de correspondência por regra, taxa de sucesso do envio e duração dos
+ciclos) a partir dos contadores em memória mantidos pelo processamento, sem
+consultar o banco de dados.
+
+Os processos que executam o processamento publicam periodicamente essas
+estatísticas em um arquivo JSON (gravação atômica). Cada processo soma aos
+totais do arquivo apenas os seus incrementos, sob uma trava, de modo que a
+interface web e o worker podem publicar no mesmo arquivo sem contar em
+dobro. Os demais processos (ex.: outros workers do Gunicorn) leem esse
+arquivo, e as respostas são mantidas em cache por alguns segundos.
+"""
+
+import json
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from utils.atomic_file import atomic_write, file_lock
+from utils.metrics import Metrics, metrics as default_metrics
+from utils.rate_limiter import METRIC_PREFIX as RATE_LIMIT_PREFIX
+from utils.outbox import METRIC_PREFIX as OUTBOX_PREFIX, OUTBOX_DEFERRED, OUTBOX_RETRIED
+from utils.prefilter import METRIC_PREFIX as PREFILTER_PREFIX
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Arquivo padrão das estatísticas publicadas
+DEFAULT_STATS_FILE = 'data/stats.json'
+
+# Nomes das métricas mantidas pelo processamento
+EMAILS_PROCESSED = 'emails.processed'
+EMAILS_SENT = 'emails.sent'
+EMAILS_FAILED = 'emails.send_failed'
+EMAILS_RULE_PREFIX = 'emails.rule.'
+EMAILS_DUPLICATES = 'emails.duplicates_skipped'
+EMAILS_SUPPRESSED = 'emails.suppressed'
+EMAILS_HEADER_SKIPPED = 'emails.header_skipped'
+EMAILS_HEADER_DECIDED = 'emails.header_decided'
+FETCH_BYTES_SAVED = 'fetch.bytes_saved'
+CYCLE_DURATION = 'cycle.duration_seconds'
+
+# Nome usado para os e-mails respondidos com a resposta genérica
+GENERIC_RULE = '__generic__'
+
+# Cache das estatísticas servidas (momento do cálculo, valor)
+_cache_lock = threading.Lock()
+_cache = [0.0, None]
+
+
+def record_email(matched_rule, success, metrics=None):
+    """
+    Contabiliza um e-mail respondido.
+
+    Args:
+        matched_rule (str): Regra aplicada (None para a resposta genérica)
+        success (bool): Se a resposta foi enviada
+        metrics: Registro de métricas (por padrão, o registro global)
+    """
+    metrics = metrics or default_metrics
+    metrics.incr(EMAILS_PROCESSED)
+    metrics.incr(EMAILS_RULE_PREFIX + (matched_rule or GENERIC_RULE))
+    metrics.incr(EMAILS_SENT if success else EMAILS_FAILED)
+
+
+def _ratio(part, total):
+    """Proporção arredondada, ou None se o total for zero."""
+    return round(part / total, 4) if total else None
+
+
+def compute_stats(metrics=None):
+    """
+    Calcula as estatísticas a partir dos contadores em memória.
+
+    Args:
+        metrics: Registro de métricas (por padrão, o registro global)
+
+    Returns:
+        dict: Estatísticas do processamento
+    """
+    metrics = metrics or default_metrics
+    counters = metrics.snapshot(prefix='emails.')['counters']
+
+    processed = counters.get(EMAILS_PROCESSED, 0)
+    sent = counters.get(EMAILS_SENT, 0)
+    failed = counters.get(EMAILS_FAILED, 0)
+
+    by_rule = {
+        name[len(EMAILS_RULE_PREFIX):]: count
+        for name, count in counters.items() if name.startswith(EMAILS_RULE_PREFIX)
+    }
+    matched = processed - by_rule.get(GENERIC_RULE, 0)
+
+    # Fichas restantes e limites de envio por conta ("rate_limit.<conta>.<campo>")
+    rate_limits = {}
+    for name, value in metrics.snapshot(prefix=RATE_LIMIT_PREFIX)['gauges'].items():
+        account, field = name[len(RATE_LIMIT_PREFIX):].rsplit('.', 1)
+        rate_limits.setdefault(account, {})[field] = value
+
+    # Ocorrências de cada regra do pré-filtro
+    prefilter = {
+        name[len(PREFILTER_PREFIX):]: count
+        for name, count in metrics.snapshot(prefix=PREFILTER_PREFIX)['counters'].items()
+    }
+
+    # Caixa de saída: respostas por estado (medidores) e eventos do remetente
+    outbox_metrics = metrics.snapshot(prefix=OUTBOX_PREFIX)
+    outbox = {name[len(OUTBOX_PREFIX):]: value for name, value in outbox_metrics['gauges'].items()}
+
+    return {
+        'generated_at': datetime.utcnow().isoformat(),
+        'emails_per_minute': {
+            '1m': metrics.rate(EMAILS_PROCESSED, 1),
+            '5m': metrics.rate(EMAILS_PROCESSED, 5),
+            '15m': metrics.rate(EMAILS_PROCESSED, 15),
+        },
+        'totals': {'processed': processed, 'sent': sent, 'failed': failed,
+                   'duplicates_skipped': counters.get(EMAILS_DUPLICATES, 0),
+                   'suppressed': counters.get(EMAILS_SUPPRESSED, 0),
+                   'header_skipped': counters.get(EMAILS_HEADER_SKIPPED, 0),
+                   'header_decided': counters.get(EMAILS_HEADER_DECIDED, 0),
+                   'bytes_saved': int(metrics.get(FETCH_BYTES_SAVED, 0)),
+                   'deferred': outbox_metrics['counters'].get(OUTBOX_DEFERRED, 0),
+                   'retried': outbox_metrics['counters'].get(OUTBOX_RETRIED, 0)},
+        'send_success_rate': _ratio(sent, sent + failed),
+        'match_rate': {
+            'overall': _ratio(matched, processed),
+            'by_rule': {
+                rule: {'count': count, 'rate': _ratio(count, processed)}
+                for rule, count in sorted(by_rule.items(), key=lambda item: -item[1])
+            },
+        },
+        'cycles': metrics.summary(CYCLE_DURATION),
+        'rate_limits': rate_limits,
+        'outbox': outbox,
+        'prefilter': dict(sorted(prefilter.items(), key=lambda item: -item[1])),
+    }
+
+
+def empty_stats():
+    """
+    Estatísticas zeradas, para antes da primeira publicação.
+
+    Returns:
+        dict: Estatísticas com o mesmo formato de ``compute_stats``
+    """
+    return compute_stats(Metrics())
+
+
+def load_stats(path=DEFAULT_STATS_FILE):
+    """
+    Lê as estatísticas publicadas pelo processo de processamento.
+
+    Args:
+        path (str): Arquivo das estatísticas
+
+    Returns:
+        dict: Estatísticas publicadas, ou None se indisponíveis
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('stats')
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Não foi possível ler as estatísticas de {path}: {str(e)}")
+        return None
+
+
+def get_stats(path=DEFAULT_STATS_FILE, cache_seconds=5.0, metrics=None):
+    """
+    Obtém as estatísticas para o painel, com cache.
+
+    Se o processamento roda neste processo, as estatísticas são calculadas
+    dos contadores em memória; caso contrário, vêm do arquivo publicado.
+
+    Args:
+        path (str): Arquivo das estatísticas publicadas
+        cache_seconds (float): Tempo de validade do cache
+        metrics: Registro de métricas (por padrão, o registro global)
+
+    Returns:
+        dict: Estatísticas, ou None se ainda não houver nenhuma
+    """
+    metrics = metrics or default_metrics
+    now = time.monotonic()
+
+    with _cache_lock:
+        if _cache[1] is not None and now - _cache[0] < cache_seconds:
+            return _cache[1]
+
+    if metrics.summary(CYCLE_DURATION) is not None:
+        stats = compute_stats(metrics)
+    else:
+        stats = load_stats(path)
+
+    with _cache_lock:
+        _cache[0], _cache[1] = now, stats
+    return stats
+
+
+class StatsPublisher:
+    """
+    Publica periodicamente as estatísticas e os contadores em um arquivo.
+    """
+
+    def __init__(self, path=DEFAULT_STATS_FILE, interval=30.0, metrics=None):
+        """
+        Inicializa o publicador, restaurando os totais salvos, e inicia a thread.
+
+        Args:
+            path (str): Arquivo das estatísticas
+            interval (float): Intervalo entre publicações, em segundos
+            metrics: Registro de métricas (por padrão, o registro global)
+        """
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics or default_metrics
+        self._stop = threading.Event()
+        # Contadores do arquivo após a última leitura/publicação deste processo
+        self._published = {}
+
+        self._restore()
+
+        self._thread = threading.Thread(target=self._run, name='stats-publisher', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _read_counters(self):
+        """Lê os totais de e-mails publicados (vazio se o arquivo não existir)."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                counters = json.load(f).get('counters', {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Não foi possível ler os totais de {self.path}: {str(e)}")
+            return {}
+        return {name: value for name, value in counters.items() if name.startswith('emails.')}
+
+    def _restore(self):
+        """Restaura os totais de e-mails da publicação anterior."""
+        with file_lock(self.path):
+            counters = self._read_counters()
+        self.metrics.restore(counters)
+        self._published = counters
+        if counters:
+            logger.info(f"Totais de estatísticas restaurados de {self.path}")
+
+    def publish(self):
+        """
+        Grava as estatísticas atuais no arquivo.
+
+        Vários processos (ex.: a interface web e o worker) podem publicar no
+        mesmo arquivo: sob uma trava, cada um soma aos totais do arquivo
+        apenas o que contou desde a sua última publicação, e traz para a
+        memória o que os outros contaram.
+
+        Returns:
+            bool: True se a gravação foi bem-sucedida
+        """
+        try:
+            with file_lock(self.path):
+                current = self.metrics.snapshot(prefix='emails.')['counters']
+                merged = self._read_counters()
+                for name, value in current.items():
+                    merged[name] = merged.get(name, 0) + value - self._published.get(name, 0)
+
+                self.metrics.restore({
+                    name: value - current.get(name, 0)
+                    for name, value in merged.items() if value != current.get(name, 0)
+                })
+                self._published = merged
+
+                payload = {
+                    'saved_at': datetime.utcnow().isoformat(),
+                    'stats': compute_stats(self.metrics),
+                    'counters': merged,
+                }
+                atomic_write(self.path, json.dumps(payload, ensure_ascii=False))
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao publicar estatísticas: {str(e)}")
+            return False
+
+    def _run(self):
+        """Laço da thread de publicação."""
+        while not self._stop.wait(self.interval):
+            self.publish()
+
+    def close(self):
+        """Para a thread e faz uma última publicação."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(self.interval)
+        self.publish()
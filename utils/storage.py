@@ -0,0 +1,194 @@
+"""
+Módulo de Perfis de Armazenamento
+
+Este módulo aplica ao engine do SQLAlchemy as configurações adequadas a
+cada banco de dados, para que a thread de processamento, as verificações
+manuais e as requisições da interface possam gravar ao mesmo tempo:
+
+- SQLite: modo WAL (leitores não bloqueiam o gravador), busy_timeout (espera
+  pelo bloqueio em vez de falhar com "database is locked") e nível de
+  sincronização NORMAL (seguro em WAL, com um fsync por checkpoint em vez de
+  um por transação).
+- PostgreSQL: dimensionamento do pool de conexões.
+
+Os valores padrão podem ser alterados por variáveis de ambiente.
+"""
+
+import os
+import logging
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Banco usado quando DATABASE_URL não está definida
+DEFAULT_DATABASE_URL = 'sqlite:///instance/email_autoresponder.db'
+
+# Pasta "instance" da aplicação, base dos caminhos relativos do SQLite
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance')
+
+# Perfil padrão do SQLite (variáveis de ambiente: SQLITE_*)
+SQLITE_PROFILE = {
+    'journal_mode': 'WAL',
+    'busy_timeout_ms': 5000,
+    'synchronous': 'NORMAL',
+}
+
+# Perfil padrão do PostgreSQL (variáveis de ambiente: DB_*)
+POSTGRES_PROFILE = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+}
+
+# Valores aceitos pelo SQLite
+_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+_SYNCHRONOUS_LEVELS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def _env_int(env, name, default):
+    """Lê um inteiro de uma variável de ambiente, com valor padrão."""
+    value = env.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def sqlite_settings(env=None):
+    """
+    Configurações do SQLite, com as alterações das variáveis de ambiente.
+
+    Args:
+        env (dict): Variáveis de ambiente (padrão: os.environ)
+
+    Returns:
+        dict: journal_mode, busy_timeout_ms e synchronous
+    """
+    env = os.environ if env is None else env
+    settings = {
+        'journal_mode': env.get('SQLITE_JOURNAL_MODE', SQLITE_PROFILE['journal_mode']).upper(),
+        'busy_timeout_ms': _env_int(env, 'SQLITE_BUSY_TIMEOUT_MS', SQLITE_PROFILE['busy_timeout_ms']),
+        'synchronous': env.get('SQLITE_SYNCHRONOUS', SQLITE_PROFILE['synchronous']).upper(),
+    }
+
+    if settings['journal_mode'] not in _JOURNAL_MODES:
+        raise ValueError(f"SQLITE_JOURNAL_MODE inválido: {settings['journal_mode']}")
+    if settings['synchronous'] not in _SYNCHRONOUS_LEVELS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS inválido: {settings['synchronous']}")
+    return settings
+
+
+def resolve_database_url(url, instance_path=INSTANCE_PATH):
+    """
+    Resolve caminhos relativos do SQLite como o Flask-SQLAlchemy.
+
+    O Flask-SQLAlchemy interpreta ``sqlite:///arquivo.db`` em relação à pasta
+    "instance" da aplicação; processos sem Flask (ex.: o worker) precisam da
+    mesma regra para abrir o mesmo arquivo.
+
+    Args:
+        url (str): URL do banco de dados
+        instance_path (str): Pasta base dos caminhos relativos
+
+    Returns:
+        str: URL com o caminho absoluto do arquivo (outras URLs sem alteração)
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() != 'sqlite' or parsed.database in (None, '', ':memory:'):
+        return url
+
+    is_uri = parsed.query.get('uri', False)
+    path = parsed.database[5:] if is_uri else parsed.database
+    if os.path.isabs(path):
+        return url
+
+    os.makedirs(instance_path, exist_ok=True)
+    path = os.path.join(instance_path, path)
+    return parsed.set(database=f"file:{path}" if is_uri else path).render_as_string(hide_password=False)
+
+
+def engine_options(url, env=None):
+    """
+    Opções de ``create_engine`` (ou SQLALCHEMY_ENGINE_OPTIONS) para o banco da URL.
+
+    Args:
+        url (str): URL do banco de dados
+        env (dict): Variáveis de ambiente (padrão: os.environ)
+
+    Returns:
+        dict: Opções do engine
+    """
+    env = os.environ if env is None else env
+    backend = make_url(url).get_backend_name()
+
+    if backend == 'sqlite':
+        busy_timeout = sqlite_settings(env)['busy_timeout_ms']
+        return {
+            # Espera do driver pelo bloqueio, em segundos (o PRAGMA cobre o restante)
+            'connect_args': {'timeout': busy_timeout / 1000.0, 'check_same_thread': False},
+        }
+
+    if backend == 'postgresql':
+        return {
+            'pool_size': _env_int(env, 'DB_POOL_SIZE', POSTGRES_PROFILE['pool_size']),
+            'max_overflow': _env_int(env, 'DB_MAX_OVERFLOW', POSTGRES_PROFILE['max_overflow']),
+            'pool_timeout': _env_int(env, 'DB_POOL_TIMEOUT', POSTGRES_PROFILE['pool_timeout']),
+            'pool_recycle': _env_int(env, 'DB_POOL_RECYCLE', POSTGRES_PROFILE['pool_recycle']),
+            'pool_pre_ping': True,
+        }
+
+    return {'pool_pre_ping': True, 'pool_recycle': 300}
+
+
+def configure_engine(engine, env=None):
+    """
+    Registra as configurações por conexão do banco (PRAGMAs do SQLite).
+
+    Deve ser chamado antes da primeira conexão do engine.
+
+    Args:
+        engine: Engine do SQLAlchemy
+        env (dict): Variáveis de ambiente (padrão: os.environ)
+
+    Returns:
+        engine: O mesmo engine
+    """
+    if engine.dialect.name != 'sqlite':
+        # Demais bancos: apenas as opções de pool de engine_options()
+        return engine
+
+    settings = sqlite_settings(env)
+    in_memory = engine.url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, 'connect')
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout_ms'])}")
+            if not in_memory:
+                cursor.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+            cursor.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+        finally:
+            cursor.close()
+
+    logger.info(
+        f"Perfil de armazenamento SQLite: journal_mode={settings['journal_mode']}, "
+        f"busy_timeout={settings['busy_timeout_ms']}ms, synchronous={settings['synchronous']}"
+    )
+    return engine
+
+
+def create_storage_engine(url, env=None, **options):
+    """
+    Cria um engine já configurado com o perfil do banco.
+
+    Args:
+        url (str): URL do banco de dados
+        env (dict): Variáveis de ambiente (padrão: os.environ)
+        **options: Opções adicionais de ``create_engine``
+
+    Returns:
+        Engine do SQLAlchemy
+    """
+    engine = create_engine(url, **{**engine_options(url, env), **options})
+    return configure_engine(engine, env)
@@ -0,0 +1,222 @@
+"""
+Módulo de Limite de Respostas por Remetente
+
+Este módulo evita que um mesmo remetente receba várias cópias da mesma
+resposta automática: se um cliente envia dez e-mails em uma hora, apenas o
+primeiro é respondido dentro da janela de supressão. Os demais são
+registrados no EmailLog como suprimidos, sem envio.
+
+O limite pode valer por remetente (``sender``) ou por remetente e regra
+(``sender_rule``), de modo que e-mails sobre assuntos diferentes ainda sejam
+respondidos. A última resposta de cada chave fica na tabela
+``sender_throttle``, que mantém a janela entre reinícios e entre processos;
+um cache em memória com expiração (TTL) responde às consultas repetidas sem
+acessar o banco.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+
+from utils.metrics import metrics as default_metrics
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Escopos do limite
+SCOPE_SENDER = 'sender'
+SCOPE_SENDER_RULE = 'sender_rule'
+
+# Prefixo das métricas do limite
+METRIC_PREFIX = 'throttle.'
+
+
+class ReplyThrottle:
+    """
+    Janela de supressão de respostas por remetente (ou remetente e regra).
+    """
+
+    def __init__(self, engine, window_seconds=3600.0, scope=SCOPE_SENDER, cache_size=10000,
+                 prune_interval=3600.0, metrics=None):
+        """
+        Inicializa o limite.
+
+        Args:
+            engine: Engine do SQLAlchemy
+            window_seconds (float): Janela, em segundos, durante a qual um
+                remetente não recebe outra resposta
+            scope (str): ``sender`` ou ``sender_rule``
+            cache_size (int): Quantidade de chaves mantidas em memória
+            prune_interval (float): Intervalo mínimo, em segundos, entre
+                remoções dos registros expirados
+            metrics: Registro de métricas (por padrão, o registro global)
+        """
+        if scope not in (SCOPE_SENDER, SCOPE_SENDER_RULE):
+            logger.warning(f"Escopo de limite desconhecido {scope!r}; usando {SCOPE_SENDER!r}")
+            scope = SCOPE_SENDER
+
+        self.engine = engine
+        self.window = timedelta(seconds=window_seconds)
+        self.scope = scope
+        self.cache_size = max(1, cache_size)
+        self.prune_interval = timedelta(seconds=prune_interval)
+        self.metrics = metrics or default_metrics
+
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._last_prune = None
+
+    def key(self, sender, matched_rule=None):
+        """
+        Chave do limite de um remetente.
+
+        Args:
+            sender (str): Remetente do e-mail
+            matched_rule (str): Regra aplicada (None para a resposta genérica)
+
+        Returns:
+            str: Chave na tabela sender_throttle
+        """
+        sender = (sender or '').strip().lower()
+        if self.scope == SCOPE_SENDER_RULE:
+            return f"{sender}|{matched_rule or ''}"
+        return sender
+
+    def _remember(self, key, replied_at):
+        """Guarda a última resposta da chave no cache."""
+        self._recent[key] = replied_at
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.cache_size:
+            self._recent.popitem(last=False)
+
+    def _cached(self, key, cutoff):
+        """True se o cache já sabe que a chave está dentro da janela."""
+        with self._lock:
+            replied_at = self._recent.get(key)
+            if replied_at is None:
+                return False
+            if replied_at < cutoff:
+                # Expirado: o banco decide (outro processo pode ter respondido)
+                del self._recent[key]
+                return False
+            self._recent.move_to_end(key)
+            return True
+
+    def allow(self, sender, matched_rule=None):
+        """
+        Verifica se o remetente pode receber uma resposta e, em caso
+        positivo, reserva a janela para ele.
+
+        A reserva é uma atualização condicional no banco, de modo que dois
+        processos nunca respondem ao mesmo remetente na mesma janela.
+
+        Args:
+            sender (str): Remetente do e-mail
+            matched_rule (str): Regra aplicada (None para a resposta genérica)
+
+        Returns:
+            bool: True se a resposta deve ser enviada; False se deve ser suprimida
+        """
+        from models import SenderThrottle
+
+        key = self.key(sender, matched_rule)
+        now = datetime.utcnow()
+        cutoff = now - self.window
+
+        if self._cached(key, cutoff):
+            self.metrics.incr(METRIC_PREFIX + 'cache_hit')
+            return False
+
+        table = SenderThrottle.__table__
+        values = {'sender': (sender or '').strip().lower(), 'matched_rule': matched_rule, 'last_reply_at': now}
+        self.metrics.incr(METRIC_PREFIX + 'db_check')
+        try:
+            with self.engine.begin() as connection:
+                reserved = connection.execute(
+                    update(table).where(table.c.key == key, table.c.last_reply_at < cutoff).values(**values)
+                ).rowcount
+            if not reserved:
+                with self.engine.begin() as connection:
+                    connection.execute(insert(table).values(key=key, **values))
+        except IntegrityError:
+            # Já respondido dentro da janela (por este ou por outro processo)
+            with self.engine.connect() as connection:
+                replied_at = connection.execute(
+                    select(table.c.last_reply_at).where(table.c.key == key)
+                ).scalar()
+            with self._lock:
+                self._remember(key, replied_at or now)
+            return False
+        except Exception as e:
+            # Na dúvida, responder: o limite não deve impedir o atendimento
+            logger.error(f"Erro ao consultar o limite de respostas de {key}: {str(e)}")
+            return True
+
+        with self._lock:
+            self._remember(key, now)
+        return True
+
+    def release(self, sender, matched_rule=None):
+        """
+        Desfaz a reserva feita por ``allow`` (ex.: a resposta não pôde ser
+        enfileirada), para que o próximo e-mail do remetente seja respondido.
+
+        Args:
+            sender (str): Remetente do e-mail
+            matched_rule (str): Regra aplicada (None para a resposta genérica)
+        """
+        from models import SenderThrottle
+
+        key = self.key(sender, matched_rule)
+        with self._lock:
+            replied_at = self._recent.pop(key, None)
+        if replied_at is None:
+            return
+
+        table = SenderThrottle.__table__
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(
+                    delete(table).where(table.c.key == key, table.c.last_reply_at == replied_at)
+                )
+        except Exception as e:
+            logger.error(f"Erro ao liberar o limite de respostas de {key}: {str(e)}")
+
+    def prune(self, force=False):
+        """
+        Remove os registros fora da janela.
+
+        Executa no máximo uma vez por ``prune_interval``, exceto com ``force``.
+
+        Args:
+            force (bool): Remover mesmo antes do intervalo mínimo
+
+        Returns:
+            int: Quantidade de registros removidos
+        """
+        from models import SenderThrottle
+
+        now = datetime.utcnow()
+        if not force and self._last_prune is not None and now - self._last_prune < self.prune_interval:
+            return 0
+        self._last_prune = now
+
+        table = SenderThrottle.__table__
+        cutoff = now - self.window
+        try:
+            with self.engine.begin() as connection:
+                removed = connection.execute(delete(table).where(table.c.last_reply_at < cutoff)).rowcount
+        except Exception as e:
+            logger.error(f"Erro ao remover limites de respostas expirados: {str(e)}")
+            return 0
+
+        with self._lock:
+            for key in [key for key, replied_at in self._recent.items() if replied_at < cutoff]:
+                del self._recent[key]
+
+        if removed:
+            logger.info(f"{removed} limites de respostas expirados removidos")
+        return removed
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Automated Email Response System - Standalone Worker
+
+Runs the email processing without the Flask web application: only the
+email, rules and storage layers are imported, so the worker starts quickly
+enough to be run from cron every minute, or as a long-running systemd
+service.
+
+The worker takes part in the same monitor lease as the web workers, so at
+most one process polls the inbox at a time. As a service it enables
+monitoring cluster-wide on start; stopping monitoring from the dashboard
+pauses it until monitoring is started again. SIGTERM or SIGINT stop it
+gracefully after the current cycle.
+
+Usage:
+    python -m worker            # poll continuously (adaptive interval)
+    python -m worker --once     # run a single cycle, e.g. from cron
+    python -m worker --requeue-dead   # retry the replies that exhausted their attempts
+"""
+
+import os
+import signal
+import logging
+import argparse
+import threading
+from dotenv import load_dotenv
+
+import main
+from models import Base
+from utils.lease import Lease, LeaseSupervisor
+from utils.migrations import run_migrations
+from utils.outbox import requeue_dead
+from utils.storage import create_storage_engine, resolve_database_url, DEFAULT_DATABASE_URL
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def create_engine_from_env():
+    """Create the database engine and bring the schema up to date.
+
+    Returns:
+        SQLAlchemy engine configured with the storage profile
+    """
+    url = resolve_database_url(os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL))
+    engine = create_storage_engine(url)
+
+    # Same schema steps as the web app (no-ops once applied)
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    return engine
+
+def run_once(lease):
+    """Run a single processing cycle if no other process holds the monitor lease.
+
+    The lease is renewed by a heartbeat while the cycle runs, which may take
+    longer than its TTL; if a renewal fails the cycle stops early, since
+    another process may have taken over the inbox.
+
+    Args:
+        lease (Lease): Monitor lease
+
+    Returns:
+        int: Process exit code
+    """
+    if not lease.acquire():
+        logger.info("Another process is monitoring the inbox; skipping this cycle")
+        return 0
+
+    found = main.run_leased_cycle(lease)
+
+    return 0 if found is not None else 1
+
+def run_forever(lease, shutdown_timeout):
+    """Poll continuously while holding the monitor lease, until a stop signal.
+
+    Args:
+        lease (Lease): Monitor lease
+        shutdown_timeout (float): Seconds to wait for the current cycle on shutdown
+
+    Returns:
+        int: Process exit code
+    """
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}; stopping after the current cycle")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    lease.set_enabled(True)
+    supervisor = LeaseSupervisor(lease, main.poll_emails, on_run_request=main.check_now)
+    supervisor.start()
+    logger.info(f"Worker {lease.holder} started")
+
+    stop.wait()
+
+    supervisor.shutdown(timeout=shutdown_timeout)
+    logger.info("Worker stopped")
+    return 0
+
+def parse_args(argv=None):
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description="Standalone email auto-responder worker")
+    parser.add_argument('--once', action='store_true', help="Run a single cycle and exit")
+    parser.add_argument('--requeue-dead', action='store_true',
+                        help="Put the dead-lettered outbox replies back in the queue and exit")
+    parser.add_argument('--shutdown-timeout', type=float, default=60.0,
+                        help="Seconds to wait for the current cycle when stopping")
+    return parser.parse_args(argv)
+
+def run(argv=None):
+    """Command line entry point."""
+    args = parse_args(argv)
+
+    main.use_engine(create_engine_from_env())
+    
+    if args.requeue_dead:
+        logger.info(f"Requeued {requeue_dead(main.get_engine())} dead-lettered replies")
+        return 0
+    
+    lease = Lease(main.get_engine(), ttl=float(os.getenv("MONITOR_LEASE_TTL", 60)))
+
+    if args.once:
+        return run_once(lease)
+    return run_forever(lease, args.shutdown_timeout)
+
+if __name__ == "__main__":
+    raise SystemExit(run())